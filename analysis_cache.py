@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from io import BytesIO
+from typing import Dict, Iterable, Optional
+
+from PIL import Image
+
+from database import Database
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+CACHE_LOOKUPS = REGISTRY.counter('analysis_cache_lookups_total', "Поиски в кэше анализов по результату",
+                                 ('result',))
+_MEMORY_HITS = CACHE_LOOKUPS.labels('memory_hit')
+_DB_HITS = CACHE_LOOKUPS.labels('db_hit')
+_MISSES = CACHE_LOOKUPS.labels('miss')
+
+# Меньше стольких единичных (или нулевых) бит в dHash - изображение почти
+# однородное (тёмный, белый, однотонный кадр): такие хеши совпадают у
+# совершенно разных фото и ключом кэша не служат
+MIN_PHASH_BITS = 8
+
+
+def normalize_caption(caption: Optional[str]) -> str:
+    """Подпись к фото в каноническом виде: нижний регистр, одиночные пробелы"""
+    if not caption:
+        return ""
+    caption = re.sub(r"\s+", " ", caption.lower()).strip()
+    return caption.strip(".,!?;:")
+
+
+def perceptual_hash(image_bytes: bytes, hash_size: int = 8) -> str:
+    """
+    Перцептивный хеш изображения (dHash)
+    
+    Устойчив к пересжатию и изменению размера: одно и то же фото,
+    пересланное повторно или в другом PhotoSize, даёт тот же хеш.
+    """
+    with Image.open(BytesIO(image_bytes)) as image:
+        image.draft('L', (hash_size * 8, hash_size * 8))
+        small = image.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS)
+        pixels = list(small.getdata())
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+class AnalysisCache:
+    """
+    Кэш результатов анализа фото
+    
+    Два уровня: ограниченный LRU в памяти и таблица analysis_cache в SQLite
+    с временем жизни записей. Ключи строятся по file_unique_id из Telegram
+    (без скачивания файла) и по перцептивному хешу изображения; к обоим
+    добавляется нормализованная подпись, так как она влияет на результат.
+    Ключ по хешу действует только в пределах одного пользователя: 64 бита
+    dHash совпадают и у разных похожих блюд, а между пользователями
+    повторно пересланное фото находится по file_unique_id.
+    """
+    
+    def __init__(self, db: Database, max_entries: int = 2000, ttl_seconds: int = 7 * 24 * 3600):
+        self.db = db
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self.stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0}
+    
+    @staticmethod
+    def _caption_digest(caption: Optional[str]) -> str:
+        return hashlib.sha1(normalize_caption(caption).encode('utf-8')).hexdigest()[:16]
+    
+    def file_key(self, file_unique_id: str, caption: Optional[str]) -> str:
+        """Ключ по идентификатору файла Telegram"""
+        return f"file:{file_unique_id}:{self._caption_digest(caption)}"
+    
+    async def image_key(self, image_bytes: bytes, caption: Optional[str], user_id: int) -> Optional[str]:
+        """
+        Ключ по перцептивному хешу для фото пользователя user_id
+        
+        None - изображение не декодируется или почти однородное
+        (см. MIN_PHASH_BITS).
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            phash = await loop.run_in_executor(None, perceptual_hash, image_bytes)
+        except Exception as e:
+            logger.warning("Не удалось вычислить перцептивный хеш: %s", e)
+            return None
+        set_bits = bin(int(phash, 16)).count('1')
+        if min(set_bits, len(phash) * 4 - set_bits) < MIN_PHASH_BITS:
+            logger.debug("Перцептивный хеш %s вырожден, кэш по изображению не используется", phash)
+            return None
+        return f"phash:{user_id}:{phash}:{self._caption_digest(caption)}"
+    
+    def _remember(self, key: str, result: Dict, expires_at: float):
+        self._memory[key] = (expires_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+    
+    async def get(self, key: Optional[str]) -> Optional[Dict]:
+        """Результат анализа из кэша или None"""
+        if key is None:
+            return None
+        
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, result = entry
+            if expires_at > time.time():
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                _MEMORY_HITS.inc()
+                return dict(result)
+            del self._memory[key]
+        
+        cached = await self.db.get_cached_analysis(key)
+        if cached is not None:
+            result, expires_at = cached
+            self._remember(key, result, expires_at)
+            self.stats['db_hits'] += 1
+            _DB_HITS.inc()
+            return dict(result)
+        
+        self.stats['misses'] += 1
+        _MISSES.inc()
+        return None
+    
+    async def put(self, keys: Iterable[Optional[str]], result: Dict):
+        """Сохранение результата под всеми переданными ключами"""
+        keys = [key for key in keys if key]
+        if not keys:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        for key in keys:
+            self._remember(key, result, expires_at)
+        await self.db.put_cached_analysis(keys, result, expires_at)
+    
+    def get_stats(self) -> Dict:
+        """Счётчики попаданий и промахов"""
+        lookups = sum(self.stats.values())
+        hits = self.stats['memory_hits'] + self.stats['db_hits']
+        return {
+            **self.stats,
+            'entries_in_memory': len(self._memory),
+            'hit_rate': hits / lookups if lookups else 0.0,
+        }
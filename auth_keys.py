@@ -69,7 +69,7 @@ def generate_default_keys() -> Dict:
     unlimited = AuthKeyManager.generate_keys(count=1, limit=None)
     result['unlimited_keys'] = unlimited
     
-    logger.info(f"Сгенерировано {len(limited)} ограниченных и {len(unlimited)} безлимитных ключей")
+    logger.info("Сгенерировано %s ограниченных и %s безлимитных ключей", len(limited), len(unlimited))
     
     return result
 
@@ -124,7 +124,7 @@ def save_keys_to_file(keys_data: Dict, filename: str = 'access_keys.txt'):
         f.write("• После активации ключ привязывается к вашему Telegram ID\n")
         f.write("=" * 70 + "\n")
     
-    logger.info(f"Ключи сохранены в файл: {filename}")
+    logger.info("Ключи сохранены в файл: %s", filename)
 
 
 if __name__ == "__main__":
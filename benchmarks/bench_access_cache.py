@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест кэша доступа: сколько SQL-запросов и времени уходит
+на последовательность вызовов Database, которую делает handle_photo,
+с кэшем состояния ключей и без него.
+
+Запуск: python -m benchmarks.bench_access_cache [--users 200] [--photos 5]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import config
+from database import Database
+
+
+async def photo_db_calls(db: Database, user_id: int):
+    """Обращения к БД при обработке одного фото (без вызова OpenAI)"""
+    await db.check_user_access(user_id)
+    await db.check_rate_limit(user_id, minutes=1, max_requests=config.MAX_REQUESTS_PER_MINUTE)
+    await db.log_request(user_id, "image")
+    await db.get_daily_calories(user_id)
+    await db.get_user_daily_limit(user_id)
+    await db.add_meal(user_id, 'Суп', 150, weight=300, protein=5, fat=4, carbs=20, image_processed=True)
+    await db.log_key_usage(user_id, usage_type='image')
+    await db.check_user_access(user_id)
+
+
+async def run(access_cache: bool, users: int, photos: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'), access_cache=access_cache)
+        try:
+            await db.init_db()
+            for user_id in range(users):
+                await db.add_user(user_id, f"user{user_id}", "Bench")
+                await db.add_access_key(f"BENCH-{user_id}", 'limited', 1000)
+                await db.activate_key(f"BENCH-{user_id}", user_id)
+
+            counts = {'queries': 0, 'access': 0}
+
+            def trace(sql: str):
+                counts['queries'] += 1
+                if 'access_keys' in sql or 'key_usage' in sql:
+                    counts['access'] += 1
+
+            await db.set_trace_callback(trace)
+            start = time.perf_counter()
+            for _ in range(photos):
+                await asyncio.gather(*(photo_db_calls(db, user_id) for user_id in range(users)))
+            elapsed = time.perf_counter() - start
+        finally:
+            await db.close()
+
+    total = users * photos
+    label = "с кэшем доступа" if access_cache else "без кэша доступа"
+    print(f"{label:<18} запросов на фото: {counts['queries'] / total:5.2f} "
+          f"(к access_keys/key_usage: {counts['access'] / total:4.2f})  "
+          f"{total / elapsed:7.0f} фото/с")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--photos', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"Пользователей: {args.users}, фото на пользователя: {args.photos}")
+    await run(False, args.users, args.photos)
+    await run(True, args.users, args.photos)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
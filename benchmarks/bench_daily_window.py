@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк дневной выборки для пользователя с многолетней историей:
+DATE(meal_time) = ? (полный перебор записей пользователя), полуоткрытый
+интервал [начало дня, начало следующего дня) и строка daily_totals
+по первичному ключу (текущий get_daily_calories).
+
+Запуск: python -m benchmarks.bench_daily_window [--years 5] [--meals-per-day 6] [--calls 500]
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from database import Database, SQLITE_TIMESTAMP_FORMAT, day_bounds_utc
+
+USER_ID = 1
+
+OLD_QUERY = """
+    SELECT
+        COALESCE(SUM(calories), 0), COALESCE(SUM(protein), 0),
+        COALESCE(SUM(fat), 0), COALESCE(SUM(carbs), 0), COUNT(*)
+    FROM meals
+    WHERE user_id = ? AND DATE(meal_time) = ?
+"""
+
+RANGE_QUERY = """
+    SELECT
+        COALESCE(SUM(calories), 0), COALESCE(SUM(protein), 0),
+        COALESCE(SUM(fat), 0), COALESCE(SUM(carbs), 0), COUNT(*)
+    FROM meals
+    WHERE user_id = ? AND meal_time >= ? AND meal_time < ?
+"""
+
+
+def seed_history(db_path: str, years: int, meals_per_day: int):
+    """Заполнение истории напрямую через sqlite3 (быстрее, чем через Database)"""
+    now = datetime.now(timezone.utc)
+    rows = []
+    for day in range(years * 365):
+        base = now - timedelta(days=day)
+        for n in range(meals_per_day):
+            moment = base.replace(hour=6 + n * 2, minute=0, second=0)
+            rows.append((USER_ID, 'История', 200.0, 10.0, 5.0, 25.0,
+                         moment.strftime(SQLITE_TIMESTAMP_FORMAT)))
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("""
+            INSERT INTO meals (user_id, product_name, calories, protein, fat, carbs, meal_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+    return len(rows)
+
+
+async def measure(label: str, fn, calls: int):
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        await fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    print(f"{label:<32} mean={statistics.mean(latencies):.3f} мс  p50={statistics.median(latencies):.3f} мс")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--meals-per-day', type=int, default=6)
+    parser.add_argument('--calls', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        db = Database(db_path)
+        await db.init_db()
+        total = seed_history(db_path, args.years, args.meals_per_day)
+        print(f"Записей в истории пользователя: {total}")
+
+        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+        async def old_daily():
+            async with db._read() as conn:
+                async with conn.execute(OLD_QUERY, (USER_ID, today)) as cursor:
+                    await cursor.fetchone()
+
+        await measure("DATE(meal_time) = ?", old_daily, args.calls)
+        _, day_start, day_end = day_bounds_utc('UTC')
+
+        async def range_daily():
+            async with db._read() as conn:
+                async with conn.execute(RANGE_QUERY, (USER_ID, day_start, day_end)) as cursor:
+                    await cursor.fetchone()
+
+        await measure("интервал [день, следующий день)", range_daily, args.calls)
+        # История записана в обход add_meal - итоги пересчитываются целиком
+        await db.rebuild_daily_totals()
+        await measure("daily_totals (первичный ключ)",
+                      lambda: db.get_daily_calories(USER_ID), args.calls)
+
+        # Итоги за 30 дней: агрегат по meals против диапазона daily_totals
+        month_start = (datetime.now(timezone.utc) - timedelta(days=29)).strftime("%Y-%m-%d 00:00:00")
+
+        async def month_from_meals():
+            async with db._read() as conn:
+                async with conn.execute(RANGE_QUERY, (USER_ID, month_start, day_end)) as cursor:
+                    await cursor.fetchone()
+
+        async def month_from_totals():
+            async with db._read() as conn:
+                async with conn.execute("""
+                    SELECT SUM(calories), SUM(protein), SUM(fat), SUM(carbs), SUM(meal_count)
+                    FROM daily_totals WHERE user_id = ? AND day >= ?
+                """, (USER_ID, month_start[:10])) as cursor:
+                    await cursor.fetchone()
+
+        await measure("30 дней: SUM по meals", month_from_meals, args.calls)
+        await measure("30 дней: SUM по daily_totals", month_from_totals, args.calls)
+        await measure("30 дней: get_period_totals",
+                      lambda: db.get_period_totals(USER_ID, days=30), args.calls)
+        await db.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
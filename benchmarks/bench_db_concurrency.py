@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк смешанной нагрузки: читатели (/stats, /history) параллельно
+с писателями (запись приёмов пищи и журнала запросов).
+
+Сравнивает профиль SQLite по умолчанию (rollback journal, synchronous=FULL)
+с профилем по умолчанию и переопределениями из config.DB_STORAGE_PROFILE.
+
+Запуск: python -m benchmarks.bench_db_concurrency [--seconds 5] [--readers 8] [--writers 4]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import config
+from benchmarks.fixtures import percentile
+from database import Database
+
+ROLLBACK_PROFILE = {
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+    'busy_timeout': 5000,
+    'mmap_size': None,
+    'cache_size': None,
+}
+
+USERS = 50
+
+
+async def run_profile(label: str, profile: dict, seconds: float, readers: int, writers: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'), read_pool_size=readers, storage_profile=profile)
+        await db.init_db()
+        for user_id in range(USERS):
+            await db.add_user(user_id, f"user{user_id}", "Bench")
+
+        read_latencies, write_latencies = [], []
+        deadline = time.perf_counter() + seconds
+
+        async def reader(n):
+            i = n
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                if i % 2:
+                    await db.get_daily_calories(i % USERS)
+                else:
+                    await db.get_user_meals_today(i % USERS)
+                read_latencies.append((time.perf_counter() - start) * 1000)
+                i += 1
+
+        async def writer(n):
+            i = n
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                await db.log_request(i % USERS, 'image')
+                await db.add_meal(i % USERS, 'Бенчмарк', 250, weight=200,
+                                  protein=10, fat=8, carbs=30, image_processed=True)
+                write_latencies.append((time.perf_counter() - start) * 1000)
+                i += 1
+
+        await asyncio.gather(*(reader(n) for n in range(readers)),
+                             *(writer(n) for n in range(writers)))
+        await db.close()
+
+    print(f"\n{label}")
+    print(f"  чтения: {len(read_latencies) / seconds:8.0f} оп/с  "
+          f"p50={percentile(read_latencies, 0.5):.2f} мс  p99={percentile(read_latencies, 0.99):.2f} мс")
+    print(f"  записи: {len(write_latencies) / seconds:8.0f} оп/с  "
+          f"p50={percentile(write_latencies, 0.5):.2f} мс  p99={percentile(write_latencies, 0.99):.2f} мс")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"Читателей: {args.readers}, писателей: {args.writers}, длительность: {args.seconds} с")
+    await run_profile("rollback journal, synchronous=FULL", ROLLBACK_PROFILE,
+                      args.seconds, args.readers, args.writers)
+    await run_profile("DEFAULT_STORAGE_PROFILE + config.DB_STORAGE_PROFILE", config.DB_STORAGE_PROFILE,
+                      args.seconds, args.readers, args.writers)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
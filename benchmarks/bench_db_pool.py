@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк задержки одного вызова Database: соединение на каждый вызов
+(как было раньше) против долгоживущего пула соединений.
+
+Запуск: python -m benchmarks.bench_db_pool [--calls 2000]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import aiosqlite
+
+from benchmarks.fixtures import percentile
+from database import Database
+
+
+async def per_call_connection(db_path: str, user_id: int):
+    """Старое поведение: новое соединение на каждый запрос"""
+    async with aiosqlite.connect(db_path) as conn:
+        async with conn.execute("""
+            SELECT daily_calorie_limit FROM users WHERE user_id = ?
+        """, (user_id,)) as cursor:
+            await cursor.fetchone()
+
+
+async def measure(label: str, fn, calls: int):
+    latencies = []
+    for i in range(calls):
+        start = time.perf_counter()
+        await fn(i)
+        latencies.append((time.perf_counter() - start) * 1000)
+    p95 = percentile(latencies, 0.95)
+    print(f"{label:<28} mean={statistics.mean(latencies):.3f} мс  "
+          f"p50={statistics.median(latencies):.3f} мс  p95={p95:.3f} мс")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        db = Database(db_path)
+        await db.init_db()
+        for user_id in range(100):
+            await db.add_user(user_id, f"user{user_id}", "Bench")
+
+        print(f"Вызовов: {args.calls}")
+        await measure("connect() на каждый вызов",
+                      lambda i: per_call_connection(db_path, i % 100), args.calls)
+        await measure("пул соединений",
+                      lambda i: db.get_user_daily_limit(i % 100), args.calls)
+        await db.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
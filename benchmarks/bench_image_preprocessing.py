@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк предобработки изображений: сколько байт экономится на загрузке
+в Vision API и сколько времени занимает обработка одного фото.
+
+Запуск: python -m benchmarks.bench_image_preprocessing [--photos 10] [--max-side 1024] [--quality 85]
+"""
+import argparse
+import asyncio
+import base64
+import statistics
+
+from openai_service import OpenAIService
+from benchmarks.fixtures import make_food_photo
+
+# Типичные размеры PhotoSize, которые присылает Telegram, и оригинал с камеры
+SIZES = [(320, 240), (800, 600), (1280, 960), (4000, 3000)]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--photos', type=int, default=10)
+    parser.add_argument('--max-side', type=int, default=1024)
+    parser.add_argument('--quality', type=int, default=85)
+    parser.add_argument('--executor', choices=['thread', 'process'], default='thread')
+    args = parser.parse_args()
+
+    service = OpenAIService(api_key='stub', image_max_side=args.max_side,
+                            image_jpeg_quality=args.quality, image_executor=args.executor)
+    print(f"max_side={args.max_side}, quality={args.quality}, пул={args.executor}\n")
+    print(f"{'исходный размер':<16}{'было, КБ':>10}{'стало, КБ':>11}{'base64, КБ':>12}"
+          f"{'экономия':>10}{'detail':>8}{'мс/фото':>10}")
+    for width, height in SIZES:
+        photos = [make_food_photo(width, height, seed=i) for i in range(args.photos)]
+        results = [await service.prepare_image(photo) for photo in photos]
+        before = statistics.mean(len(p) for p in photos)
+        after = statistics.mean(len(r['data']) for r in results)
+        encoded = statistics.mean(len(base64.b64encode(r['data'])) for r in results)
+        elapsed = statistics.mean(r['elapsed_ms'] for r in results)
+        print(f"{f'{width}x{height}':<16}{before / 1024:>10.1f}{after / 1024:>11.1f}{encoded / 1024:>12.1f}"
+              f"{(1 - after / before) * 100:>9.0f}%{results[0]['detail']:>8}{elapsed:>10.1f}")
+
+    stats = service.get_stats()
+    print(f"\nВсего: {stats['image_bytes_in'] / 1024:.0f} КБ -> {stats['image_bytes_out'] / 1024:.0f} КБ")
+    await service.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
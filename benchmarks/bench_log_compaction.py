@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Свёртка журналов requests_log/key_usage при работающей нагрузке:
+сколько строк и байт освобождено и насколько задерживаются записи
+бота (add_meal) во время обслуживания.
+
+Проверяет также, что агрегаты сохраняют количество запросов и что
+сверка счётчиков (check-usage) не видит расхождений после свёртки.
+
+Запуск: python -m benchmarks.bench_log_compaction [--days 120] [--requests-per-day 2000]
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.fixtures import percentile
+from database import Database, SQLITE_TIMESTAMP_FORMAT
+
+USERS = 50
+
+
+def seed_logs(db_path: str, days: int, requests_per_day: int) -> int:
+    """Журналы за days дней: requests_log и key_usage по одному ключу на пользователя"""
+    now = datetime.now(timezone.utc)
+    requests, usage = [], []
+    # В хронологическом порядке, как пишет бот: старые строки - с меньшими id
+    step = 86400 / requests_per_day
+    for day in reversed(range(days)):
+        base = now - timedelta(days=day + 1)
+        for n in range(requests_per_day):
+            user_id = n % USERS + 1
+            moment = (base + timedelta(seconds=n * step)).strftime(SQLITE_TIMESTAMP_FORMAT)
+            requests.append((user_id, 'image', moment))
+            if n % 4 == 0:
+                usage.append((user_id, user_id, 'image', moment))
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("""
+            INSERT INTO access_keys (id, key_code, key_type, image_limit, activated_by)
+            VALUES (?, ?, 'unlimited', NULL, ?)
+        """, [(u, f"key-{u}", u) for u in range(1, USERS + 1)])
+        conn.executemany("""
+            INSERT INTO requests_log (user_id, request_type, request_time) VALUES (?, ?, ?)
+        """, requests)
+        conn.executemany("""
+            INSERT INTO key_usage (user_id, key_id, usage_type, used_at) VALUES (?, ?, ?, ?)
+        """, usage)
+        conn.execute("""
+            UPDATE access_keys SET images_used = (
+                SELECT COUNT(*) FROM key_usage WHERE key_usage.key_id = access_keys.id
+            )
+        """)
+    return len(requests)
+
+
+async def count(db: Database, sql: str) -> int:
+    async with db._read() as conn:
+        async with conn.execute(sql) as cursor:
+            return (await cursor.fetchone())[0]
+
+
+async def writer_load(db: Database, stop: asyncio.Event, latencies: list):
+    """Запись приёма пищи каждые 10 мс, как от пользователей бота"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await db.add_meal(1, 'Нагрузка', 100.0)
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.01)
+
+
+def summary(latencies: list) -> str:
+    return (f"n={len(latencies)} p50={statistics.median(latencies):.2f} мс "
+            f"p99={percentile(latencies, 0.99):.2f} мс max={max(latencies):.2f} мс")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--days', type=int, default=120)
+    parser.add_argument('--requests-per-day', type=int, default=2000)
+    parser.add_argument('--retention-days', type=int, default=30)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        db = Database(db_path)
+        try:
+            await db.init_db()
+            total = seed_logs(db_path, args.days, args.requests_per_day)
+            size_before = os.path.getsize(db_path)
+            print(f"requests_log: {total} строк, файл БД {size_before / 1024 / 1024:.1f} МБ")
+
+            baseline = []
+            stop = asyncio.Event()
+            load = asyncio.create_task(writer_load(db, stop, baseline))
+            await asyncio.sleep(2)
+            stop.set()
+            await load
+            print(f"add_meal без обслуживания:  {summary(baseline)}")
+
+            during = []
+            stop = asyncio.Event()
+            load = asyncio.create_task(writer_load(db, stop, during))
+            report = await db.run_maintenance(
+                requests_retention_days=args.retention_days,
+                key_usage_retention_days=args.retention_days,
+                batch_size=args.batch_size,
+            )
+            stop.set()
+            await load
+            print(f"add_meal во время свёртки:  {summary(during)}")
+
+            print(f"Свёрнуто: requests_log {report['requests_log_rows']}, "
+                  f"key_usage {report['key_usage_rows']} за {report['duration']:.1f} с")
+            print(f"Освобождено: {report['bytes_reclaimed'] / 1024 / 1024:.1f} МБ "
+                  f"({report['pages_freed']} стр.), файл БД "
+                  f"{os.path.getsize(db_path) / 1024 / 1024:.1f} МБ")
+
+            remaining = await count(db, "SELECT COUNT(*) FROM requests_log")
+            rolled = await count(db, "SELECT COALESCE(SUM(count), 0) FROM requests_daily")
+            assert remaining + rolled == total, (remaining, rolled, total)
+            mismatches = await db.reconcile_usage_counters()
+            assert not mismatches, mismatches
+            print(f"Проверка: {remaining} сырых + {rolled} в агрегатах = {total}, "
+                  "счётчики ключей сходятся")
+        finally:
+            await db.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
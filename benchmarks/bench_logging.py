@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Цена логирования на фото: CalorieCounterBot.handle_photo (анализ OpenAI
+и Telegram заменены заглушками, см. bench_photo_handler) с разной
+настройкой логирования:
+  без логирования  - logging.disable(INFO), базовая линия;
+  синхронно        - прежняя схема: FileHandler + StreamHandler в потоке
+                     цикла событий, текстовый формат;
+  очередь          - log_setup: LazyQueueHandler -> QueueListener, JSON.
+Консоль направляется в /dev/null. --stall-ms моделирует задержки диска:
+каждая --stall-every-я запись в файл ждёт stall-ms.
+
+Запуск: python -m benchmarks.bench_logging [--photos 300] [--concurrency 20] [--stall-ms 0]
+"""
+import argparse
+import asyncio
+import logging
+import logging.handlers
+import os
+import queue
+import statistics
+import tempfile
+import time
+
+from benchmarks.bench_photo_handler import RESULT, seed_users
+from benchmarks.fake_telegram import FakeBot, load_bot, make_context, make_update, photo_sizes
+from benchmarks.fixtures import make_food_photo, percentile
+from log_setup import TEXT_FORMAT, JsonFormatter, LazyQueueHandler, stop_logging
+
+
+class StallingFileHandler(logging.FileHandler):
+    """Файловый обработчик, у которого каждая stall_every-я запись ждёт диск"""
+
+    def __init__(self, path: str, stall: float, stall_every: int):
+        super().__init__(path, encoding='utf-8')
+        self.stall = stall
+        self.stall_every = stall_every
+        self.records = 0
+
+    def emit(self, record):
+        super().emit(record)
+        self.records += 1
+        if self.stall and self.records % self.stall_every == 0:
+            time.sleep(self.stall)
+
+
+def configure(mode: str, log_path: str, devnull, stall: float, stall_every: int):
+    """Настройка корневого логгера; возвращает (файловый обработчик, QueueListener)"""
+    stop_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(logging.INFO)
+    logging.disable(logging.INFO if mode == 'off' else logging.NOTSET)
+    file_handler = StallingFileHandler(log_path, stall, stall_every)
+    console = logging.StreamHandler(devnull)
+    console.setFormatter(logging.Formatter(TEXT_FORMAT))
+    if mode == 'queue':
+        file_handler.setFormatter(JsonFormatter())
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, file_handler, console,
+                                                  respect_handler_level=True)
+        root.addHandler(LazyQueueHandler(log_queue))
+        listener.start()
+        return file_handler, listener
+    file_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    root.addHandler(file_handler)
+    root.addHandler(console)
+    return file_handler, None
+
+
+async def run_photos(bot_module, args) -> list:
+    bot = bot_module.CalorieCounterBot()
+
+    async def stub_analysis(image_bytes, user_text=None, on_fields=None, tier=None,
+                            escalate_quality=True):
+        await asyncio.sleep(args.analysis_ms / 1000)
+        return dict(RESULT)
+
+    bot.openai_service.analyze_food_image = stub_analysis
+    await bot.post_init(None)
+    try:
+        await seed_users(bot.db, args.users)
+        photo = make_food_photo(320, 240, seed=1)
+        sizes = photo_sizes('bench', [(90, 68), (320, 240), (800, 600)])
+        context = make_context(FakeBot({size.file_id: photo for size in sizes}))
+        limiter = asyncio.Semaphore(args.concurrency)
+        latencies = []
+        replies = []
+
+        async def one(n):
+            update = make_update(n % args.users + 1, photo=sizes, caption=f"фото {n}")
+            async with limiter:
+                start = time.perf_counter()
+                await bot.handle_photo(update, context)
+                latencies.append((time.perf_counter() - start) * 1000)
+            replies.append(update.message.replies[-1].text)
+
+        await asyncio.gather(*(one(n) for n in range(args.photos)))
+        # Иначе замер тихо уходит в ветку ошибки и сравнивает не тот путь
+        failed = [text for text in replies if 'За сегодня' not in text]
+        if failed:
+            raise SystemExit(f"Обработчик не дошёл до итога в {len(failed)} из {args.photos} фото: {failed[0]!r}")
+        return latencies
+    finally:
+        await bot.post_shutdown(None)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--photos', type=int, default=300)
+    parser.add_argument('--users', type=int, default=30)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--analysis-ms', type=float, default=0)
+    parser.add_argument('--stall-ms', type=float, default=0, help="задержка диска на запись")
+    parser.add_argument('--stall-every', type=int, default=50, help="каждая N-я запись ждёт диск")
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{args.photos} фото, {args.concurrency} одновременно, {args.rounds} раунда, "
+          f"задержка диска {args.stall_ms:.0f} мс на каждую {args.stall_every}-ю запись")
+    modes = (('off', "без логирования"), ('sync', "синхронно"), ('queue', "очередь"))
+    results = {mode: {'per_photo': [], 'latencies': [], 'records': 0} for mode, _ in modes}
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as devnull:
+        bot_module = load_bot(tmp)
+        # Прогрев: пулы потоков, кэши PTB/Pillow - иначе первый режим проигрывает
+        configure('off', os.path.join(tmp, 'warmup.log'), devnull, 0, 1)[0].close()
+        await run_photos(bot_module, args)
+        for round_no in range(args.rounds):
+            # Режимы по кругу, чтобы порядок не давал преимущества
+            for mode, _ in modes[round_no % len(modes):] + modes[:round_no % len(modes)]:
+                file_handler, listener = configure(mode, os.path.join(tmp, f"{mode}.log"), devnull,
+                                                   args.stall_ms / 1000, args.stall_every)
+                started = time.perf_counter()
+                latencies = await run_photos(bot_module, args)
+                elapsed = time.perf_counter() - started
+                if listener is not None:
+                    listener.stop()
+                file_handler.close()
+                logging.disable(logging.NOTSET)
+                results[mode]['per_photo'].append(elapsed / args.photos * 1000)
+                results[mode]['latencies'].extend(latencies)
+                results[mode]['records'] += file_handler.records
+
+    baseline = statistics.median(results['off']['per_photo'])
+    for mode, label in modes:
+        result = results[mode]
+        per_photo = statistics.median(result['per_photo'])
+        latencies = result['latencies']
+        p99 = percentile(latencies, 0.99)
+        print(f"  {label:<16} {per_photo:6.2f} мс/фото ({per_photo - baseline:+5.2f})  "
+              f"p50={statistics.median(latencies):7.2f} мс  p99={p99:7.2f} мс  "
+              f"записей в файл: {result['records'] / args.photos / args.rounds:.1f}/фото")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Цена метрик горячего пути (metrics.py) при REGISTRY.enabled = True/False.
+
+1. Микрозамеры: один замер гистограммы контекстом time(), observe(),
+   inc() счётчика и вызов корутины через timed() против прямого вызова.
+2. Полный CalorieCounterBot.handle_photo: Telegram - заглушки
+   (benchmarks/fake_telegram.py), OpenAI - заглушка клиента, так что
+   предобработка изображения, base64 и все замеры OpenAIService
+   выполняются. Режимы чередуются по раундам, берётся медиана.
+3. GET /metrics: размер ответа и время отдачи после прогона.
+
+Запуск: python -m benchmarks.bench_metrics [--photos 300] [--concurrency 20] [--rounds 4]
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+from benchmarks.bench_photo_handler import RESULT, seed_users
+from benchmarks.fake_telegram import FakeBot, load_bot, make_context, make_update, photo_sizes
+from benchmarks.fixtures import make_food_photo, percentile, stub_openai_client
+from metrics import REGISTRY, Counter, MetricsRegistry, MetricsServer, timed
+
+
+async def bench_primitives(iterations: int):
+    """Наносекунд на операцию для каждого примитива при включённых и выключенных метриках"""
+    registry = MetricsRegistry()
+    histogram = registry.histogram('bench_seconds', "bench", ('stage',)).labels('x')
+    counter = registry.counter('bench_total', "bench", ('kind',)).labels('x')
+
+    async def noop():
+        return None
+
+    wrapped = timed(registry.histogram('bench_call_seconds', "bench", ('call',)), 'noop')(noop)
+
+    async def coroutine_loop(func):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            await func()
+        return time.perf_counter() - start
+
+    def context_loop():
+        start = time.perf_counter()
+        for _ in range(iterations):
+            with histogram.time():
+                pass
+        return time.perf_counter() - start
+
+    def observe_loop():
+        start = time.perf_counter()
+        for _ in range(iterations):
+            histogram.observe(0.001)
+        return time.perf_counter() - start
+
+    def inc_loop():
+        start = time.perf_counter()
+        for _ in range(iterations):
+            counter.inc()
+        return time.perf_counter() - start
+
+    def empty_loop():
+        start = time.perf_counter()
+        for _ in range(iterations):
+            pass
+        return time.perf_counter() - start
+
+    results = {}
+    for enabled in (True, False):
+        registry.enabled = enabled
+        empty = empty_loop()
+        direct = await coroutine_loop(noop)
+        results[enabled] = {
+            'time()': context_loop() - empty,
+            'observe()': observe_loop() - empty,
+            'inc()': inc_loop() - empty,
+            'timed()': await coroutine_loop(wrapped) - direct,
+        }
+    return {enabled: {name: value / iterations * 1e9 for name, value in ops.items()}
+            for enabled, ops in results.items()}
+
+
+def observations() -> int:
+    """Всего замеров гистограмм и приращений счётчиков в REGISTRY (gauge - не замеры)"""
+    total = 0
+    for (name, _), value in REGISTRY.snapshot().items():
+        if isinstance(value, tuple):
+            total += value[2]
+        elif isinstance(REGISTRY.get(name), Counter):
+            total += value
+    return total
+
+
+async def run_photos(bot_module, args, db_path: str) -> dict:
+    bot_module.config.DATABASE_PATH = db_path
+    bot = bot_module.CalorieCounterBot()
+    await bot.openai_service.client.close()
+    bot.openai_service.client = stub_openai_client(
+        lambda request: {'result': RESULT, 'ttft': args.analysis_ms / 1000 / 8,
+                         'generation': args.analysis_ms / 1000 * 7 / 8, 'chunks': 8})
+    await bot.post_init(None)
+    try:
+        await seed_users(bot.db, args.users)
+        # Разные фото: каждый анализ идёт мимо кэша через OpenAIService
+        sizes_list = []
+        files = {}
+        for n in range(args.photos):
+            sizes = photo_sizes(f'bench{n}', [(90, 68), (320, 240), (800, 600)])
+            photo = make_food_photo(320, 240, seed=n)
+            files.update({size.file_id: photo for size in sizes})
+            sizes_list.append(sizes)
+        context = make_context(FakeBot(files))
+        limiter = asyncio.Semaphore(args.concurrency)
+        latencies = []
+
+        async def one(n):
+            update = make_update(n % args.users + 1, photo=sizes_list[n], caption=f"фото {n}")
+            async with limiter:
+                start = time.perf_counter()
+                await bot.handle_photo(update, context)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        REGISTRY.reset()
+        started = time.perf_counter()
+        await asyncio.gather(*(one(n) for n in range(args.photos)))
+        elapsed = time.perf_counter() - started
+        return {'per_photo': elapsed / args.photos * 1000, 'latencies': latencies,
+                'observations': observations()}
+    finally:
+        await bot.post_shutdown(None)
+
+
+async def fetch_metrics() -> tuple:
+    """Размер ответа /metrics и время его получения, мс"""
+    server = MetricsServer(REGISTRY, port=0)
+    await server.start()
+    try:
+        start = time.perf_counter()
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.bound_port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        response = await reader.read()
+        elapsed = (time.perf_counter() - start) * 1000
+        writer.close()
+    finally:
+        await server.stop()
+    head, _, body = response.partition(b"\r\n\r\n")
+    assert head.startswith(b"HTTP/1.1 200"), head
+    return len(body), body.count(b"\n"), elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--photos', type=int, default=300)
+    parser.add_argument('--users', type=int, default=30)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--analysis-ms', type=float, default=0)
+    parser.add_argument('--rounds', type=int, default=4)
+    parser.add_argument('--iterations', type=int, default=200_000)
+    args = parser.parse_args()
+
+    print(f"примитивы, нс на операцию ({args.iterations} повторов):")
+    primitives = await bench_primitives(args.iterations)
+    for name in primitives[True]:
+        print(f"  {name:<10} включены {primitives[True][name]:7.0f}   выключены {primitives[False][name]:7.0f}")
+
+    print(f"handle_photo: {args.photos} разных фото, {args.concurrency} одновременно, {args.rounds} раунда")
+    results = {True: {'per_photo': [], 'latencies': [], 'observations': 0},
+               False: {'per_photo': [], 'latencies': [], 'observations': 0}}
+    with tempfile.TemporaryDirectory() as tmp:
+        bot_module = load_bot(tmp, LOG_LEVEL='WARNING')
+        # Прогрев: пулы потоков, кэши PTB/Pillow
+        await run_photos(bot_module, args, f"{tmp}/warmup.db")
+        for round_no in range(args.rounds):
+            for enabled in ((True, False) if round_no % 2 == 0 else (False, True)):
+                bot_module.config.METRICS_ENABLED = enabled
+                run = await run_photos(bot_module, args, f"{tmp}/metrics{round_no}{int(enabled)}.db")
+                results[enabled]['per_photo'].append(run['per_photo'])
+                results[enabled]['latencies'].extend(run['latencies'])
+                results[enabled]['observations'] += run['observations']
+
+        baseline = statistics.median(results[False]['per_photo'])
+        for enabled, label in ((False, "выключены"), (True, "включены")):
+            result = results[enabled]
+            per_photo = statistics.median(result['per_photo'])
+            latencies = result['latencies']
+            p99 = percentile(latencies, 0.99)
+            print(f"  {label:<10} {per_photo:6.2f} мс/фото ({per_photo - baseline:+5.2f})  "
+                  f"p50={statistics.median(latencies):6.2f} мс  p99={p99:6.2f} мс  "
+                  f"замеров на фото: {result['observations'] / args.photos / args.rounds:.1f}")
+
+        # Последний прогон с включёнными метриками - для /metrics
+        bot_module.config.METRICS_ENABLED = True
+        await run_photos(bot_module, args, f"{tmp}/final.db")
+        size, lines, elapsed = await fetch_metrics()
+        print(f"GET /metrics: {size / 1024:.1f} КБ, {lines} строк, {elapsed:.2f} мс")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Двухуровневый анализ фото: стоимость и задержка с маршрутизацией и без.
+
+OpenAIService.analyze_food_image вызывается с заглушкой HTTP-клиента
+OpenAI; предобработка изображений настоящая. Заглушка отвечает по
+модели запроса: быстрая (уровень fast) - за --fast-ms, сильная - за
+--strong-ms; на доле --uncertain-share фото быстрая модель сомневается
+(quality_warning, низкая уверенность или калории не сходятся с БЖУ),
+и анализ уходит сильной. Токены - как у Vision API: изображение с
+detail=low - 85, high (1024x768) - 765, плюс текст запроса.
+
+Для каждого режима: запросы и время по уровням, эскалации по причинам,
+p50/p95 анализа и стоимость по ценам --fast-price/--strong-price
+(долларов за 1 млн входных:выходных токенов).
+
+Запуск: python -m benchmarks.bench_model_routing [--photos 200] [--uncertain-share 0.2]
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import statistics
+import time
+from typing import Dict, List
+
+from benchmarks.fixtures import latency_distribution, make_food_photo, percentile, stub_openai_client
+from openai_service import OpenAIService
+
+PROMPT_TEXT_TOKENS = 450
+IMAGE_TOKENS = {'low': 85, 'high': 765}
+
+CONFIDENT = {
+    'product_name': "Омлет с овощами", 'weight': 200, 'calories': 250, 'protein': 16, 'fat': 18, 'carbs': 6,
+    'comparison': "Как два варёных яйца и ломтик сыра",
+    'recommendations': "Подходит для завтрака",
+    'benefits': "Белок и жиры для долгой сытости",
+    'warnings': "", 'quality_warning': "", 'confidence': 0.9,
+}
+# Сомнения быстрой модели - по кругу
+UNCERTAIN = [
+    dict(CONFIDENT, quality_warning="Фото тёмное, состав блюда виден плохо", confidence=0.5),
+    dict(CONFIDENT, confidence=0.35),
+    dict(CONFIDENT, calories=520),
+]
+
+
+def model_responder(rng: random.Random, fast_model: str, fast_delay, strong_delay, uncertain_share: float):
+    """Ответ заглушки OpenAI: результат, задержка и токены зависят от модели и detail запроса"""
+    uncertain = itertools.cycle(UNCERTAIN)
+
+    def respond(request: Dict) -> Dict:
+        fast = request['model'] == fast_model
+        ttft = fast_delay(rng) if fast else strong_delay(rng)
+        result = next(uncertain) if fast and rng.random() < uncertain_share else CONFIDENT
+        detail = request['messages'][1]['content'][1]['image_url']['detail']
+        return {'result': result, 'ttft': ttft, 'prompt_tokens': PROMPT_TEXT_TOKENS + IMAGE_TOKENS[detail]}
+
+    return respond
+
+
+def parse_price(spec: str) -> Dict[str, float]:
+    prompt, _, completion = spec.partition(':')
+    return {'prompt': float(prompt) / 1e6, 'completion': float(completion or prompt) / 1e6}
+
+
+async def run_mode(args, routing: bool, photos: List[bytes]) -> Dict:
+    rng = random.Random(args.seed)
+    service = OpenAIService(api_key='stub', max_concurrent_requests=args.concurrency, routing=routing)
+    await service.client.close()
+    service.client = stub_openai_client(model_responder(rng, service.vision_tiers['fast']['model'],
+                                                        latency_distribution(args.fast_ms),
+                                                        latency_distribution(args.strong_ms), args.uncertain_share))
+    latencies = []
+    limiter = asyncio.Semaphore(args.concurrency)
+
+    async def analyze(n: int):
+        async with limiter:
+            start = time.perf_counter()
+            await service.analyze_food_image(photos[n % len(photos)], user_text=f"фото {n}")
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    try:
+        await asyncio.gather(*(analyze(n) for n in range(args.photos)))
+    finally:
+        await service.close()
+    stats = service.get_stats()
+    return {'latencies': sorted(latencies), 'tiers': stats['tiers'], 'escalations': stats['escalations']}
+
+
+def cost(tiers: Dict, prices: Dict[str, Dict[str, float]]) -> float:
+    return sum(stats['prompt_tokens'] * prices[tier]['prompt'] + stats['completion_tokens'] * prices[tier]['completion']
+               for tier, stats in tiers.items())
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--photos', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--uncertain-share', type=float, default=0.2, help="доля фото, где быстрая модель сомневается")
+    parser.add_argument('--fast-ms', default='lognormal:900:0.3', help="ответ быстрой модели")
+    parser.add_argument('--strong-ms', default='lognormal:2500:0.3', help="ответ сильной модели")
+    parser.add_argument('--fast-price', default='0.15:0.6', help="$ за 1 млн входных:выходных токенов")
+    parser.add_argument('--strong-price', default='2.5:10')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    prices = {'fast': parse_price(args.fast_price), 'strong': parse_price(args.strong_price)}
+
+    photos = [make_food_photo(1024, 768, seed=n) for n in range(8)]
+    results = {routing: await run_mode(args, routing, photos) for routing in (False, True)}
+
+    print(f"{args.photos} фото, {args.concurrency} одновременно; сомнения быстрой модели: {args.uncertain_share:.0%}; "
+          f"fast {args.fast_ms} мс, strong {args.strong_ms} мс")
+    print(f"  {'режим':<14} {'p50, мс':>8} {'p95, мс':>8} {'fast':>6} {'strong':>7} {'токенов/фото':>13} "
+          f"{'$ на 1000 фото':>15}")
+    baseline = cost(results[False]['tiers'], prices)
+    for routing, result in results.items():
+        tiers = result['tiers']
+        ordered = result['latencies']
+        tokens = sum(stats['prompt_tokens'] + stats['completion_tokens'] for stats in tiers.values())
+        total = cost(tiers, prices)
+        saving = f" ({total / baseline - 1:+.0%})" if routing and baseline else ""
+        print(f"  {'маршрутизация' if routing else 'только strong':<14} {statistics.median(ordered):8.0f} "
+              f"{percentile(ordered, 0.95):8.0f} {tiers['fast']['requests']:6d} {tiers['strong']['requests']:7d} "
+              f"{tokens / args.photos:13.0f} {total / args.photos * 1000:15.2f}{saving}")
+        for tier, stats in tiers.items():
+            if stats['requests']:
+                print(f"      {tier:<7} среднее {stats['seconds'] / stats['requests'] * 1000:6.0f} мс, "
+                      f"токенов {stats['prompt_tokens']} + {stats['completion_tokens']}")
+        if result['escalations']:
+            print(f"      эскалации: {', '.join(f'{reason} {count}' for reason, count in result['escalations'].items())}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Проверка того, что параллельные анализы фото через OpenAIService
+перекрываются во времени, а не выполняются последовательно.
+
+Поднимает локальную заглушку OpenAI API с фиксированной задержкой ответа,
+отправляет N фото одновременно и сравнивает общее время с ожидаемым
+для последовательного и параллельного выполнения. Код возврата 1,
+если запросы не перекрылись.
+
+Запуск: python -m benchmarks.bench_openai_concurrency [--photos 16] [--latency 0.5] [--limit 8]
+"""
+import argparse
+import asyncio
+import math
+import sys
+import time
+
+from openai_service import OpenAIService
+from benchmarks.fixtures import make_food_photo, openai_http_handler
+from benchmarks.stub_http import StubHTTPServer
+
+FAKE_ANALYSIS = {
+    'product_name': 'Овсяная каша', 'weight': 250, 'calories': 180,
+    'protein': 6, 'fat': 4, 'carbs': 30,
+}
+
+
+def make_openai_stub(latency: float):
+    """Обработчик заглушки /chat/completions с задержкой latency секунд и счётчиком одновременных запросов"""
+    active = {'now': 0, 'peak': 0}
+    respond = openai_http_handler(lambda request: {'result': FAKE_ANALYSIS, 'ttft': latency})
+
+    async def handler(method, path, headers, body):
+        active['now'] += 1
+        active['peak'] = max(active['peak'], active['now'])
+        try:
+            return await respond(method, path, headers, body)
+        finally:
+            active['now'] -= 1
+
+    return handler, active
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--photos', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--limit', type=int, default=8)
+    args = parser.parse_args()
+
+    handler, active = make_openai_stub(args.latency)
+    async with StubHTTPServer(handler) as server:
+        service = OpenAIService(api_key='stub', base_url=server.base_url,
+                                max_concurrent_requests=args.limit, request_timeout=10)
+
+        # Фоновый сборщик глубины очереди
+        samples = []
+
+        async def sample_queue():
+            while True:
+                samples.append(service.get_stats()['queue_depth'])
+                await asyncio.sleep(0.01)
+
+        photo = make_food_photo(640, 480)
+        sampler = asyncio.create_task(sample_queue())
+        start = time.perf_counter()
+        await asyncio.gather(*(service.analyze_food_image(photo) for _ in range(args.photos)))
+        elapsed = time.perf_counter() - start
+        sampler.cancel()
+        await service.close()
+
+    serial = args.photos * args.latency
+    ideal = math.ceil(args.photos / args.limit) * args.latency
+    print(f"Фото: {args.photos}, задержка API: {args.latency} с, лимит параллельности: {args.limit}")
+    print(f"Общее время: {elapsed:.2f} с (последовательно было бы {serial:.2f} с, идеально {ideal:.2f} с)")
+    print(f"Пик одновременных запросов на заглушке: {active['peak']}")
+    print(f"Максимальная глубина очереди: {max(samples, default=0)}")
+    print(f"Статистика сервиса: {service.get_stats()}")
+
+    overlapped = elapsed < serial * 0.75 and active['peak'] > 1
+    within_limit = active['peak'] <= args.limit
+    print("✅ Запросы перекрываются" if overlapped else "❌ Запросы выполнялись последовательно")
+    if not within_limit:
+        print("❌ Превышен лимит одновременных запросов")
+    return 0 if overlapped and within_limit else 1
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
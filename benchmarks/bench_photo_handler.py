@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Задержка обработки фото без сети: анализ OpenAI заменён задержкой
+--analysis-ms, Telegram - заглушками (benchmarks/fake_telegram.py).
+
+1. Путь по БД: прежняя последовательность вызовов (резерв, итоги дня,
+   норма, приём пищи, подтверждение резерва, остаток лимита) против
+   photo_preflight + photo_postflight. Считаются SQL-команды на фото.
+2. Полный CalorieCounterBot.handle_photo: --photos фото от --users
+   пользователей, не более --concurrency одновременно. Считаются вызовы
+   Database из обработчика (на промахе кэша анализов) и SQL-команды на фото.
+
+Запуск: python -m benchmarks.bench_photo_handler [--photos 500] [--concurrency 50] [--analysis-ms 0]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.fake_telegram import FakeBot, load_bot, make_context, make_update, photo_sizes
+from benchmarks.fixtures import count_db_calls, make_food_photo, percentile
+from database import Database
+
+RESULT = {'product_name': 'Каша', 'weight': 250, 'calories': 320,
+          'protein': 11, 'fat': 6, 'carbs': 52, 'confidence': 0.9}
+
+
+def percentiles(latencies: list) -> str:
+    return f"p50={statistics.median(latencies):.2f} мс p95={percentile(latencies, 0.95):.2f} мс"
+
+
+async def seed_users(db: Database, users: int):
+    for user_id in range(1, users + 1):
+        await db.add_user(user_id, f"user{user_id}", "Bench")
+        await db.add_access_key(f"BENCH-{user_id}", 'limited', 1_000_000)
+        await db.activate_key(f"BENCH-{user_id}", user_id)
+
+
+async def separate_calls(db: Database, user_id: int):
+    reservation = await db.reserve_image_quota(user_id)
+    await db.get_daily_calories(user_id)
+    await db.get_user_daily_limit(user_id)
+    await db.add_meal(user_id, RESULT['product_name'], RESULT['calories'], weight=RESULT['weight'],
+                      protein=RESULT['protein'], fat=RESULT['fat'], carbs=RESULT['carbs'],
+                      image_processed=True)
+    await db.commit_image_quota(reservation)
+    await db.check_user_access(user_id)
+
+
+async def combined_calls(db: Database, user_id: int):
+    preflight = await db.photo_preflight(user_id)
+    await db.photo_postflight(preflight['reservation'], RESULT['product_name'], RESULT['calories'],
+                              weight=RESULT['weight'], protein=RESULT['protein'],
+                              fat=RESULT['fat'], carbs=RESULT['carbs'])
+
+
+async def bench_db_path(tmp: str, photos: int, users: int):
+    for label, path in (("отдельные вызовы", separate_calls),
+                        ("preflight + postflight", combined_calls)):
+        db = Database(os.path.join(tmp, f"{path.__name__}.db"))
+        try:
+            await db.init_db()
+            await seed_users(db, users)
+            statements = 0
+
+            def trace(sql):
+                nonlocal statements
+                if sql.strip().upper() not in ('BEGIN', 'COMMIT'):
+                    statements += 1
+
+            await db.set_trace_callback(trace)
+            latencies = []
+            for n in range(photos):
+                start = time.perf_counter()
+                await path(db, n % users + 1)
+                latencies.append((time.perf_counter() - start) * 1000)
+            print(f"  {label:<24} {statements / photos:.1f} SQL/фото  {percentiles(latencies)}")
+        finally:
+            await db.close()
+
+
+async def bench_handler(tmp: str, args):
+    bot_module = load_bot(tmp)
+    bot = bot_module.CalorieCounterBot()
+
+    async def stub_analysis(image_bytes, user_text=None, on_fields=None, tier=None,
+                            escalate_quality=True):
+        await asyncio.sleep(args.analysis_ms / 1000)
+        return dict(RESULT)
+
+    bot.openai_service.analyze_food_image = stub_analysis
+    await bot.post_init(None)
+    try:
+        await seed_users(bot.db, args.users)
+        photo = make_food_photo(320, 240, seed=1)
+        sizes = photo_sizes('bench', [(90, 68), (320, 240), (800, 600)])
+        context = make_context(FakeBot({size.file_id: photo for size in sizes}))
+        limiter = asyncio.Semaphore(args.concurrency)
+        latencies = []
+        replies = []
+        # Вызовы Database из обработчика и все SQL-команды (с пачками очереди записи)
+        db_calls = {}
+        count_db_calls(bot.db, db_calls, lambda: 'photo')
+        statements = 0
+
+        def trace(sql):
+            nonlocal statements
+            if sql.strip().upper() not in ('BEGIN', 'COMMIT'):
+                statements += 1
+
+        await bot.db.set_trace_callback(trace)
+
+        async def one(n):
+            # Разные подписи - чтобы каждый анализ проходил мимо кэша результатов
+            update = make_update(n % args.users + 1, photo=sizes, caption=f"фото {n}")
+            async with limiter:
+                start = time.perf_counter()
+                await bot.handle_photo(update, context)
+                latencies.append((time.perf_counter() - start) * 1000)
+            replies.append(update.message.replies[-1].text)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(n) for n in range(args.photos)))
+        elapsed = time.perf_counter() - start
+        calls = db_calls.get('photo', 0)
+        await bot.db.flush_writes()  # SQL отложенных записей - тоже на счёт фото
+        # Проверяем после gather: все обработчики успели завершиться до post_shutdown
+        failed = [text for text in replies if 'За сегодня' not in text]
+        if failed:
+            raise SystemExit(f"Обработчик не дошёл до итога в {len(failed)} из {args.photos} фото: {failed[0]!r}")
+        print(f"  handle_photo: {percentiles(latencies)}, {args.photos / elapsed:.0f} фото/с, "
+              f"{calls / args.photos:.1f} вызовов Database/фото, "
+              f"{statements / args.photos:.1f} SQL/фото")
+    finally:
+        await bot.post_shutdown(None)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--photos', type=int, default=500)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--analysis-ms', type=float, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Путь по БД, {args.photos} фото последовательно:")
+        await bench_db_path(tmp, args.photos, args.users)
+        print(f"Полный обработчик, {args.concurrency} одновременно, анализ {args.analysis_ms:.0f} мс:")
+        await bench_handler(tmp, args)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
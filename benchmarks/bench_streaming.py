@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Потоковый ответ Vision API: время до первого результата у пользователя.
+
+CalorieCounterBot.handle_photo прогоняется с заглушками Telegram
+(задержка reply_text/edit_text) и HTTP-клиента OpenAI, который отвечает
+как модель: первый токен через --ttft-ms, дальше --tokens-per-s токенов
+в секунду. Без потока ответ приходит целиком после последнего токена.
+
+Для каждого режима: время от начала обработчика до первой правки
+сообщения «Анализирую фото...» (промежуточной или финальной) и до
+финального ответа, число правок на фото и минимальный интервал между
+правками одного сообщения (STREAM_EDIT_INTERVAL).
+
+Запуск: python -m benchmarks.bench_streaming [--photos 40] [--concurrency 8] [--tokens-per-s 50]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import types
+from typing import Callable, Dict, List
+
+from benchmarks.bench_photo_handler import seed_users
+from benchmarks.fake_telegram import load_bot, photo_sizes
+from benchmarks.fixtures import latency_distribution, make_food_photo, percentile, stub_openai_client
+from benchmarks.load_test import LatentBot, LatentMessage
+
+# Ответ с комментариями обычной длины: поля идут в порядке системного промпта
+ANALYSIS = {
+    'product_name': "Гречка с куриной грудкой и овощами",
+    'weight': 320,
+    'calories': 410,
+    'protein': 34,
+    'fat': 9,
+    'carbs': 48,
+    'comparison': "Примерно как две порции овсянки на воде или три средних банана",
+    'recommendations': "Хорошо подходит для обеда; добавьте свежие овощи или зелень, "
+                       "чтобы увеличить объём порции без лишних калорий",
+    'benefits': "Гречка даёт медленные углеводы и клетчатку, куриная грудка - нежирный белок, "
+                "овощи - витамины и минералы",
+    'warnings': "Следите за количеством масла и соусов - они заметно добавляют калорий",
+    'quality_warning': "",
+    'confidence': 0.9,
+}
+
+
+class TimedMessage(LatentMessage):
+    """Сообщение, запоминающее время завершения каждой правки"""
+
+    def __init__(self, delay: Callable[[], float], **fields):
+        super().__init__(delay, **fields)
+        self.edit_times: List[float] = []
+
+    async def reply_text(self, text: str, **kwargs) -> 'TimedMessage':
+        await asyncio.sleep(self._delay())
+        reply = TimedMessage(self._delay, text=text)
+        self.replies.append(reply)
+        return reply
+
+    async def edit_text(self, text: str, **kwargs) -> 'TimedMessage':
+        await super().edit_text(text, **kwargs)
+        self.edit_times.append(time.perf_counter())
+        return self
+
+
+async def run_mode(bot_module, args, stream: bool, workdir: str) -> Dict:
+    rng = random.Random(args.seed)
+    telegram_delay = latency_distribution(args.telegram_ms)
+    bot_module.config.DATABASE_PATH = os.path.join(workdir, f"stream-{int(stream)}.db")
+    bot = bot_module.CalorieCounterBot()
+    bot.openai_service.stream_responses = stream
+    bot.openai_service.routing = False  # транслируется только ответ сильной модели
+    await bot.openai_service.client.close()
+    ttft = latency_distribution(args.ttft_ms)
+    # Ответ по "токенам" в 3 символа: первый - через ttft, дальше --tokens-per-s в секунду
+    tokens = -(-len(json.dumps(ANALYSIS, ensure_ascii=False)) // 3)
+    bot.openai_service.client = stub_openai_client(
+        lambda request: {'result': ANALYSIS, 'ttft': ttft(rng), 'generation': (tokens - 1) / args.tokens_per_s})
+
+    pool = [make_food_photo(800, 600, seed=n) for n in range(4)]
+    files = {}
+    context = types.SimpleNamespace(bot=LatentBot(files, lambda: telegram_delay(rng)), user_data={})
+    first, total, edits, gaps = [], [], [], []
+
+    async def send_photo(n: int):
+        user_id = n % args.users + 1
+        sizes = photo_sizes(f"s{n}", [(320, 240), (800, 600)])
+        files.update({size.file_id: pool[n % len(pool)] for size in sizes})
+        message = TimedMessage(lambda: telegram_delay(rng), photo=sizes, caption=f"обед {n}")
+        user = types.SimpleNamespace(id=user_id, username=f"user{user_id}", first_name="Bench")
+        update = types.SimpleNamespace(effective_user=user, message=message, effective_message=message)
+        start = time.perf_counter()
+        await bot.handle_photo(update, context)
+        edit_times = message.replies[0].edit_times
+        first.append((edit_times[0] - start) * 1000)
+        total.append((edit_times[-1] - start) * 1000)
+        edits.append(len(edit_times))
+        gaps.extend((b - a) * 1000 for a, b in zip(edit_times, edit_times[1:-1]))
+
+    await bot.post_init(None)
+    try:
+        await seed_users(bot.db, args.users)
+        limiter = asyncio.Semaphore(args.concurrency)
+
+        async def limited(n: int):
+            async with limiter:
+                await send_photo(n)
+
+        await asyncio.gather(*(limited(n) for n in range(args.photos)))
+    finally:
+        await bot.post_shutdown(None)
+    return {'first': sorted(first), 'total': sorted(total), 'edits': edits, 'gaps': gaps, 'tokens': tokens}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--photos', type=int, default=40)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=8, help="одновременно обрабатываемых фото")
+    parser.add_argument('--ttft-ms', default='lognormal:1200:0.3', help="до первого токена ответа")
+    parser.add_argument('--tokens-per-s', type=float, default=50)
+    parser.add_argument('--telegram-ms', default='lognormal:60:0.4', help="reply_text/edit_text и скачивание")
+    parser.add_argument('--edit-interval', type=float, default=None,
+                        help="STREAM_EDIT_INTERVAL, секунд (по умолчанию из config)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        overrides = {'LOG_LEVEL': 'WARNING', 'METRICS_LOG_INTERVAL': 0}
+        if args.edit_interval is not None:
+            overrides['STREAM_EDIT_INTERVAL'] = args.edit_interval
+        bot_module = load_bot(tmp, **overrides)
+        results = {stream: await run_mode(bot_module, args, stream, tmp) for stream in (False, True)}
+
+    print(f"{args.photos} фото, {args.concurrency} одновременно; первый токен {args.ttft_ms} мс, "
+          f"{args.tokens_per_s:g} токенов/с, ответ {results[True]['tokens']} токенов; "
+          f"правки не чаще раза в {bot_module.config.STREAM_EDIT_INTERVAL:g} с")
+    print(f"  {'режим':<8} {'первый результат p50/p95, мс':>29} {'ответ p50/p95, мс':>19} "
+          f"{'правок на фото':>15} {'мин. интервал, мс':>18}")
+    for stream, result in results.items():
+        first, total = result['first'], result['total']
+        gap = f"{min(result['gaps']):.0f}" if result['gaps'] else "-"
+        print(f"  {'поток' if stream else 'целиком':<8} "
+              f"{statistics.median(first):14.0f} / {percentile(first, 0.95):<12.0f} "
+              f"{statistics.median(total):8.0f} / {percentile(total, 0.95):<8.0f} "
+              f"{statistics.fmean(result['edits']):15.1f} {gap:>18}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Цена обновлений, которые бот не обрабатывает: правки сообщений, посты
+каналов, изменения участников, реакции.
+
+Смешанный поток (--irrelevant - доля ненужных) прогоняется через
+Application с реальными обработчиками CalorieCounterBot (заглушка
+Bot API в том же процессе) без фильтра и с UpdateTypeFilter; для
+ненужных обновлений считаются вызовы обработчиков (ответы бота),
+SQL-команды и время. Отдельно - приём webhook: разбор в Update против
+отбрасывания по allowed_updates до разбора, и объём JSON, который
+Telegram перестаёт присылать при узкой подписке.
+
+Запуск: python -m benchmarks.bench_update_filter [--updates 2000] [--irrelevant 0.3]
+"""
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+
+from telegram import Update
+
+import config
+from benchmarks.fake_telegram import load_bot
+from benchmarks.stub_bot_api import BOT_USER, StubBotAPI, make_message_update
+from update_filter import update_type
+from webhook_server import WebhookServer
+
+
+def make_irrelevant_update(update_id: int, user_id: int, kind: str) -> dict:
+    """Обновление типа, которым бот не пользуется"""
+    user = {'id': user_id, 'is_bot': False, 'first_name': 'Bench'}
+    chat = {'id': user_id, 'type': 'private', 'first_name': 'Bench'}
+    now = int(time.time())
+    if kind == 'edited_message':
+        message = make_message_update(update_id, user_id, 'привет, исправлено')['message']
+        message['edit_date'] = now
+        return {'update_id': update_id, 'edited_message': message}
+    if kind == 'channel_post':
+        return {'update_id': update_id, 'channel_post': {
+            'message_id': update_id, 'date': now, 'text': 'пост канала',
+            'chat': {'id': -1000000000000 - user_id, 'type': 'channel', 'title': 'Канал'}}}
+    if kind == 'my_chat_member':
+        return {'update_id': update_id, 'my_chat_member': {
+            'chat': chat, 'from': user, 'date': now,
+            'old_chat_member': {'user': BOT_USER, 'status': 'member'},
+            'new_chat_member': {'user': BOT_USER, 'status': 'kicked', 'until_date': 0}}}
+    return {'update_id': update_id, 'message_reaction': {
+        'chat': chat, 'message_id': 1, 'date': now, 'user': user,
+        'old_reaction': [], 'new_reaction': [{'type': 'emoji', 'emoji': '👍'}]}}
+
+
+IRRELEVANT_KINDS = ['edited_message', 'channel_post', 'my_chat_member', 'message_reaction']
+
+
+def make_stream(count: int, irrelevant: float, users: int, seed: int) -> list:
+    rng = random.Random(seed)
+    stream = []
+    for update_id in range(1, count + 1):
+        user_id = rng.randint(1, users)
+        if rng.random() < irrelevant:
+            stream.append(make_irrelevant_update(update_id, user_id, rng.choice(IRRELEVANT_KINDS)))
+        else:
+            stream.append(make_message_update(update_id, user_id, rng.choice(['/start', 'привет'])))
+    return stream
+
+
+async def run_application(bot_module, stream: list, with_filter: bool) -> dict:
+    api = await StubBotAPI().start()
+    config.TELEGRAM_BASE_URL = api.base_url
+    bot = bot_module.CalorieCounterBot()
+    application = bot.build_application()
+    if not with_filter:
+        application.remove_handler(application.handlers[-1][0], group=-1)
+    totals = {'relevant': {'time': 0.0, 'sql': 0, 'replies': 0, 'count': 0},
+              'irrelevant': {'time': 0.0, 'sql': 0, 'replies': 0, 'count': 0}}
+    statements = 0
+
+    def trace(sql):
+        nonlocal statements
+        statements += 1
+
+    try:
+        await application.initialize()
+        await bot.post_init(application)
+        await bot.db.set_trace_callback(trace)
+        for data in stream:
+            update = Update.de_json(data, application.bot)
+            bucket = totals['relevant' if update_type(update) == Update.MESSAGE else 'irrelevant']
+            sql_before, replies_before = statements, len(api.replies)
+            start = time.perf_counter()
+            await application.process_update(update)
+            # Запись приёмов и журналов идёт через очередь - дожидаемся её
+            await bot.db.flush_writes()
+            bucket['time'] += time.perf_counter() - start
+            bucket['sql'] += statements - sql_before
+            bucket['replies'] += len(api.replies) - replies_before
+            bucket['count'] += 1
+    finally:
+        await application.shutdown()
+        await bot.post_shutdown(application)
+        await api.stop()
+    if with_filter:
+        totals['dropped'] = bot.update_filter.dropped()
+    return totals
+
+
+def bench_webhook_accept(bot_module, stream: list, allowed_updates) -> float:
+    """Среднее время приёма одного ненужного обновления webhook-сервером, мкс"""
+    bot = bot_module.CalorieCounterBot()
+    application = bot.build_application()
+    server = WebhookServer(application, max_pending_updates=10 ** 9, allowed_updates=allowed_updates)
+    bodies = [json.dumps(data).encode() for data in stream if 'message' not in data]
+    start = time.perf_counter()
+    for body in bodies:
+        assert server._accept('POST', server.url_path, {}, body) == 200
+    elapsed = time.perf_counter() - start
+    while not application.update_queue.empty():
+        application.update_queue.get_nowait()
+    return elapsed / len(bodies) * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--irrelevant', type=float, default=0.3, help="доля ненужных обновлений")
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    stream = make_stream(args.updates, args.irrelevant, args.users, args.seed)
+    irrelevant = [data for data in stream if 'message' not in data]
+    irrelevant_bytes = sum(len(json.dumps(data)) for data in irrelevant)
+    print(f"{len(stream)} обновлений, ненужных {len(irrelevant)} "
+          f"({irrelevant_bytes / 1024:.0f} КБ JSON, которые Telegram не пришлёт при allowed_updates)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bot_module = load_bot(tmp, LOG_LEVEL='WARNING')
+        for n, with_filter in enumerate((False, True)):
+            config.DATABASE_PATH = f"{tmp}/filter{n}.db"
+            totals = await run_application(bot_module, stream, with_filter)
+            print("с фильтром:" if with_filter else "без фильтра:")
+            for name, bucket in (('нужные', totals['relevant']), ('ненужные', totals['irrelevant'])):
+                count = max(bucket['count'], 1)
+                print(f"  {name:<9} {bucket['count']:5d}  ответов {bucket['replies']:5d}  "
+                      f"SQL {bucket['sql']:6d}  {bucket['time'] / count * 1e6:8.0f} мкс/обновление")
+            if with_filter:
+                print(f"  отброшено: {totals['dropped']}")
+
+        allowed = [Update.MESSAGE]
+        parsed = bench_webhook_accept(bot_module, stream, None)
+        dropped = bench_webhook_accept(bot_module, stream, allowed)
+        print(f"webhook, приём ненужного обновления: разбор в Update {parsed:.0f} мкс, "
+              f"отброс по allowed_updates {dropped:.0f} мкс")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Polling против webhook через локальную заглушку Bot API.
+
+Бот (реальные обработчики CalorieCounterBot и БД во временном каталоге)
+получает --updates обновлений от --users пользователей (/start, /help,
+текст) с частотой --rate в секунду (0 - все сразу):
+  polling - обновления отдаются заглушкой через getUpdates;
+  webhook - POST на встроенный WebhookServer по --connections
+            соединениям, как это делает Telegram.
+"Сторона Telegram" (заглушка Bot API и отправка webhook) работает в
+отдельных процессах, чтобы не отнимать процессор у бота. Задержка -
+от появления обновления до ответа бота (sendMessage).
+
+Записанные обновления (JSON на строку) можно подать через --replay;
+они же проверяют webhook локально: неверный секрет должен давать 403.
+
+Запуск: python -m benchmarks.bench_webhook [--updates 2000] [--rate 0] [--concurrent-updates 1]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import statistics
+import tempfile
+import time
+
+import config
+from benchmarks.fake_telegram import load_bot
+from benchmarks.fixtures import percentile
+from benchmarks.stub_bot_api import StubBotAPI, load_updates, make_message_update
+
+SECRET = 'bench-secret-token'
+TEXTS = ['/start', '/help', 'привет']
+
+
+def synthetic_updates(count: int, users: int) -> list:
+    return [make_message_update(n + 1, n % users + 1, TEXTS[n % len(TEXTS)]) for n in range(count)]
+
+
+def summarize(updates: list, pushed_at: dict, side: dict) -> dict:
+    """Пропускная способность и задержка от появления обновления до ответа"""
+    by_chat = {}
+    for update in updates:
+        by_chat.setdefault(update['message']['chat']['id'], []).append(pushed_at[update['update_id']])
+    latencies = []
+    for reply in side['replies']:
+        arrivals = by_chat.get(reply['chat_id'])
+        if arrivals:
+            latencies.append((reply['at'] - arrivals.pop(0)) * 1000)
+    return {
+        'throughput': len(updates) / (side['replies'][-1]['at'] - min(pushed_at.values())),
+        'p50': statistics.median(latencies),
+        'p95': percentile(latencies, 0.95),
+        'api_calls': sum(side['calls'].values()),
+    }
+
+
+async def feed(updates: list, rate: float, deliver):
+    """Подача обновлений пачками по 10 с заданной частотой"""
+    if not rate:
+        await deliver(updates)
+        return
+    step = 10
+    for i in range(0, len(updates), step):
+        started = time.monotonic()
+        await deliver(updates[i:i + step])
+        await asyncio.sleep(max(0.0, step / rate - (time.monotonic() - started)))
+
+
+async def bot_api_side(conn, mode: str, updates: list, args: dict):
+    api = await StubBotAPI().start()
+    conn.send(api.base_url)
+    try:
+        # Ждём запуска бота; заглушка тем временем отвечает на getMe
+        await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+        if mode == 'polling':
+            await feed(updates, args['rate'], api.push)
+        await api.wait_replies(len(updates), timeout=args['timeout'])
+        conn.send({'replies': api.replies, 'calls': api.calls, 'pushed_at': api.pushed_at})
+    finally:
+        await api.stop()
+
+
+async def post_update(reader, writer, path: str, update: dict, secret: str) -> int:
+    """POST обновления по открытому keep-alive соединению; возвращает HTTP-статус"""
+    body = json.dumps(update).encode('utf-8')
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+        f"X-Telegram-Bot-Api-Secret-Token: {secret}\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body
+    )
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    return int(head.split(b' ', 2)[1])
+
+
+async def webhook_side(conn, port: int, path: str, updates: list, args: dict):
+    # Отправка через голые asyncio-потоки: httpx на одном ядре отнимал бы
+    # у бота больше процессора, чем стоит приём обновления на стороне бота
+    connections = [await asyncio.open_connection('127.0.0.1', port) for _ in range(args['connections'])]
+    reader, writer = connections[0]
+    assert await post_update(reader, writer, path, updates[0], 'wrong') == 403
+    reader, writer = connections[0] = await asyncio.open_connection('127.0.0.1', port)
+    pushed_at = {}
+    idle = asyncio.Queue()
+    for connection in connections:
+        idle.put_nowait(connection)
+
+    async def post(update):
+        reader, writer = await idle.get()
+        try:
+            assert await post_update(reader, writer, path, update, SECRET) == 200
+        finally:
+            idle.put_nowait((reader, writer))
+
+    async def deliver(batch):
+        now = time.monotonic()
+        for update in batch:
+            pushed_at[update['update_id']] = now
+        await asyncio.gather(*(post(update) for update in batch))
+
+    await feed(updates, args['rate'], deliver)
+    for _, writer in connections:
+        writer.close()
+    conn.send(pushed_at)
+
+
+def run_side(side, *args):
+    """Точка входа процесса "Telegram" (заглушка Bot API или отправка webhook)"""
+    asyncio.run(side(*args))
+
+
+async def run_bot(mode: str, updates: list, args) -> tuple:
+    side_args = {'rate': args.rate, 'connections': args.connections, 'timeout': args.timeout}
+    context = multiprocessing.get_context('spawn')
+    loop = asyncio.get_running_loop()
+    api_conn, child_conn = context.Pipe()
+    api_side = context.Process(target=run_side, args=(bot_api_side, child_conn, mode, updates, side_args))
+    api_side.start()
+    with tempfile.TemporaryDirectory() as tmp:
+        bot_module = load_bot(tmp, CONCURRENT_UPDATES=args.concurrent_updates, LOG_LEVEL='WARNING')
+        config.DATABASE_PATH = f"{tmp}/{mode}.db"
+        config.TELEGRAM_BASE_URL = api_conn.recv()
+        bot = bot_module.CalorieCounterBot()
+        application = bot.build_application()
+        await application.initialize()
+        await bot.post_init(application)
+        await application.start()
+        server = None
+        try:
+            if mode == 'polling':
+                await application.updater.start_polling(poll_interval=0, timeout=10)
+                api_conn.send(None)
+            else:
+                server = bot.create_webhook_server(application, port=0, secret_token=SECRET)
+                server.listen = '127.0.0.1'
+                await server.start()
+                api_conn.send(None)
+                sender_conn, child_conn = context.Pipe()
+                sender = context.Process(target=run_side, args=(webhook_side, child_conn, server.bound_port,
+                                                                server.url_path, updates, side_args))
+                sender.start()
+                pushed_at = await loop.run_in_executor(None, sender_conn.recv)
+                sender.join()
+            side = await loop.run_in_executor(None, api_conn.recv)
+        finally:
+            if server is not None:
+                await server.stop(drain_timeout=5)
+            if application.updater.running:
+                await application.updater.stop()
+            await application.stop()
+            await application.shutdown()
+            await bot.post_shutdown(application)
+            api_side.join(timeout=10)
+    if mode == 'polling':
+        pushed_at = side['pushed_at']
+    return summarize(updates, pushed_at, side), server.stats if server else None
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=0, help="обновлений в секунду, 0 - все сразу")
+    parser.add_argument('--connections', type=int, default=40, help="соединений Telegram к webhook")
+    parser.add_argument('--concurrent-updates', type=int, default=config.CONCURRENT_UPDATES)
+    parser.add_argument('--replay', help="файл с записанными обновлениями (JSON на строку)")
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+
+    updates = load_updates(args.replay) if args.replay else synthetic_updates(args.updates, args.users)
+    print(f"{len(updates)} обновлений, частота {args.rate or 'без ограничения'}, "
+          f"одновременно обрабатывается {args.concurrent_updates}")
+
+    for mode in ('polling', 'webhook'):
+        result, server_stats = await run_bot(mode, updates, args)
+        print(f"{mode:<8} {result['throughput']:>8.0f} обн/с  p50={result['p50']:.1f} мс  "
+              f"p95={result['p95']:.1f} мс  вызовов Bot API: {result['api_calls']}")
+        if server_stats:
+            print(f"         webhook-сервер: {server_stats}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
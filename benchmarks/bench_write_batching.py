@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Пакетная запись при --handlers одновременных обработчиках фото.
+
+Каждый обработчик повторяет путь handle_photo по БД: резерв анализа,
+журнал запроса, дневная статистика, приём пищи, подтверждение резерва.
+Анализ заменён задержкой --analysis-ms. Сравниваются режимы записи
+Database: immediate (транзакция на запись), group и deferred (очередь
+WriteBehindQueue). Считаются COMMIT-ы (через trace-callback), фото/с,
+задержка обработчика и средний размер пачки (db_write_batch_operations).
+
+Запуск: python -m benchmarks.bench_write_batching [--handlers 100] [--photos 1000] [--analysis-ms 50]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from benchmarks.fixtures import percentile
+from database import DB_WRITE_BATCH, Database
+from metrics import REGISTRY
+
+USERS = 100
+
+
+def seed_keys(db_path: str):
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("""
+            INSERT INTO access_keys (key_code, key_type, image_limit, activated_by)
+            VALUES (?, 'unlimited', NULL, ?)
+        """, [(f"key-{u}", u) for u in range(1, USERS + 1)])
+
+
+async def photo_handler(db: Database, user_id: int, analysis_s: float, latencies: list):
+    start = time.perf_counter()
+    reservation = await db.reserve_image_quota(user_id)
+    await db.log_request(user_id, 'image')
+    await asyncio.sleep(analysis_s * random.uniform(0.5, 1.5))
+    await db.get_daily_calories(user_id)
+    await db.get_user_daily_limit(user_id)
+    await db.add_meal(user_id, 'Бенчмарк', 350.0, weight=250.0, protein=20.0,
+                      fat=10.0, carbs=40.0, image_processed=True)
+    await db.commit_image_quota(reservation)
+    await db.check_user_access(user_id)
+    latencies.append((time.perf_counter() - start) * 1000)
+
+
+async def run_mode(mode: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        db = Database(db_path, write_mode=mode)
+        REGISTRY.reset()
+        try:
+            await db.init_db()
+            seed_keys(db_path)
+            commits = 0
+
+            def trace(sql):
+                nonlocal commits
+                if sql.strip().upper() == 'COMMIT':
+                    commits += 1
+
+            await db.set_trace_callback(trace)
+            latencies = []
+            limiter = asyncio.Semaphore(args.handlers)
+
+            async def one(n):
+                async with limiter:
+                    await photo_handler(db, n % USERS + 1, args.analysis_ms / 1000, latencies)
+
+            random.seed(1)
+            start = time.perf_counter()
+            await asyncio.gather(*(one(n) for n in range(args.photos)))
+            elapsed = time.perf_counter() - start
+            await db.close()  # сброс очереди - её commit тоже учитывается
+
+            with sqlite3.connect(db_path) as conn:
+                meals = conn.execute("SELECT COUNT(*) FROM meals").fetchone()[0]
+                usage = conn.execute("SELECT COUNT(*) FROM key_usage").fetchone()[0]
+                logged = conn.execute("SELECT COUNT(*) FROM requests_log").fetchone()[0]
+            assert meals == usage == logged == args.photos, (meals, usage, logged)
+        finally:
+            await db.close()
+
+    return {
+        'commits': commits,
+        'throughput': args.photos / elapsed,
+        'p50': statistics.median(latencies),
+        'p95': percentile(latencies, 0.95),
+        'avg_batch': DB_WRITE_BATCH.labels().sum / DB_WRITE_BATCH.labels().count if db.write_queue else 1,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--handlers', type=int, default=100)
+    parser.add_argument('--photos', type=int, default=1000)
+    parser.add_argument('--analysis-ms', type=float, default=50)
+    args = parser.parse_args()
+
+    print(f"{args.photos} фото, {args.handlers} одновременных обработчиков")
+    print(f"{'режим':<10} {'COMMIT':>7} {'на фото':>8} {'фото/с':>8} {'p50, мс':>8} "
+          f"{'p95, мс':>8} {'пачка':>6}")
+    for mode in ('immediate', 'group', 'deferred'):
+        r = await run_mode(mode, args)
+        print(f"{mode:<10} {r['commits']:>7} {r['commits'] / args.photos:>8.2f} "
+              f"{r['throughput']:>8.0f} {r['p50']:>8.1f} {r['p95']:>8.1f} {r['avg_batch']:>6.1f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
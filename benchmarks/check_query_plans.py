@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Проверка планов горячих запросов Database через EXPLAIN QUERY PLAN.
+
+Скрипт вызывает реальные методы Database на временной базе, перехватывает
+выполненные SELECT- и UPDATE-запросы через trace-callback и проверяет, что каждый
+из них обслуживается ожидаемым индексом, а не полным сканированием таблицы.
+Код возврата 1, если хотя бы одна проверка не прошла.
+
+Запуск: python -m benchmarks.check_query_plans
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+
+from database import Database
+
+# Метод -> индексы (или первичные ключи), которые должны встретиться в планах его запросов
+EXPECTED_INDEXES = {
+    'check_user_access': {'idx_access_keys_activated_by'},
+    'log_key_usage': {'idx_access_keys_activated_by'},
+    'check_rate_limit': {'idx_requests_log_user_time'},
+    'get_daily_calories': {'daily_totals USING PRIMARY KEY'},
+    'get_user_meals_today': {'idx_meals_user_time'},
+    'photo_preflight': {'idx_access_keys_activated_by', 'daily_totals USING PRIMARY KEY'},
+    'get_period_totals': {'daily_totals USING PRIMARY KEY'},
+}
+
+HOT_TABLES = ('meals', 'requests_log', 'access_keys', 'key_usage', 'daily_totals')
+
+
+async def capture_queries(db: Database, coro_factory) -> list:
+    """SELECT- и UPDATE-запросы, выполненные во время вызова метода"""
+    captured = []
+
+    def trace(sql: str):
+        if sql.lstrip().upper().startswith(('SELECT', 'UPDATE')):
+            captured.append(sql)
+
+    await db.set_trace_callback(trace)
+    try:
+        await coro_factory()
+    finally:
+        await db.set_trace_callback(None)
+    return captured
+
+
+def query_plan(db_path: str, sql: str) -> list:
+    with sqlite3.connect(db_path) as conn:
+        return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+async def seed(db: Database):
+    await db.init_db()
+    for user_id in range(1, 51):
+        await db.add_user(user_id, f"user{user_id}", "Plan")
+        await db.add_access_key(f"PLAN-{user_id}", 'limited', 20)
+        await db.activate_key(f"PLAN-{user_id}", user_id)
+        for _ in range(5):
+            await db.add_meal(user_id, 'Каша', 300, weight=250, protein=10, fat=5, carbs=50)
+            await db.log_request(user_id, 'image')
+            await db.log_key_usage(user_id)
+
+
+async def main() -> int:
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'plans.db')
+        # Без кэша доступа, чтобы каждый вызов действительно шёл в SQLite
+        db = Database(db_path, access_cache=False)
+        try:
+            await seed(db)
+
+            calls = {
+                'check_user_access': lambda: db.check_user_access(7),
+                'log_key_usage': lambda: db.log_key_usage(7),
+                'check_rate_limit': lambda: db.check_rate_limit(7),
+                'get_daily_calories': lambda: db.get_daily_calories(7),
+                'get_user_meals_today': lambda: db.get_user_meals_today(7),
+                'photo_preflight': lambda: db.photo_preflight(7),
+                'get_period_totals': lambda: db.get_period_totals(7, days=30),
+            }
+            for method, call in calls.items():
+                queries = await capture_queries(db, call)
+                plans = [line for sql in queries for line in query_plan(db_path, sql)]
+                used = {index for index in EXPECTED_INDEXES[method] if any(index in line for line in plans)}
+                scans = [line for line in plans
+                         if line.startswith('SCAN') and any(f' {t}' in line for t in HOT_TABLES)
+                         and 'INDEX' not in line]
+                ok = used == EXPECTED_INDEXES[method] and not scans
+                failures += not ok
+                print(f"{'✅' if ok else '❌'} {method}")
+                for line in plans:
+                    print(f"     {line}")
+                if not ok:
+                    missing = EXPECTED_INDEXES[method] - used
+                    if missing:
+                        print(f"     не использованы индексы: {', '.join(sorted(missing))}")
+        finally:
+            await db.close()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,15 @@
+"""
+Микробенчмарки Database на реалистичных объёмах данных
+
+generator.py строит детерминированный набор данных (пользователи,
+приёмы пищи, ключи, key_usage, requests_log, daily_totals) нужного
+масштаба и кэширует файл БД; cases.py - замеряемые вызовы; runner.py
+гоняет их раундами (прогрев, медиана, межквартильный размах, SQL на
+вызов) и пишет результаты в JSON; compare.py сравнивает два JSON и
+завершается с кодом 1 при регрессии.
+
+Запуск:
+  python -m benchmarks.dbbench run --scale small --output before.json
+  python -m benchmarks.dbbench run --scale small --output after.json
+  python -m benchmarks.dbbench compare before.json after.json --threshold 0.1
+"""
@@ -0,0 +1,87 @@
+"""
+python -m benchmarks.dbbench generate|run|compare ...
+
+  generate  создать (или найти в кэше) набор данных
+  run       прогнать случаи и записать JSON (--output)
+  compare   сравнить два JSON, код выхода 1 при регрессии
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+
+from benchmarks.dbbench import compare as compare_results
+from benchmarks.dbbench import runner
+from benchmarks.dbbench.cases import CASES
+from benchmarks.dbbench.generator import SCALES, ensure_dataset, resolve_scale
+
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), 'caloriecounter-dbbench')
+
+
+def add_dataset_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--users', type=int, help="переопределить число пользователей масштаба")
+    parser.add_argument('--days', type=int, help="переопределить число дней истории")
+    parser.add_argument('--meals-per-day', type=int, help="переопределить среднее число приёмов пищи в день")
+    parser.add_argument('--spare-keys', type=int, help="свободных ключей для activate_key")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help="каталог кэша наборов данных")
+    parser.add_argument('--regenerate', action='store_true', help="пересоздать набор данных")
+
+
+def dataset(args):
+    params = resolve_scale(args.scale, users=args.users, days=args.days,
+                           meals_per_day=args.meals_per_day, spare_keys=args.spare_keys)
+    path, meta = ensure_dataset(args.data_dir, params, args.seed, regenerate=args.regenerate)
+    rows = ', '.join(f"{table} {count:,}".replace(',', ' ') for table, count in meta['rows'].items())
+    print(f"набор данных {os.path.basename(path)} ({meta['size_bytes'] / 2 ** 20:.0f} МиБ, "
+          f"создан за {meta['generation_seconds']} с): {rows}")
+    return path, meta
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.dbbench', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate_parser = commands.add_parser('generate', help="создать набор данных")
+    add_dataset_arguments(generate_parser)
+
+    run_parser = commands.add_parser('run', help="прогнать бенчмарки")
+    add_dataset_arguments(run_parser)
+    run_parser.add_argument('--cases', help=f"через запятую, по умолчанию все: {', '.join(CASES)}")
+    run_parser.add_argument('--rounds', type=int, default=20)
+    run_parser.add_argument('--iterations', type=int, default=50, help="вызовов в раунде")
+    run_parser.add_argument('--warmup', type=int, default=2, help="раундов прогрева")
+    run_parser.add_argument('--output', help="файл результатов JSON")
+
+    compare_parser = commands.add_parser('compare', help="сравнить результаты")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help="допустимый рост медианы (доля)")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s %(name)s: %(message)s')
+
+    if args.command == 'compare':
+        lines, regressions = compare_results.compare(compare_results.load(args.baseline),
+                                                     compare_results.load(args.current), args.threshold)
+        print('\n'.join(lines))
+        if regressions:
+            print(f"регрессии: {', '.join(regressions)}")
+            return 1
+        return 0
+
+    path, meta = dataset(args)
+    if args.command == 'run':
+        names = args.cases.split(',') if args.cases else list(CASES)
+        runner.run(path, meta, names, rounds=args.rounds, iterations=args.iterations,
+                   warmup=args.warmup, seed=args.seed, output=args.output)
+        if args.output:
+            print(f"результаты: {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+Замеряемые вызовы Database
+
+Каждый случай - корутина от BenchContext, выполняющая один вызов;
+регистрируется декоратором @case. Пользователи выбираются случайно
+(детерминированно по seed) среди пользователей набора данных.
+"""
+import random
+from typing import Callable, Dict, Optional
+
+from benchmarks.dbbench.generator import spare_key_code
+from database import Database
+
+CASES: Dict[str, Dict] = {}
+
+
+def case(name: str, description: str, setup: Optional[Callable] = None):
+    """Регистрация случая бенчмарка; setup(ctx) выполняется перед прогревом, без замера"""
+    def register(func: Callable):
+        CASES[name] = {'func': func, 'description': description, 'setup': setup}
+        return func
+    return register
+
+
+class BenchContext:
+    """Состояние для случаев: БД, набор данных, генератор случайных чисел"""
+
+    def __init__(self, db: Database, db_uncached: Database, meta: Dict, seed: int):
+        self.db = db
+        self.db_uncached = db_uncached
+        self.meta = meta
+        self.users = meta['params']['users']
+        self.spare_keys = meta['params']['spare_keys']
+        self.rng = random.Random(seed)
+        self._next_spare = 0
+
+    def random_user(self) -> int:
+        return self.rng.randint(1, self.users)
+
+    def next_spare(self) -> int:
+        """Номер следующего свободного ключа (и пользователя без ключа)"""
+        self._next_spare += 1
+        if self._next_spare > self.spare_keys:
+            raise RuntimeError("Свободные ключи закончились - увеличьте --spare-keys "
+                               "или уменьшите --rounds/--iterations")
+        return self._next_spare
+
+
+@case('get_daily_calories', "итоги дня в поясе по умолчанию (daily_totals)")
+async def get_daily_calories(ctx: BenchContext):
+    await ctx.db.get_daily_calories(ctx.random_user())
+
+
+@case('get_daily_calories[tz]', "итоги дня в другом поясе (сумма по meals)")
+async def get_daily_calories_tz(ctx: BenchContext):
+    await ctx.db.get_daily_calories(ctx.random_user(), tz='Asia/Vladivostok')
+
+
+@case('get_user_meals_today', "приёмы пищи за сегодня")
+async def get_user_meals_today(ctx: BenchContext):
+    await ctx.db.get_user_meals_today(ctx.random_user())
+
+
+async def warm_access_cache(ctx: BenchContext):
+    for user_id in range(1, ctx.users + 1):
+        await ctx.db.check_user_access(user_id)
+
+
+@case('check_user_access', "доступ по ключу, кэш состояния ключей прогрет", setup=warm_access_cache)
+async def check_user_access(ctx: BenchContext):
+    await ctx.db.check_user_access(ctx.random_user())
+
+
+@case('check_user_access[uncached]', "доступ по ключу без кэша (запрос к SQLite)")
+async def check_user_access_uncached(ctx: BenchContext):
+    await ctx.db_uncached.check_user_access(ctx.random_user())
+
+
+@case('check_rate_limit', "запросы пользователя за минуту (requests_log)")
+async def check_rate_limit(ctx: BenchContext):
+    await ctx.db.check_rate_limit(ctx.random_user())
+
+
+@case('activate_key', "активация свободного ключа пользователем без ключа")
+async def activate_key(ctx: BenchContext):
+    n = ctx.next_spare()
+    result = await ctx.db.activate_key(spare_key_code(n), ctx.users + n)
+    if not result['success']:
+        raise RuntimeError(f"activate_key: {result['message']}")
@@ -0,0 +1,51 @@
+"""
+Сравнение двух файлов результатов runner.py
+
+Регрессия - медиана выросла больше чем на threshold (доля) и
+межквартильные интервалы не пересекаются (q1 нового прогона выше q3
+старого - иначе это шум между прогонами), или выросло число
+SQL-команд на вызов. Разные наборы данных (масштаб, seed, версия
+генератора) сравнивать бессмысленно - об этом выводится предупреждение.
+"""
+import json
+from typing import Dict, List, Tuple
+
+
+def load(path: str) -> Dict:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(baseline: Dict, current: Dict, threshold: float = 0.1) -> Tuple[List[str], List[str]]:
+    """Строки отчёта и имена случаев с регрессией"""
+    lines = []
+    base_data, data = baseline['dataset'], current['dataset']
+    for field in ('params', 'seed', 'generator_version'):
+        if base_data.get(field) != data.get(field):
+            lines.append(f"ВНИМАНИЕ: разные наборы данных ({field}): {base_data.get(field)} -> {data.get(field)}")
+    base_commit = (baseline.get('commit_info') or {}).get('id') or '?'
+    commit = (current.get('commit_info') or {}).get('id') or '?'
+    lines.append(f"{base_commit[:10]} -> {commit[:10]}, порог {threshold:.0%}")
+    lines.append(f"  {'случай':<28} {'было, мкс':>10} {'стало, мкс':>10} {'изм.':>8} {'SQL/вызов':>12}")
+
+    regressions = []
+    base_benchmarks = {bench['name']: bench for bench in baseline['benchmarks']}
+    for bench in current['benchmarks']:
+        name = bench['name']
+        before = base_benchmarks.pop(name, None)
+        if before is None:
+            lines.append(f"  {name:<28} {'-':>10} {bench['stats']['median'] * 1e6:10.1f}   новый")
+            continue
+        old, new = before['stats']['median'], bench['stats']['median']
+        change = new / old - 1 if old else 0.0
+        old_sql = before['extra_info']['sql_per_call']
+        new_sql = bench['extra_info']['sql_per_call']
+        slower = change > threshold and bench['stats']['q1'] > before['stats']['q3']
+        regressed = slower or new_sql > old_sql + 1e-9
+        if regressed:
+            regressions.append(name)
+        lines.append(f"  {name:<28} {old * 1e6:10.1f} {new * 1e6:10.1f} {change:+8.1%} "
+                     f"{old_sql:5.1f} -> {new_sql:<4.1f}{'  РЕГРЕССИЯ' if regressed else ''}")
+    for name in base_benchmarks:
+        lines.append(f"  {name:<28} нет в новых результатах")
+    return lines, regressions
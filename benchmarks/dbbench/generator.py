@@ -0,0 +1,228 @@
+"""
+Детерминированный генератор данных для бенчмарков Database
+
+Одинаковые масштаб и seed дают одинаковые строки; «сегодня» - день
+генерации (запросы бота привязаны к текущей дате), поэтому он входит
+в ключ кэша и набор пересоздаётся на следующий день.
+
+Строки пишутся в порядке времени по всем пользователям сразу, как их
+пишет бот, чтобы соседние по rowid строки принадлежали разным
+пользователям. daily_totals и access_keys.images_used считаются при
+генерации и согласованы с meals и key_usage.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import config
+from database import SQLITE_TIMESTAMP_FORMAT, Database
+
+logger = logging.getLogger(__name__)
+
+# Менять при любом изменении логики генерации - старые наборы станут недействительны
+GENERATOR_VERSION = 1
+
+# Масштабы: large - десятки миллионов строк в meals и key_usage
+SCALES = {
+    'tiny': {'users': 200, 'days': 14, 'meals_per_day': 4},
+    'small': {'users': 1_000, 'days': 30, 'meals_per_day': 4},
+    'medium': {'users': 10_000, 'days': 90, 'meals_per_day': 4},
+    'large': {'users': 50_000, 'days': 180, 'meals_per_day': 4},
+}
+
+DEFAULT_OPTIONS = {
+    'image_share': 0.9,        # доля приёмов пищи по фото (строка key_usage и запрос 'image')
+    'unlimited_share': 0.2,    # доля безлимитных ключей
+    'active_day_share': 0.7,   # вероятность, что пользователь ест с ботом в данный день
+    'log_days': config.REQUESTS_LOG_RETENTION_DAYS,  # сырые строки requests_log за последние N дней
+    'spare_keys': 5_000,       # свободные ключи и пользователи без ключа для activate_key
+}
+
+PRODUCTS = [
+    ('Овсяная каша', 250, 1.1), ('Гречка с курицей', 300, 1.5), ('Салат Цезарь', 220, 1.9),
+    ('Борщ', 350, 0.6), ('Омлет', 180, 1.6), ('Паста карбонара', 320, 2.3),
+    ('Творог', 200, 1.2), ('Яблоко', 150, 0.5), ('Плов', 300, 2.0), ('Сырники', 200, 2.2),
+]
+
+BATCH_SIZE = 50_000
+
+
+def resolve_scale(name: str, **overrides) -> Dict:
+    """Параметры масштаба: пресет SCALES[name] с переопределениями (None пропускаются)"""
+    params = dict(SCALES[name])
+    params.update(DEFAULT_OPTIONS)
+    params.update({key: value for key, value in overrides.items() if value is not None})
+    return params
+
+
+def dataset_id(params: Dict, seed: int, anchor_day: str) -> str:
+    """Ключ кэша набора данных"""
+    source = json.dumps({'params': params, 'seed': seed, 'anchor_day': anchor_day,
+                         'timezone': config.DEFAULT_TIMEZONE, 'version': GENERATOR_VERSION},
+                        sort_keys=True)
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]
+
+
+def spare_key_code(n: int) -> str:
+    return f"SPARE{n:08d}"
+
+
+def _meal_row(rng: random.Random, user_id: int, meal_time: str, image: bool) -> tuple:
+    name, base_weight, density = rng.choice(PRODUCTS)
+    weight = round(base_weight * rng.uniform(0.6, 1.5))
+    calories = round(weight * density, 1)
+    protein = round(calories * rng.uniform(0.15, 0.35) / 4, 1)
+    fat = round(calories * rng.uniform(0.2, 0.4) / 9, 1)
+    carbs = round(max(calories - protein * 4 - fat * 9, 0) / 4, 1)
+    return (user_id, name, weight, calories, protein, fat, carbs, meal_time, int(image))
+
+
+def _flush(conn: sqlite3.Connection, rows: Dict[str, list]):
+    statements = {
+        'meals': """INSERT INTO meals (user_id, product_name, weight, calories, protein, fat, carbs,
+                                       meal_time, image_processed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        'key_usage': "INSERT INTO key_usage (user_id, key_id, usage_type, used_at) VALUES (?, ?, ?, ?)",
+        'requests_log': "INSERT INTO requests_log (user_id, request_type, request_time) VALUES (?, ?, ?)",
+        'daily_totals': """INSERT INTO daily_totals (user_id, day, calories, protein, fat, carbs, meal_count)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+    }
+    for table, batch in rows.items():
+        if batch:
+            conn.executemany(statements[table], batch)
+            batch.clear()
+
+
+def generate(path: str, params: Dict, seed: int, anchor_day: Optional[str] = None) -> Dict:
+    """
+    Создание набора данных в path (файл перезаписывается)
+
+    Схема создаётся Database.init_db(), строки пишутся напрямую через
+    sqlite3 пачками по дню. Возвращает метаданные набора (они же
+    сохраняются рядом в <path>.json).
+    """
+    tz = ZoneInfo(config.DEFAULT_TIMEZONE)
+    anchor = datetime.strptime(anchor_day, "%Y-%m-%d").date() if anchor_day else datetime.now(tz).date()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    started = time.perf_counter()
+
+    async def create_schema():
+        db = Database(path, default_timezone=config.DEFAULT_TIMEZONE, storage_profile=config.DB_STORAGE_PROFILE)
+        await db.init_db()
+        await db.close()
+
+    asyncio.run(create_schema())
+
+    rng = random.Random(seed)
+    users = params['users']
+    # Активность пользователя: множитель к meals_per_day
+    activity = [rng.lognormvariate(0, 0.5) for _ in range(users + 1)]
+    images_used = [0] * (users + 1)
+    counts = {'meals': 0, 'key_usage': 0, 'requests_log': 0, 'daily_totals': 0}
+    created_at = (datetime.combine(anchor - timedelta(days=params['days']), datetime.min.time())
+                  .strftime(SQLITE_TIMESTAMP_FORMAT))
+
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA cache_size = -262144")
+        conn.executemany(
+            "INSERT INTO users (user_id, username, first_name, created_at) VALUES (?, ?, ?, ?)",
+            ((user_id, f"user{user_id}", "Bench", created_at)
+             for user_id in range(1, users + params['spare_keys'] + 1))
+        )
+        conn.commit()
+
+        rows = {table: [] for table in counts}
+        for days_ago in range(params['days'] - 1, -1, -1):
+            day = anchor - timedelta(days=days_ago)
+            day_start = datetime(day.year, day.month, day.day, 7, tzinfo=tz).astimezone(timezone.utc)
+            log_day = days_ago < params['log_days']
+            meals = []
+            for user_id in range(1, users + 1):
+                if rng.random() >= params['active_day_share']:
+                    continue
+                count = min(int(activity[user_id] * params['meals_per_day'] + rng.random()), 20)
+                for _ in range(count):
+                    # С 07:00 до 23:00 по местному времени
+                    meals.append((rng.randrange(16 * 3600), user_id, rng.random() < params['image_share']))
+            meals.sort()
+            totals: Dict[int, list] = {}
+            for offset, user_id, image in meals:
+                meal_time = (day_start + timedelta(seconds=offset)).strftime(SQLITE_TIMESTAMP_FORMAT)
+                row = _meal_row(rng, user_id, meal_time, image)
+                rows['meals'].append(row)
+                total = totals.setdefault(user_id, [0.0, 0.0, 0.0, 0.0, 0])
+                total[0] += row[3]
+                total[1] += row[4]
+                total[2] += row[5]
+                total[3] += row[6]
+                total[4] += 1
+                if image:
+                    rows['key_usage'].append((user_id, user_id, 'image', meal_time))
+                    images_used[user_id] += 1
+                    if log_day:
+                        rows['requests_log'].append((user_id, 'image', meal_time))
+                if len(rows['meals']) >= BATCH_SIZE:
+                    for table, batch in rows.items():
+                        counts[table] += len(batch)
+                    _flush(conn, rows)
+            rows['daily_totals'].extend((user_id, day.isoformat(), *total) for user_id, total in totals.items())
+            for table, batch in rows.items():
+                counts[table] += len(batch)
+            _flush(conn, rows)
+            conn.commit()
+
+        # Ключ пользователя N имеет id N (на него ссылается key_usage.key_id)
+        keys = []
+        for user_id in range(1, users + 1):
+            unlimited = rng.random() < params['unlimited_share']
+            keys.append((user_id, f"BENCH{user_id:08d}", 'unlimited' if unlimited else 'limited',
+                         None if unlimited else images_used[user_id] + 100_000,
+                         user_id, created_at, images_used[user_id]))
+        keys.extend((users + n, spare_key_code(n), 'limited', 100, None, None, 0)
+                    for n in range(1, params['spare_keys'] + 1))
+        conn.executemany("""
+            INSERT INTO access_keys (id, key_code, key_type, image_limit, activated_by, activated_at, images_used)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, keys)
+        conn.commit()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+
+    meta = {
+        'id': dataset_id(params, seed, anchor.isoformat()),
+        'params': params,
+        'seed': seed,
+        'anchor_day': anchor.isoformat(),
+        'timezone': config.DEFAULT_TIMEZONE,
+        'generator_version': GENERATOR_VERSION,
+        'rows': dict(counts, users=users + params['spare_keys'], access_keys=len(keys)),
+        'size_bytes': os.path.getsize(path),
+        'generation_seconds': round(time.perf_counter() - started, 1),
+    }
+    with open(path + '.json', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return meta
+
+
+def ensure_dataset(data_dir: str, params: Dict, seed: int, regenerate: bool = False) -> Tuple[str, Dict]:
+    """Путь к набору данных и его метаданные; набор создаётся, если его нет в data_dir"""
+    anchor_day = datetime.now(ZoneInfo(config.DEFAULT_TIMEZONE)).date().isoformat()
+    path = os.path.join(data_dir, f"dbbench-{dataset_id(params, seed, anchor_day)}.db")
+    if not regenerate and os.path.exists(path) and os.path.exists(path + '.json'):
+        with open(path + '.json', encoding='utf-8') as f:
+            return path, json.load(f)
+    os.makedirs(data_dir, exist_ok=True)
+    logger.info("Генерация набора данных %s: %s", os.path.basename(path), params)
+    return path, generate(path, params, seed, anchor_day)
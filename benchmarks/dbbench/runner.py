@@ -0,0 +1,178 @@
+"""
+Прогон случаев в стиле pytest-benchmark
+
+Для каждого случая: --warmup раундов прогрева, затем --rounds раундов
+по --iterations вызовов; время вызова в раунде - время раунда,
+делённое на число вызовов. Статистика по раундам (min, max, mean,
+stddev, median, q1, q3, iqr, ops) и число SQL-команд на вызов
+записываются в JSON вместе с описанием машины, коммита и набора данных.
+"""
+import asyncio
+import json
+import platform
+import sqlite3
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+import aiosqlite
+
+import config
+from benchmarks.dbbench.cases import CASES, BenchContext
+from database import Database
+
+RESULTS_VERSION = 1
+
+
+def round_stats(times: List[float]) -> Dict:
+    """Статистика по временам раундов (секунды на вызов)"""
+    ordered = sorted(times)
+    if len(ordered) >= 2:
+        q1, _, q3 = statistics.quantiles(ordered, n=4, method='inclusive')
+    else:
+        q1 = q3 = ordered[0]
+    mean = statistics.fmean(ordered)
+    return {
+        'min': ordered[0],
+        'max': ordered[-1],
+        'mean': mean,
+        'stddev': statistics.stdev(ordered) if len(ordered) >= 2 else 0.0,
+        'median': statistics.median(ordered),
+        'q1': q1,
+        'q3': q3,
+        'iqr': q3 - q1,
+        'ops': 1 / mean if mean else 0.0,
+        'rounds': len(ordered),
+    }
+
+
+def machine_info() -> Dict:
+    return {
+        'node': platform.node(),
+        'machine': platform.machine(),
+        'system': platform.system(),
+        'release': platform.release(),
+        'python_version': platform.python_version(),
+        'sqlite_version': sqlite3.sqlite_version,
+        'aiosqlite_version': getattr(aiosqlite, '__version__', None),
+    }
+
+
+def commit_info() -> Dict:
+    """Текущий коммит git (пусто, если git недоступен)"""
+    def git(*args) -> Optional[str]:
+        try:
+            return subprocess.run(['git', *args], capture_output=True, text=True, check=True,
+                                  timeout=30).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    return {
+        'id': git('rev-parse', 'HEAD'),
+        'branch': git('rev-parse', '--abbrev-ref', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+    }
+
+
+def open_database(path: str, access_cache: bool = True) -> Database:
+    return Database(
+        path,
+        read_pool_size=config.DB_READ_POOL_SIZE,
+        storage_profile=config.DB_STORAGE_PROFILE,
+        default_timezone=config.DEFAULT_TIMEZONE,
+        access_cache=access_cache,
+        write_mode=config.DB_WRITE_MODE,
+        write_flush_interval=config.DB_WRITE_FLUSH_INTERVAL,
+        write_batch_size=config.DB_WRITE_BATCH_SIZE
+    )
+
+
+def reset_spare_keys(path: str, meta: Dict):
+    """Возврат свободных ключей в исходное состояние (activate_key их занимает)"""
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("""
+            UPDATE access_keys SET activated_by = NULL, activated_at = NULL
+            WHERE id > ? AND activated_by IS NOT NULL
+        """, (meta['params']['users'],))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+async def run_cases(path: str, meta: Dict, names: Iterable[str], rounds: int, iterations: int,
+                    warmup: int, seed: int, progress=print) -> List[Dict]:
+    """Прогон случаев names на наборе данных path; возвращает записи benchmarks для JSON"""
+    reset_spare_keys(path, meta)
+    db = open_database(path)
+    db_uncached = open_database(path, access_cache=False)
+    statements = 0
+
+    def trace(sql):
+        nonlocal statements
+        statements += 1
+
+    results = []
+    try:
+        await db.open()
+        await db_uncached.open()
+        for name in names:
+            func = CASES[name]['func']
+            context = BenchContext(db, db_uncached, meta, seed)
+            if CASES[name]['setup'] is not None:
+                await CASES[name]['setup'](context)
+            for _ in range(warmup * iterations):
+                await func(context)
+            await db.set_trace_callback(trace)
+            await db_uncached.set_trace_callback(trace)
+            statements = 0
+            times = []
+            for _ in range(rounds):
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    await func(context)
+                times.append((time.perf_counter() - start) / iterations)
+            await db.flush_writes()
+            await db.set_trace_callback(None)
+            await db_uncached.set_trace_callback(None)
+            stats = round_stats(times)
+            results.append({
+                'name': name,
+                'group': 'database',
+                'description': CASES[name]['description'],
+                'params': {'rounds': rounds, 'iterations': iterations, 'warmup': warmup},
+                'stats': stats,
+                'extra_info': {'sql_per_call': statements / (rounds * iterations)},
+            })
+            progress(f"  {name:<28} median {stats['median'] * 1e6:9.1f} мкс  "
+                     f"iqr {stats['iqr'] * 1e6:8.1f} мкс  {stats['ops']:9.0f} оп/с  "
+                     f"SQL/вызов {statements / (rounds * iterations):.1f}")
+    finally:
+        await db.close()
+        await db_uncached.close()
+        reset_spare_keys(path, meta)
+    return results
+
+
+def run(path: str, meta: Dict, names: Iterable[str], rounds: int = 20, iterations: int = 50,
+        warmup: int = 2, seed: int = 1, output: Optional[str] = None) -> Dict:
+    """Прогон и (если задан output) запись результатов в JSON"""
+    names = list(names)
+    unknown = set(names) - set(CASES)
+    if unknown:
+        raise ValueError(f"Неизвестные случаи: {', '.join(sorted(unknown))}")
+    benchmarks = asyncio.run(run_cases(path, meta, names, rounds, iterations, warmup, seed))
+    document = {
+        'version': RESULTS_VERSION,
+        'datetime': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'machine_info': machine_info(),
+        'commit_info': commit_info(),
+        'dataset': meta,
+        'benchmarks': benchmarks,
+    }
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(document, f, ensure_ascii=False, indent=2)
+    return document
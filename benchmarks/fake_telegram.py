@@ -0,0 +1,85 @@
+"""
+Заглушки Telegram для прогона обработчиков CalorieCounterBot без сети:
+сообщение с reply_text/edit_text, бот с get_file и загрузкой фото из
+памяти, Update и context с нужными обработчикам полями.
+
+Импорт bot.py настраивает логирование в config.LOG_FILE, а бот
+требует OPENAI_API_KEY (и токен для build_application), поэтому
+load_bot() подменяет их до импорта.
+"""
+import os
+import types
+from typing import Dict, List, Optional
+
+from telegram import PhotoSize
+
+import config
+
+
+class FakeMessage:
+    """Сообщение: ответы бота сохраняются в replies"""
+
+    def __init__(self, text: Optional[str] = None, photo: Optional[List[PhotoSize]] = None,
+                 caption: Optional[str] = None):
+        self.text = text
+        self.photo = photo
+        self.caption = caption
+        self.replies: List['FakeMessage'] = []
+        self.edits = 0
+
+    async def reply_text(self, text: str, **kwargs) -> 'FakeMessage':
+        reply = FakeMessage(text=text)
+        self.replies.append(reply)
+        return reply
+
+    async def edit_text(self, text: str, **kwargs) -> 'FakeMessage':
+        self.text = text
+        self.edits += 1
+        return self
+
+
+class FakeFile:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def download_to_memory(self, out):
+        out.write(self.data)
+
+
+class FakeBot:
+    """Бот с файлами в памяти: file_id -> содержимое"""
+
+    def __init__(self, files: Dict[str, bytes]):
+        self.files = files
+
+    async def get_file(self, file_id: str) -> FakeFile:
+        return FakeFile(self.files[file_id])
+
+
+def make_update(user_id: int, **message_fields) -> types.SimpleNamespace:
+    message = FakeMessage(**message_fields)
+    user = types.SimpleNamespace(id=user_id, username=f"user{user_id}", first_name="Bench")
+    return types.SimpleNamespace(effective_user=user, message=message, effective_message=message)
+
+
+def make_context(bot: FakeBot) -> types.SimpleNamespace:
+    return types.SimpleNamespace(bot=bot, user_data={})
+
+
+def photo_sizes(file_prefix: str, sizes) -> List[PhotoSize]:
+    """Варианты одного фото, как их присылает Telegram: [(ширина, высота), ...]"""
+    return [PhotoSize(f"{file_prefix}-{n}", f"{file_prefix}-u{n}", width, height)
+            for n, (width, height) in enumerate(sizes)]
+
+
+def load_bot(workdir: str, **config_overrides):
+    """Импорт bot.py с БД и логом во временном каталоге"""
+    config.DATABASE_PATH = os.path.join(workdir, 'bench.db')
+    config.LOG_FILE = os.path.join(workdir, 'bench.log')
+    config.OPENAI_API_KEY = config.OPENAI_API_KEY or 'stub'
+    config.TELEGRAM_BOT_TOKEN = config.TELEGRAM_BOT_TOKEN or '123456:stub'
+    config.METRICS_PORT = 0  # без HTTP-эндпоинта метрик (порт 9100 может быть занят)
+    for name, value in config_overrides.items():
+        setattr(config, name, value)
+    import bot
+    return bot
@@ -0,0 +1,205 @@
+"""
+Синтетические входные данные и общие помощники бенчмарков: фотографии
+"еды" с EXIF-метаданными и предсказуемым содержимым, распределения
+задержек, перцентили, заглушки OpenAI (клиент в памяти и обработчик
+для StubHTTPServer) и счётчик вызовов Database.
+
+Задержки задаются распределениями (миллисекунды):
+  200                  - постоянная
+  uniform:50:150       - равномерная
+  lognormal:800:0.4    - логнормальная с медианой 800 и sigma 0.4
+  exp:100              - экспоненциальная со средним 100
+
+Заглушки OpenAI отвечают по функции respond(request) - request содержит
+аргументы chat.completions.create (model, messages, ...), ответ - словарь:
+  result         - JSON ответа модели (dict)
+  ttft           - секунд до первого фрагмента
+  generation     - секунд на остальные фрагменты (по умолчанию 0)
+  chunks         - на сколько фрагментов делить поток (по умолчанию по 3 символа - "токен")
+  prompt_tokens  - входных токенов; если задано, возвращается usage
+                   (выходных - длина ответа / 3)
+"""
+import argparse
+import asyncio
+import contextvars
+import functools
+import inspect
+import json
+import math
+import random
+import time
+import types
+from io import BytesIO
+from typing import Callable, Dict, Iterable, Optional
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from benchmarks.stub_http import json_response
+
+# respond(request) -> ответ заглушки OpenAI (см. описание модуля)
+Responder = Callable[[Dict], Dict]
+
+
+def make_food_photo(width: int = 4000, height: int = 3000, seed: int = 0,
+                    quality: int = 92) -> bytes:
+    """
+    JPEG, похожий по сжимаемости на фото с телефона: тарелка с "едой"
+    на фоне с шумом, EXIF с ориентацией и моделью камеры.
+    """
+    rng = random.Random(seed)
+    image = Image.new('RGB', (width, height), (rng.randint(150, 220),) * 3)
+    draw = ImageDraw.Draw(image)
+    cx, cy, r = width // 2, height // 2, min(width, height) // 3
+    draw.ellipse((cx - r, cy - r, cx + r, cy + r), fill=(245, 245, 240))
+    for _ in range(60):
+        x = rng.randint(cx - r // 2, cx + r // 2)
+        y = rng.randint(cy - r // 2, cy + r // 2)
+        s = rng.randint(r // 20, r // 6)
+        color = (rng.randint(120, 255), rng.randint(60, 200), rng.randint(0, 120))
+        draw.ellipse((x - s, y - s, x + s, y + s), fill=color)
+    noise = Image.effect_noise((width, height), 24).convert('RGB')
+    image = Image.blend(image, noise, 0.12).filter(ImageFilter.GaussianBlur(1))
+
+    exif = Image.Exif()
+    exif[0x0112] = 1           # Orientation
+    exif[0x0110] = 'Bench Phone'  # Model
+    output = BytesIO()
+    image.save(output, format='JPEG', quality=quality, exif=exif.tobytes())
+    return output.getvalue()
+
+
+def latency_distribution(spec: str) -> Callable[[random.Random], float]:
+    """Распределение задержки из строки (см. описание модуля); возвращает секунды"""
+    kind, _, params = spec.partition(':')
+    try:
+        if not params:
+            value = float(kind) / 1000
+            return lambda rng: value
+        values = [float(p) for p in params.split(':')]
+        if kind == 'const':
+            return lambda rng: values[0] / 1000
+        if kind == 'uniform':
+            low, high = values[0] / 1000, values[1] / 1000
+            return lambda rng: rng.uniform(low, high)
+        if kind == 'lognormal':
+            mu, sigma = math.log(values[0] / 1000), values[1]
+            return lambda rng: rng.lognormvariate(mu, sigma)
+        if kind == 'exp':
+            rate = 1000 / values[0]
+            return lambda rng: rng.expovariate(rate)
+    except (ValueError, IndexError, ZeroDivisionError):
+        pass
+    raise argparse.ArgumentTypeError(f"неизвестное распределение задержки: {spec}")
+
+
+def percentile(values: Iterable[float], q: float) -> float:
+    """Перцентиль q (0..1) по ближайшему рангу; для пустой выборки - 0"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(len(ordered) * q) - 1))]
+
+
+_inside_db_call: contextvars.ContextVar = contextvars.ContextVar('inside_db_call', default=False)
+
+
+def count_db_calls(db, calls: Dict[str, int], label: Callable[[], Optional[str]]):
+    """
+    Счёт вызовов публичных методов db по метке label() (None - не считать)
+
+    Считаются только вызовы снаружи Database: вложенные (photo_preflight ->
+    flush_writes) входят во внешний вызов.
+    """
+    for name, func in inspect.getmembers(type(db), inspect.iscoroutinefunction):
+        if name.startswith('_'):
+            continue
+        method = getattr(db, name)
+
+        @functools.wraps(func)
+        async def counted(*args, _method=method, **kwargs):
+            key = label()
+            if key is None or _inside_db_call.get():
+                return await _method(*args, **kwargs)
+            calls[key] = calls.get(key, 0) + 1
+            token = _inside_db_call.set(True)
+            try:
+                return await _method(*args, **kwargs)
+            finally:
+                _inside_db_call.reset(token)
+
+        setattr(db, name, counted)
+
+
+def _usage(reply: Dict, content: str):
+    if reply.get('prompt_tokens') is None:
+        return None
+    return types.SimpleNamespace(prompt_tokens=reply['prompt_tokens'], completion_tokens=len(content) // 3)
+
+
+def stub_openai_client(respond: Responder):
+    """
+    HTTP-клиент OpenAI в памяти (подменяет OpenAIService.client)
+
+    Без stream ответ приходит целиком через ttft + generation секунд;
+    при stream=True первый фрагмент - через ttft, остальные равномерно
+    за generation, usage - последним фрагментом.
+    """
+
+    async def stream_chunks(reply: Dict, content: str):
+        size = -(-len(content) // reply['chunks']) if reply.get('chunks') else 3
+        pieces = [content[start:start + size] for start in range(0, len(content), size)]
+        gap = reply.get('generation', 0) / max(1, len(pieces) - 1)
+        await asyncio.sleep(reply['ttft'])
+        for n, piece in enumerate(pieces):
+            if n:
+                await asyncio.sleep(gap)
+            delta = types.SimpleNamespace(content=piece)
+            yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)], usage=None)
+        usage = _usage(reply, content)
+        if usage is not None:
+            yield types.SimpleNamespace(choices=[], usage=usage)
+
+    async def create(stream=False, **request):
+        reply = respond(request)
+        content = json.dumps(reply['result'], ensure_ascii=False)
+        if stream:
+            return stream_chunks(reply, content)
+        await asyncio.sleep(reply['ttft'] + reply.get('generation', 0))
+        message = types.SimpleNamespace(content=content)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)],
+                                     usage=_usage(reply, content))
+
+    async def close():
+        pass
+
+    completions = types.SimpleNamespace(create=create)
+    return types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions), close=close)
+
+
+def completion_payload(result: Dict, prompt_tokens: int = 1) -> Dict:
+    """Тело ответа /chat/completions (без потока)"""
+    content = json.dumps(result, ensure_ascii=False)
+    completion_tokens = max(1, len(content) // 3)
+    return {
+        'id': 'chatcmpl-stub', 'object': 'chat.completion', 'created': int(time.time()),
+        'model': 'stub',
+        'choices': [{
+            'index': 0, 'finish_reason': 'stop',
+            'message': {'role': 'assistant', 'content': content},
+        }],
+        'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                  'total_tokens': prompt_tokens + completion_tokens},
+    }
+
+
+def openai_http_handler(respond: Responder):
+    """Обработчик StubHTTPServer для /chat/completions (без потока): ответ через ttft + generation"""
+
+    async def handler(method, path, headers, body):
+        if not path.endswith('/chat/completions'):
+            return json_response({'error': {'message': 'not found'}}, status=404)
+        reply = respond(json.loads(body))
+        await asyncio.sleep(reply['ttft'] + reply.get('generation', 0))
+        return json_response(completion_payload(reply['result'], reply.get('prompt_tokens') or 1))
+
+    return handler
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный прогон CalorieCounterBot без сети: реальные обработчики,
+БД во временном файле, заглушки Telegram и OpenAI с задержками.
+
+Каждый из --users пользователей проходит сценарий /start, /activate,
+ввод ключа и --actions случайных действий (фото, /stats, /history,
+/key_info, /help, текст); одновременно активно не больше --concurrency
+пользователей, действия одного пользователя идут по порядку (как в
+PerUserUpdateProcessor). Telegram (reply_text/edit_text, get_file +
+скачивание) и HTTP-клиент OpenAI заменены заглушками - предобработка
+фото, ограничитель параллельности OpenAIService, кэш анализов и БД
+работают как в боте.
+
+Задержки задаются распределениями (миллисекунды):
+  200                  - постоянная
+  uniform:50:150       - равномерная
+  lognormal:800:0.4    - логнормальная с медианой 800 и sigma 0.4
+  exp:100              - экспоненциальная со средним 100
+
+Отчёт: p50/p95/p99 по командам, обновлений в секунду, вызовы Database
+из обработчика на команду (без вложенных) и SQL-команды (пишущие идут пачками, поэтому считаются на
+весь прогон), этапы handle_photo из metrics.py.
+
+Запуск: python -m benchmarks.load_test [--users 500] [--concurrency 200] [--vision-ms lognormal:800:0.4]
+"""
+import argparse
+import asyncio
+import contextvars
+import random
+import statistics
+import tempfile
+import time
+import types
+from typing import Callable, Dict, List
+
+from benchmarks.bench_photo_handler import RESULT
+from benchmarks.fake_telegram import FakeBot, FakeFile, FakeMessage, load_bot, photo_sizes
+from benchmarks.fixtures import (count_db_calls, latency_distribution, make_food_photo, percentile,
+                                 stub_openai_client)
+from metrics import REGISTRY
+
+# Команда, которую сейчас выполняет задача пользователя (для счёта вызовов БД)
+_current_command: contextvars.ContextVar = contextvars.ContextVar('command', default=None)
+
+ACTIONS = {'photo': 0.5, 'stats': 0.15, 'history': 0.1, 'key_info': 0.1, 'help': 0.05, 'text': 0.1}
+
+
+class LatentMessage(FakeMessage):
+    """Сообщение, у которого reply_text/edit_text ждут ответа Telegram"""
+
+    def __init__(self, delay: Callable[[], float], **fields):
+        super().__init__(**fields)
+        self._delay = delay
+
+    async def reply_text(self, text: str, **kwargs) -> 'LatentMessage':
+        await asyncio.sleep(self._delay())
+        reply = LatentMessage(self._delay, text=text)
+        self.replies.append(reply)
+        return reply
+
+    async def edit_text(self, text: str, **kwargs) -> 'LatentMessage':
+        await asyncio.sleep(self._delay())
+        return await super().edit_text(text, **kwargs)
+
+
+class LatentBot(FakeBot):
+    """get_file и скачивание с задержкой (делится поровну между вызовами)"""
+
+    def __init__(self, files: Dict[str, bytes], delay: Callable[[], float]):
+        super().__init__(files)
+        self._delay = delay
+
+    async def get_file(self, file_id: str) -> FakeFile:
+        total = self._delay()
+        await asyncio.sleep(total / 2)
+        file = await super().get_file(file_id)
+        original = file.download_to_memory
+
+        async def download_to_memory(out):
+            await asyncio.sleep(total / 2)
+            await original(out)
+
+        file.download_to_memory = download_to_memory
+        return file
+
+
+async def run(bot_module, args) -> Dict:
+    rng = random.Random(args.seed)
+    telegram_delay = latency_distribution(args.telegram_ms)
+    download_delay = latency_distribution(args.download_ms)
+    vision_delay = latency_distribution(args.vision_ms)
+
+    bot = bot_module.CalorieCounterBot()
+    await bot.openai_service.client.close()
+
+    def respond(request):
+        # Потоковый ответ - восемью фрагментами за время ответа
+        total = vision_delay(rng)
+        return {'result': RESULT, 'ttft': total / 8, 'generation': total * 7 / 8, 'chunks': 8}
+
+    bot.openai_service.client = stub_openai_client(respond)
+
+    # Фото: --photo-pool разных изображений, у каждого сообщения свои file_id
+    pool = [make_food_photo(800, 600, seed=n) for n in range(args.photo_pool)]
+    files = {}
+    context_bot = LatentBot(files, lambda: download_delay(rng))
+
+    latencies: Dict[str, List[float]] = {}
+    db_calls: Dict[str, int] = {}
+    errors: Dict[str, int] = {}
+    statements = {'sql': 0, 'commits': 0}
+    sent_photos = []
+
+    def trace(sql):
+        statements['sql'] += 1
+        if sql.strip().upper() == 'COMMIT':
+            statements['commits'] += 1
+
+    handlers = {
+        'start': bot.start_command,
+        'activate': bot.activate_command,
+        'key': bot.handle_text,
+        'photo': bot.handle_photo,
+        'stats': bot.stats_command,
+        'history': bot.history_command,
+        'key_info': bot.key_info_command,
+        'help': bot.help_command,
+        'text': bot.handle_text,
+    }
+
+    def make_message(user_rng: random.Random, user_id: int, command: str, step: int) -> LatentMessage:
+        delay = lambda: telegram_delay(user_rng)  # noqa: E731
+        if command == 'key':
+            return LatentMessage(delay, text=f"LOAD-{user_id:08d}")
+        if command == 'text':
+            return LatentMessage(delay, text="гречка с курицей")
+        if command != 'photo':
+            return LatentMessage(delay, text=f"/{command}")
+        if sent_photos and user_rng.random() < args.repeat_photos:
+            # Повторно присланное (пересланное) фото - попадание в кэш по file_unique_id
+            sizes, caption = user_rng.choice(sent_photos)
+        else:
+            prefix = f"u{user_id}s{step}"
+            sizes = photo_sizes(prefix, [(90, 68), (320, 240), (800, 600)])
+            image = pool[user_rng.randrange(len(pool))]
+            files.update({size.file_id: image for size in sizes})
+            caption = f"обед {prefix}"
+            sent_photos.append((sizes, caption))
+        return LatentMessage(delay, photo=sizes, caption=caption)
+
+    think_delay = latency_distribution(args.think_ms)
+
+    async def user_session(user_id: int):
+        user_rng = random.Random(args.seed * 1_000_003 + user_id)
+        script = ['start', 'activate', 'key'] + user_rng.choices(
+            list(ACTIONS), weights=list(ACTIONS.values()), k=args.actions)
+        context = types.SimpleNamespace(bot=context_bot, user_data={})
+        user = types.SimpleNamespace(id=user_id, username=f"user{user_id}", first_name="Load")
+        for step, command in enumerate(script):
+            if step and args.think_ms != '0':
+                await asyncio.sleep(think_delay(user_rng))
+            message = make_message(user_rng, user_id, command, step)
+            update = types.SimpleNamespace(effective_user=user, message=message, effective_message=message)
+            token = _current_command.set(command)
+            start = time.perf_counter()
+            try:
+                await handlers[command](update, context)
+            except Exception:
+                errors[command] = errors.get(command, 0) + 1
+            finally:
+                latencies.setdefault(command, []).append((time.perf_counter() - start) * 1000)
+                _current_command.reset(token)
+
+    REGISTRY.reset()
+    await bot.post_init(None)
+    try:
+        for user_id in range(1, args.users + 1):
+            key_type = 'unlimited' if rng.random() < args.unlimited_share else 'limited'
+            await bot.db.add_access_key(f"LOAD{user_id:08d}", key_type,
+                                        None if key_type == 'unlimited' else args.image_limit)
+        await bot.db.flush_writes()
+        await bot.db.set_trace_callback(trace)
+        count_db_calls(bot.db, db_calls, _current_command.get)
+
+        limiter = asyncio.Semaphore(args.concurrency)
+
+        async def limited_session(user_id: int):
+            async with limiter:
+                await user_session(user_id)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(limited_session(user_id) for user_id in range(1, args.users + 1)))
+        await bot.db.flush_writes()
+        elapsed = time.perf_counter() - started
+        await bot.db.set_trace_callback(None)
+        return {
+            'elapsed': elapsed,
+            'latencies': latencies,
+            'db_calls': db_calls,
+            'errors': errors,
+            'statements': statements,
+            'openai': bot.openai_service.get_stats(),
+            'cache': bot.analysis_cache.get_stats(),
+            'rate_limited': sum(child.value for _, child in REGISTRY.get('rate_limited_total').children()),
+            'photo_stages': [line for line in REGISTRY.summary() if line.startswith('photo_stage_seconds')],
+        }
+    finally:
+        await bot.post_shutdown(None)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--actions', type=int, default=5, help="действий на пользователя после активации")
+    parser.add_argument('--concurrency', type=int, default=200, help="одновременно активных пользователей")
+    parser.add_argument('--telegram-ms', default='lognormal:60:0.4', help="reply_text/edit_text")
+    parser.add_argument('--download-ms', default='lognormal:150:0.5', help="get_file + скачивание")
+    parser.add_argument('--vision-ms', default='lognormal:800:0.4', help="запрос к Vision API")
+    parser.add_argument('--think-ms', default='0', help="пауза пользователя между действиями")
+    parser.add_argument('--openai-concurrency', type=int, default=None,
+                        help="OPENAI_MAX_CONCURRENT_REQUESTS (по умолчанию из config)")
+    parser.add_argument('--photo-pool', type=int, default=20, help="разных изображений")
+    parser.add_argument('--repeat-photos', type=float, default=0.1, help="доля повторно присланных фото")
+    parser.add_argument('--unlimited-share', type=float, default=0.2, help="доля безлимитных ключей")
+    parser.add_argument('--image-limit', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    for spec in (args.telegram_ms, args.download_ms, args.vision_ms, args.think_ms):
+        latency_distribution(spec)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        overrides = {'LOG_LEVEL': 'WARNING', 'METRICS_LOG_INTERVAL': 0}
+        if args.openai_concurrency:
+            overrides['OPENAI_MAX_CONCURRENT_REQUESTS'] = args.openai_concurrency
+        bot_module = load_bot(tmp, **overrides)
+        print(f"{args.users} пользователей по {args.actions + 3} обновлений, {args.concurrency} одновременно; "
+              f"Telegram {args.telegram_ms}, скачивание {args.download_ms}, Vision {args.vision_ms}, "
+              f"OpenAI параллельно {bot_module.config.OPENAI_MAX_CONCURRENT_REQUESTS}")
+        result = await run(bot_module, args)
+
+    updates = sum(len(values) for values in result['latencies'].values())
+    print(f"обновлений: {updates} за {result['elapsed']:.1f} с - {updates / result['elapsed']:.1f} обновлений/с")
+    print(f"  {'команда':<9} {'кол-во':>6} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} {'вызовов БД':>11} {'ошибок':>7}")
+    for command, values in sorted(result['latencies'].items(), key=lambda item: -len(item[1])):
+        ordered = sorted(values)
+        print(f"  {command:<9} {len(values):6d} {statistics.median(ordered):9.1f} {percentile(ordered, 0.95):9.1f} "
+              f"{percentile(ordered, 0.99):9.1f} {result['db_calls'].get(command, 0) / len(values):11.1f} "
+              f"{result['errors'].get(command, 0):7d}")
+    statements = result['statements']
+    print(f"SQL-команд: {statements['sql']} ({statements['sql'] / updates:.1f} на обновление), "
+          f"COMMIT: {statements['commits']}")
+    openai_stats, cache = result['openai'], result['cache']
+    print(f"OpenAI: запросов {openai_stats['requests_total']}, макс. очередь {openai_stats['max_queue_depth']}; "
+          f"кэш анализов: попаданий {cache['memory_hits'] + cache['db_hits']}, промахов {cache['misses']}; "
+          f"отказов rate limit: {result['rate_limited']:.0f}")
+    if result['photo_stages']:
+        print("этапы handle_photo:")
+        for line in result['photo_stages']:
+            print(f"  {line}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
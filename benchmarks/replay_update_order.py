@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Проверка порядка обработки: переплетённая трасса обновлений нескольких
+пользователей прогоняется через реальные обработчики CalorieCounterBot
+(заглушка Bot API, БД во временном каталоге).
+
+Каждый пользователь отправляет /start, /activate, ключ, /key_info;
+сообщения разных пользователей перемешаны (--seed). Заглушка отвечает
+на sendMessage со случайной задержкой до --reply-delay-ms, поэтому
+обработчики завершаются в разное время. Ответы каждого пользователя
+должны идти в ожидаемом порядке: если ключ обработан раньше /activate,
+бот ответит "необходимо активировать ключ" вместо активации.
+
+Режимы: по одному обновлению; параллельно без учёта пользователей
+(SimpleUpdateProcessor); PerUserUpdateProcessor. Код выхода 1, если
+PerUserUpdateProcessor нарушил порядок.
+
+Запуск: python -m benchmarks.replay_update_order [--users 50] [--concurrency 8] [--trace file] [--save-trace file]
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import tempfile
+import time
+
+from telegram.ext import SimpleUpdateProcessor
+
+import config
+from benchmarks.fake_telegram import load_bot
+from benchmarks.stub_bot_api import StubBotAPI, load_updates, make_message_update
+from update_processor import PerUserUpdateProcessor
+
+EXPECTED = ['start', 'activate', 'activated', 'key_info']
+
+# Подстрока ответа -> метка; порядок важен (первое совпадение)
+REPLY_LABELS = [
+    ('Для начала работы активируйте', 'start'),
+    ('Активация ключа доступа', 'activate'),
+    ('Ключ успешно активирован', 'activated'),
+    ('Информация о вашем ключе', 'key_info'),
+    ('необходимо активировать ключ', 'locked'),
+    ('нет активированного ключа', 'no_key'),
+    ('уже активирован ключ', 'already_active'),
+]
+
+
+def key_code(user_id: int) -> str:
+    return f"ORDER{user_id:08d}"
+
+
+def make_trace(users: int, seed: int) -> list:
+    """Сообщения пользователей в случайном переплетении, порядок каждого сохранён"""
+    rng = random.Random(seed)
+    scripts = {user_id: ['/start', '/activate', key_code(user_id), '/key_info']
+               for user_id in range(1, users + 1)}
+    trace = []
+    while scripts:
+        user_id = rng.choice(list(scripts))
+        trace.append(make_message_update(len(trace) + 1, user_id, scripts[user_id].pop(0)))
+        if not scripts[user_id]:
+            del scripts[user_id]
+    return trace
+
+
+def label(text: str) -> str:
+    for fragment, name in REPLY_LABELS:
+        if fragment in text:
+            return name
+    return 'other'
+
+
+async def replay(bot_module, trace: list, processor, reply_delay: float, seed: int) -> dict:
+    users = sorted({update['message']['from']['id'] for update in trace})
+    api = await StubBotAPI(reply_delay=reply_delay, seed=seed).start()
+    config.TELEGRAM_BASE_URL = api.base_url
+    bot = bot_module.CalorieCounterBot()
+    application = bot.build_application(update_processor=processor)
+    try:
+        await application.initialize()
+        await bot.post_init(application)
+        for user_id in users:
+            await bot.db.add_access_key(key_code(user_id), 'limited', 10)
+        await application.start()
+        await application.updater.start_polling(poll_interval=0, timeout=10)
+        start = time.perf_counter()
+        await api.push(trace)
+        await api.wait_replies(len(trace), timeout=120)
+        elapsed = time.perf_counter() - start
+    finally:
+        if application.updater.running:
+            await application.updater.stop()
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        await bot.post_shutdown(application)
+        await api.stop()
+
+    replies = {}
+    for reply in api.replies:
+        replies.setdefault(reply['chat_id'], []).append(label(reply['text']))
+    broken = {user_id: replies.get(user_id) for user_id in users if replies.get(user_id) != EXPECTED}
+    return {'elapsed': elapsed, 'broken': broken}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=config.CONCURRENT_UPDATES)
+    parser.add_argument('--reply-delay-ms', type=float, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--trace', help="трасса обновлений (JSON на строку), сохранённая --save-trace")
+    parser.add_argument('--save-trace', help="сохранить сгенерированную трассу")
+    args = parser.parse_args()
+
+    trace = load_updates(args.trace) if args.trace else make_trace(args.users, args.seed)
+    if args.save_trace:
+        with open(args.save_trace, 'w', encoding='utf-8') as f:
+            for update in trace:
+                f.write(json.dumps(update, ensure_ascii=False) + '\n')
+    print(f"{len(trace)} обновлений, задержка ответа до {args.reply_delay_ms:.0f} мс, "
+          f"одновременно до {args.concurrency}")
+
+    modes = [
+        ("по одному", lambda: SimpleUpdateProcessor(1)),
+        ("параллельно без порядка", lambda: SimpleUpdateProcessor(args.concurrency)),
+        ("по пользователям", lambda: PerUserUpdateProcessor(args.concurrency)),
+    ]
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        bot_module = load_bot(tmp, LOG_LEVEL='WARNING')
+        for n, (name, make_processor) in enumerate(modes):
+            config.DATABASE_PATH = f"{tmp}/order{n}.db"
+            processor = make_processor()
+            result = await replay(bot_module, trace, processor, args.reply_delay_ms / 1000, args.seed)
+            broken = result['broken']
+            print(f"  {name:<24} {result['elapsed']:6.2f} с  нарушен порядок у {len(broken)} пользователей")
+            for user_id, labels in list(broken.items())[:3]:
+                print(f"      {user_id}: {labels}")
+            if isinstance(processor, PerUserUpdateProcessor):
+                print(f"      {processor.stats}")
+                failed = failed or bool(broken)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
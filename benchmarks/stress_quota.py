@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Стресс-тест лимита ключа при параллельной отправке фото.
+
+Один пользователь с лимитом --limit одновременно отправляет --photos фото;
+каждый "анализ" длится случайное время, часть анализов завершается ошибкой.
+Сравниваются два протокола:
+  - проверка check_user_access + log_key_usage после анализа (как раньше);
+  - reserve_image_quota / commit_image_quota / release_image_quota.
+Код возврата 1, если протокол резервирования превысил лимит или счётчик
+разошёлся с журналом.
+
+Запуск: python -m benchmarks.stress_quota [--photos 100] [--limit 20] [--failure-rate 0.2]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+
+from database import Database
+
+USER_ID = 1
+
+
+async def fake_analysis(rng: random.Random, failure_rate: float):
+    await asyncio.sleep(rng.uniform(0.01, 0.05))
+    if rng.random() < failure_rate:
+        raise RuntimeError("Сбой анализа")
+
+
+async def check_then_log(db: Database, rng, failure_rate) -> bool:
+    access = await db.check_user_access(USER_ID)
+    if not access['has_access']:
+        return False
+    try:
+        await fake_analysis(rng, failure_rate)
+    except RuntimeError:
+        return False
+    await db.log_key_usage(USER_ID, usage_type='image')
+    return True
+
+
+async def reserve_commit(db: Database, rng, failure_rate) -> bool:
+    reservation = await db.reserve_image_quota(USER_ID)
+    if reservation is None:
+        return False
+    committed = False
+    try:
+        await fake_analysis(rng, failure_rate)
+        await db.commit_image_quota(reservation)
+        committed = True
+    except RuntimeError:
+        pass
+    finally:
+        if not committed:
+            await db.release_image_quota(reservation)
+    return committed
+
+
+async def run(label: str, protocol, photos: int, limit: int, failure_rate: float) -> bool:
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'stress.db'))
+        try:
+            await db.init_db()
+            await db.add_user(USER_ID)
+            await db.add_access_key('STRESS', 'limited', limit)
+            await db.activate_key('STRESS', USER_ID)
+
+            results = await asyncio.gather(*(protocol(db, rng, failure_rate) for _ in range(photos)))
+            analysed = sum(results)
+            mismatches = await db.reconcile_usage_counters()
+            access = await db.check_user_access(USER_ID)
+        finally:
+            await db.close()
+
+    ok = analysed <= limit and not mismatches
+    print(f"{'✅' if ok else '❌'} {label}: засчитано анализов {analysed} при лимите {limit}, "
+          f"счётчик {access.get('images_used')}, расхождений с журналом: {len(mismatches)}")
+    return ok
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--photos', type=int, default=100)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--failure-rate', type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(f"Одновременных фото: {args.photos}, лимит: {args.limit}, доля сбоев: {args.failure_rate}")
+    await run("проверка + списание после анализа", check_then_log,
+              args.photos, args.limit, args.failure_rate)
+    ok = await run("резерв / подтверждение / отмена", reserve_commit,
+                   args.photos, args.limit, args.failure_rate)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,153 @@
+"""
+Заглушка Telegram Bot API для бенчмарков режимов polling/webhook.
+
+Отвечает на getMe, setWebhook/deleteWebhook, sendMessage/editMessageText
+(ответы бота сохраняются с временем отправки) и getUpdates с длинным
+опросом по очереди обновлений, добавленных через push(). Для webhook
+обновления отправляются напрямую на сервер бота.
+
+Синтетические обновления: make_message_update(); записанные обновления
+(по одному JSON на строку) - load_updates().
+"""
+import asyncio
+import json
+import random
+import time
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl
+
+from benchmarks.stub_http import StubHTTPServer, json_response
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+
+
+def make_message_update(update_id: int, user_id: int, text: str) -> Dict:
+    """Обновление Telegram с текстовым сообщением в личном чате"""
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private', 'first_name': 'Bench'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Bench', 'username': f"user{user_id}"},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+def load_updates(path: str) -> List[Dict]:
+    """Записанные обновления: один JSON-объект на строку"""
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def parse_params(headers: Dict[str, str], body: bytes) -> Dict:
+    """Параметры вызова Bot API: JSON или form-urlencoded со значениями в JSON"""
+    if headers.get('content-type', '').startswith('application/json'):
+        return json.loads(body or b'{}')
+    params = {}
+    for name, value in parse_qsl(body.decode('utf-8')):
+        try:
+            params[name] = json.loads(value)
+        except ValueError:
+            params[name] = value
+    return params
+
+
+class StubBotAPI:
+    """
+    Bot API на 127.0.0.1: base_url для TELEGRAM_BASE_URL
+
+    reply_delay - случайная задержка ответа на sendMessage (0..reply_delay
+    секунд, генератор с seed): обработчики завершаются в разное время,
+    как при реальной сети.
+    """
+
+    def __init__(self, reply_delay: float = 0.0, seed: int = 0):
+        self.reply_delay = reply_delay
+        self._random = random.Random(seed)
+        self.server = StubHTTPServer(self._handle)
+        self.pending: List[Dict] = []
+        self.pushed_at: Dict[int, float] = {}   # update_id -> время появления
+        self.replies: List[Dict] = []           # {'chat_id', 'text', 'at'}
+        self.calls: Dict[str, int] = {}
+        self.webhook: Optional[Dict] = None
+        self._new_updates = asyncio.Condition()
+        self._replies_changed = asyncio.Condition()
+        self._message_id = 0
+
+    @property
+    def base_url(self) -> str:
+        return self.server.base_url
+
+    async def start(self) -> 'StubBotAPI':
+        await self.server.start()
+        return self
+
+    async def stop(self):
+        async with self._new_updates:
+            self._new_updates.notify_all()
+        await self.server.stop()
+
+    async def push(self, updates: List[Dict]):
+        """Новые обновления для getUpdates"""
+        now = time.monotonic()
+        for update in updates:
+            self.pushed_at[update['update_id']] = now
+        async with self._new_updates:
+            self.pending.extend(updates)
+            self._new_updates.notify_all()
+
+    async def wait_replies(self, count: int, timeout: float = 60.0):
+        """Ожидание, пока бот отправит count ответов"""
+        async with self._replies_changed:
+            await asyncio.wait_for(
+                self._replies_changed.wait_for(lambda: len(self.replies) >= count), timeout
+            )
+
+    async def _get_updates(self, params: Dict) -> List[Dict]:
+        offset = params.get('offset', 0) or 0
+        limit = params.get('limit', 100) or 100
+        timeout = params.get('timeout', 0) or 0
+        async with self._new_updates:
+            self.pending = [u for u in self.pending if u['update_id'] >= offset]
+            if not self.pending and timeout:
+                try:
+                    await asyncio.wait_for(self._new_updates.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                self.pending = [u for u in self.pending if u['update_id'] >= offset]
+            return self.pending[:limit]
+
+    async def _reply(self, params: Dict) -> Dict:
+        if self.reply_delay:
+            await asyncio.sleep(self._random.uniform(0, self.reply_delay))
+        self._message_id += 1
+        async with self._replies_changed:
+            self.replies.append({'chat_id': params.get('chat_id'), 'text': params.get('text'),
+                                 'at': time.monotonic()})
+            self._replies_changed.notify_all()
+        return {'message_id': self._message_id, 'date': int(time.time()),
+                'chat': {'id': params.get('chat_id'), 'type': 'private'},
+                'text': params.get('text', '')}
+
+    async def _handle(self, method: str, path: str, headers: Dict[str, str], body: bytes):
+        api_method = path.rsplit('/', 1)[-1]
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        params = parse_params(headers, body)
+
+        if api_method == 'getMe':
+            result = BOT_USER
+        elif api_method == 'getUpdates':
+            result = await self._get_updates(params)
+        elif api_method in ('sendMessage', 'editMessageText'):
+            result = await self._reply(params)
+        elif api_method == 'setWebhook':
+            self.webhook = params
+            result = True
+        elif api_method in ('deleteWebhook', 'sendChatAction', 'answerCallbackQuery'):
+            result = True
+        else:
+            return json_response({'ok': False, 'error_code': 404,
+                                  'description': f"Not Found: {api_method}"}, status=404)
+        return json_response({'ok': True, 'result': result})
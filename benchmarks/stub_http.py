@@ -0,0 +1,79 @@
+"""
+Минимальный асинхронный HTTP/1.1-сервер для заглушек внешних API
+(OpenAI, Telegram Bot API) в бенчмарках. Поддерживает keep-alive
+и тела запросов с Content-Length - этого достаточно для httpx.
+"""
+import asyncio
+import json
+from typing import Awaitable, Callable, Dict, Tuple
+
+# handler(method, path, headers, body) -> (status, content_type, body)
+Handler = Callable[[str, str, Dict[str, str], bytes], Awaitable[Tuple[int, str, bytes]]]
+
+REASONS = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found',
+           500: 'Internal Server Error'}
+
+
+def json_response(data, status: int = 200) -> Tuple[int, str, bytes]:
+    return status, 'application/json', json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+class StubHTTPServer:
+    """Заглушка HTTP-сервера на 127.0.0.1 со случайным портом"""
+
+    def __init__(self, handler: Handler):
+        self.handler = handler
+        self.requests = 0
+        self._server = None
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                self.requests += 1
+                status, content_type, payload = await self.handler(method, path, headers, body)
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS.get(status, 'OK')}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: keep-alive\r\n\r\n".encode('latin-1') + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # CancelledError - незакрытые клиентом соединения при остановке цикла
+            pass
+        finally:
+            writer.close()
@@ -1,43 +1,298 @@
 import logging
 import asyncio
+import secrets
+import signal
+import time
 from io import BytesIO
-from telegram import Update
+from typing import Dict, Optional, Sequence
+from telegram import PhotoSize, Update
 from telegram.ext import (
     Application,
+    BaseUpdateProcessor,
     CommandHandler,
     MessageHandler,
     filters,
     ContextTypes
 )
 from telegram.constants import ParseMode
+from telegram.error import RetryAfter, TelegramError
 
 import config
-from database import Database
+from analysis_cache import AnalysisCache
+from database import Database, MaintenanceScheduler
+from log_setup import setup_logging
+from metrics import ERRORS, REGISTRY, MetricsReporter, MetricsServer
 from openai_service import OpenAIService
-
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=getattr(logging, config.LOG_LEVEL),
-    handlers=[
-        logging.FileHandler(config.LOG_FILE, encoding='utf-8'),
-        logging.StreamHandler()
-    ]
+from rate_limiter import create_rate_limiter
+from update_filter import UpdateTypeFilter, allowed_updates_for
+from update_processor import PerUserUpdateProcessor
+from webhook_server import WebhookServer, make_ssl_context, webhook_address
+
+# Настройка логирования: запись в файл и консоль - в фоновом потоке
+setup_logging(
+    level=config.LOG_LEVEL,
+    log_file=config.LOG_FILE,
+    max_bytes=config.LOG_FILE_MAX_BYTES,
+    backup_count=config.LOG_FILE_BACKUP_COUNT,
+    file_format=config.LOG_FILE_FORMAT
 )
 
 logger = logging.getLogger(__name__)
 
+# Длительность этапов handle_photo (total - весь обработчик; first_field - от
+# начала обработчика до первого показанного пользователю результата)
+PHOTO_STAGE_SECONDS = REGISTRY.histogram('photo_stage_seconds', "Длительность этапов обработки фото", ('stage',))
+PHOTO_STAGES = {stage: PHOTO_STAGE_SECONDS.labels(stage) for stage in (
+    'rate_limit', 'preflight', 'reply', 'cache', 'download', 'analysis', 'postflight', 'edit', 'total',
+    'first_field'
+)}
+PROGRESS_EDITS = REGISTRY.counter('progress_edits_total', "Промежуточные правки сообщения о фото", ('result',))
+# Байт скачано из Telegram на одно фото (с повторным скачиванием самого большого варианта)
+PHOTO_DOWNLOAD_BYTES = REGISTRY.histogram('photo_download_bytes', "Байт фото, скачанных для одного анализа",
+                                          buckets=tuple(2 ** n * 1024 for n in range(4, 14)))
+PHOTO_UPGRADES = REGISTRY.counter('photo_upgrades_total', "Повторные анализы по самому большому варианту фото")
+RATE_LIMITED = REGISTRY.counter('rate_limited_total', "Отказы по rate limit по типу ключа", ('tier',))
+
+
+def select_photo_size(photos: Sequence[PhotoSize], min_side: int) -> PhotoSize:
+    """
+    Выбор варианта фото для анализа
+    
+    Telegram присылает одно фото в нескольких размерах. Берём самый
+    маленький, у которого длинная сторона не меньше min_side, а если
+    такого нет - самый большой из доступных.
+    """
+    by_area = sorted(photos, key=lambda p: p.width * p.height)
+    for photo in by_area:
+        if max(photo.width, photo.height) >= min_side:
+            return photo
+    return by_area[-1]
+
+
+class ProgressEditor:
+    """
+    Промежуточные правки сообщения «Анализирую фото...»
+    
+    push() не ждёт Telegram: последний присланный текст отправляется
+    фоновой задачей не чаще раза в min_interval секунд (Telegram
+    ограничивает частоту правок в одном чате), промежуточные версии
+    пропускаются. После close() правок больше не будет - обработчик
+    может отправлять финальный текст.
+    """
+    
+    def __init__(self, message, min_interval: float):
+        self.message = message
+        self.min_interval = min_interval
+        self.edits = 0
+        self.first_edit_at: Optional[float] = None  # time.monotonic() первой успешной правки
+        self._pending: Optional[str] = None
+        self._sent: Optional[str] = None
+        self._next_edit_at = 0.0
+        self._editing = False
+        self._closed = False
+        self._task: Optional[asyncio.Task] = None
+    
+    def push(self, text: str):
+        if self._closed or text == self._sent:
+            return
+        self._pending = text
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def _run(self):
+        while self._pending is not None and not self._closed:
+            delay = self._next_edit_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            text, self._pending = self._pending, None
+            self._editing = True
+            try:
+                await self.message.edit_text(text, parse_mode=ParseMode.HTML)
+            except RetryAfter as e:
+                PROGRESS_EDITS.labels('retry_after').inc()
+                logger.debug("Промежуточная правка отложена Telegram на %s с", e.retry_after)
+                self._next_edit_at = time.monotonic() + float(e.retry_after)
+                if self._pending is None:
+                    self._pending = text
+                continue
+            except TelegramError as e:
+                PROGRESS_EDITS.labels('error').inc()
+                logger.debug("Промежуточная правка не удалась: %s", e)
+            else:
+                PROGRESS_EDITS.labels('ok').inc()
+                self._sent = text
+                self.edits += 1
+                if self.first_edit_at is None:
+                    self.first_edit_at = time.monotonic()
+            finally:
+                self._editing = False
+            self._next_edit_at = time.monotonic() + self.min_interval
+        self._task = None
+    
+    async def close(self):
+        """Остановка правок: ожидание начатой правки, отмена отложенной"""
+        self._closed = True
+        task = self._task
+        if task is None:
+            return
+        if not self._editing:
+            task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
 
 class CalorieCounterBot:
     """Telegram-бот для подсчета калорий"""
     
     def __init__(self):
-        self.db = Database(config.DATABASE_PATH)
+        self.db = Database(
+            config.DATABASE_PATH,
+            read_pool_size=config.DB_READ_POOL_SIZE,
+            storage_profile=config.DB_STORAGE_PROFILE,
+            default_timezone=config.DEFAULT_TIMEZONE,
+            access_cache=config.DB_ACCESS_CACHE,
+            access_cache_ttl=config.DB_ACCESS_CACHE_TTL,
+            write_mode=config.DB_WRITE_MODE,
+            write_flush_interval=config.DB_WRITE_FLUSH_INTERVAL,
+            write_batch_size=config.DB_WRITE_BATCH_SIZE
+        )
         self.openai_service = OpenAIService(
             api_key=config.OPENAI_API_KEY,
             model=config.OPENAI_MODEL,
-            vision_model=config.OPENAI_VISION_MODEL
+            vision_model=config.OPENAI_VISION_MODEL,
+            max_concurrent_requests=config.OPENAI_MAX_CONCURRENT_REQUESTS,
+            request_timeout=config.OPENAI_REQUEST_TIMEOUT,
+            max_retries=config.OPENAI_MAX_RETRIES,
+            base_url=config.OPENAI_BASE_URL,
+            image_max_side=config.IMAGE_MAX_SIDE,
+            image_jpeg_quality=config.IMAGE_JPEG_QUALITY,
+            image_low_detail_max_side=config.IMAGE_LOW_DETAIL_MAX_SIDE,
+            image_executor=config.IMAGE_EXECUTOR,
+            image_workers=config.IMAGE_WORKERS,
+            stream_responses=config.OPENAI_STREAM_RESPONSES,
+            routing=config.OPENAI_ROUTING,
+            vision_tiers=config.OPENAI_VISION_TIERS,
+            routing_min_confidence=config.OPENAI_ROUTING_MIN_CONFIDENCE,
+            routing_energy_tolerance=config.OPENAI_ROUTING_ENERGY_TOLERANCE,
+            routing_energy_margin=config.OPENAI_ROUTING_ENERGY_MARGIN
         )
+        self.rate_limiter = create_rate_limiter(
+            config.RATE_LIMITER,
+            config.RATE_LIMITS_BY_TIER,
+            window_seconds=config.RATE_LIMIT_WINDOW_SECONDS,
+            max_keys=config.RATE_LIMITER_MAX_USERS
+        )
+        self.maintenance = MaintenanceScheduler(
+            self.db,
+            interval=config.DB_MAINTENANCE_INTERVAL,
+            requests_retention_days=config.REQUESTS_LOG_RETENTION_DAYS,
+            key_usage_retention_days=config.KEY_USAGE_RETENTION_DAYS,
+            batch_size=config.DB_MAINTENANCE_BATCH_SIZE,
+            pause=config.DB_MAINTENANCE_PAUSE,
+            vacuum_pages_per_step=config.DB_VACUUM_PAGES_PER_STEP
+        ) if config.DB_MAINTENANCE_INTERVAL else None
+        self.analysis_cache = AnalysisCache(
+            self.db,
+            max_entries=config.ANALYSIS_CACHE_MAX_ENTRIES,
+            ttl_seconds=config.ANALYSIS_CACHE_TTL
+        )
+        # Отсев обновлений неподписанных типов (создаётся в build_application)
+        self.update_filter: Optional[UpdateTypeFilter] = None
+        # Метрики: /metrics на METRICS_PORT и сводка в лог (запускаются в post_init)
+        REGISTRY.enabled = config.METRICS_ENABLED
+        self.metrics_server = MetricsServer(
+            REGISTRY, host=config.METRICS_HOST, port=config.METRICS_PORT
+        ) if config.METRICS_ENABLED and config.METRICS_PORT else None
+        self.metrics_reporter = MetricsReporter(
+            REGISTRY, interval=config.METRICS_LOG_INTERVAL
+        ) if config.METRICS_ENABLED and config.METRICS_LOG_INTERVAL else None
+    
+    async def _download_photo(self, context: ContextTypes.DEFAULT_TYPE, photo: PhotoSize) -> bytes:
+        """Скачивание варианта фото в память"""
+        with PHOTO_STAGES['download'].time():
+            file = await context.bot.get_file(photo.file_id)
+            image_bytes = BytesIO()
+            await file.download_to_memory(image_bytes)
+        return image_bytes.getvalue()
+    
+    async def _analyze_photo(self, context: ContextTypes.DEFAULT_TYPE, user_id: int,
+                             photos: Sequence[PhotoSize], caption: Optional[str],
+                             progress: Optional[ProgressEditor] = None) -> Dict:
+        """
+        Анализ фото с учётом кэша
+        
+        Сначала ищем результат по file_unique_id (без скачивания), затем
+        по перцептивному хешу скачанного изображения. При промахе
+        вызываем Vision API и сохраняем результат под обоими ключами;
+        готовые поля потокового ответа показываются через progress.
+        """
+        photo = select_photo_size(photos, config.PHOTO_MIN_SIDE)
+        
+        file_key = self.analysis_cache.file_key(photo.file_unique_id, caption)
+        with PHOTO_STAGES['cache'].time():
+            result = await self.analysis_cache.get(file_key)
+        if result is not None:
+            logger.info("Анализ фото пользователя %s взят из кэша (file_unique_id)", user_id)
+            return result
+        
+        # Получение фото: самый маленький вариант, достаточный для анализа
+        image_bytes = await self._download_photo(context, photo)
+        downloaded = len(image_bytes)
+        
+        with PHOTO_STAGES['cache'].time():
+            image_key = await self.analysis_cache.image_key(image_bytes, caption, user_id)
+            result = await self.analysis_cache.get(image_key)
+        if result is not None:
+            logger.info("Анализ фото пользователя %s взят из кэша (перцептивный хеш)", user_id)
+            PHOTO_DOWNLOAD_BYTES.observe(downloaded)
+            await self.analysis_cache.put([file_key], result)
+            return result
+        
+        on_fields = None
+        if progress is not None:
+            def on_fields(fields: Dict):
+                text = self.openai_service.format_partial(fields)
+                if text is not None:
+                    progress.push(text)
+        
+        # Анализ изображения через OpenAI Vision. Если есть вариант больше,
+        # quality_warning быстрой модели не перепроверяется сильной на том же
+        # маленьком фото - сразу повторный анализ по самому большому
+        largest = max(photos, key=lambda p: p.width * p.height)
+        can_upgrade = photo.file_unique_id != largest.file_unique_id
+        with PHOTO_STAGES['analysis'].time():
+            result = await self.openai_service.analyze_food_image(
+                image_bytes,
+                user_text=caption,
+                on_fields=on_fields,
+                escalate_quality=not can_upgrade
+            )
+        
+        # Модель пожаловалась на качество - повторяем по самому большому
+        # варианту, сразу сильной моделью
+        if result.get('quality_warning') and can_upgrade:
+            logger.info("Повторный анализ фото пользователя %s в размере %dx%d: %s",
+                        user_id, largest.width, largest.height, result['quality_warning'])
+            PHOTO_UPGRADES.inc()
+            image_bytes = await self._download_photo(context, largest)
+            downloaded += len(image_bytes)
+            with PHOTO_STAGES['analysis'].time():
+                result = await self.openai_service.analyze_food_image(
+                    image_bytes,
+                    user_text=caption,
+                    on_fields=on_fields,
+                    tier='strong'
+                )
+        PHOTO_DOWNLOAD_BYTES.observe(downloaded)
+        logger.info("Скачано %d байт фото для пользователя %s (вариант %dx%d)",
+                    downloaded, user_id, photo.width, photo.height,
+                    extra={'user_id': user_id, 'handler': 'photo', 'bytes': downloaded})
+        
+        # Результат с жалобой на качество не кэшируем - иначе повтор того же
+        # фото получил бы его вместо нового анализа
+        if not result.get('quality_warning'):
+            await self.analysis_cache.put([file_key, image_key], result)
+        return result
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
@@ -89,7 +344,8 @@ class CalorieCounterBot:
             welcome_message,
             parse_mode=ParseMode.HTML
         )
-        logger.info(f"Новый пользователь: {user.id} ({user.username})")
+        logger.info("Новый пользователь: %s (%s)", user.id, user.username,
+                    extra={'user_id': user.id, 'handler': 'start'})
     
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /help"""
@@ -258,7 +514,7 @@ class CalorieCounterBot:
         history_message = "📝 <b>История приёмов пищи за сегодня:</b>\n\n"
         
         for i, meal in enumerate(meals, 1):
-            meal_time = meal['meal_time'].split()[1][:5]  # Только время HH:MM
+            meal_time = meal['local_meal_time'].split()[1][:5]  # Только время HH:MM
             history_message += f"{i}. <b>{meal['product_name']}</b>\n"
             if meal['weight']:
                 history_message += f"   📏 {meal['weight']} г\n"
@@ -316,7 +572,8 @@ class CalorieCounterBot:
 📷 <b>Отправьте фото вашего блюда и начните!</b> 🚀"""
                 
                 await update.message.reply_text(message, parse_mode=ParseMode.HTML)
-                logger.info(f"Пользователь {user_id} активировал ключ типа {key_type}")
+                logger.info("Пользователь %s активировал ключ типа %s", user_id, key_type,
+                            extra={'user_id': user_id, 'handler': 'activate'})
             else:
                 await update.message.reply_text(
                     f"❌ {result['message']}\n\n"
@@ -352,7 +609,8 @@ class CalorieCounterBot:
             "Жду ваше фото! 📸",
             parse_mode=ParseMode.HTML
         )
-        logger.info(f"Пользователь {user_id} отправил текст, перенаправлен на фото")
+        logger.info("Пользователь %s отправил текст, перенаправлен на фото", user_id,
+                    extra={'user_id': user_id, 'handler': 'text'})
     
     async def handle_voice_audio(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик голосовых сообщений и аудио"""
@@ -374,108 +632,131 @@ class CalorieCounterBot:
             "📷 Пожалуйста, отправьте <b>фото</b> вашего блюда!",
             parse_mode=ParseMode.HTML
         )
-        logger.info(f"Пользователь {user_id} отправил аудио/голос")
+        logger.info("Пользователь %s отправил аудио/голос", user_id,
+                    extra={'user_id': user_id, 'handler': 'voice'})
+    
+    async def _reply_no_photo_access(self, update: Update, access_info: Dict):
+        """Ответ пользователю без доступа к анализу фото"""
+        if not access_info.get('key_type'):
+            # Ключ не активирован вообще
+            await update.message.reply_text(
+                "🔒 Для использования бота необходимо активировать ключ доступа.\n\n"
+                "Используйте команду /activate и введите ваш ключ.",
+                parse_mode=ParseMode.HTML
+            )
+        else:
+            # Лимит исчерпан
+            await update.message.reply_text(
+                f"❌ {access_info['message']}\n\n"
+                "Вы исчерпали лимит анализов фотографий.\n\n"
+                "💡 Для продолжения работы:\n"
+                "• Получите новый ключ у администратора\n"
+                "• Или используйте /key_info для просмотра информации",
+                parse_mode=ParseMode.HTML
+            )
     
     async def handle_photo(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик изображений"""
+        with PHOTO_STAGES['total'].time():
+            await self._handle_photo(update, context)
+    
+    async def _handle_photo(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Этапы обработки фото (замеры по этапам - PHOTO_STAGES)"""
+        started = time.monotonic()
         user_id = update.effective_user.id
         
-        # Проверка доступа
-        access_info = await self.db.check_user_access(user_id)
-        
-        if not access_info.get('has_access'):
-            if not access_info.get('key_type'):
-                # Ключ не активирован вообще
-                await update.message.reply_text(
-                    "🔒 Для использования бота необходимо активировать ключ доступа.\n\n"
-                    "Используйте команду /activate и введите ваш ключ.",
-                    parse_mode=ParseMode.HTML
-                )
-            else:
-                # Лимит исчерпан
-                await update.message.reply_text(
-                    f"❌ {access_info['message']}\n\n"
-                    "Вы исчерпали лимит анализов фотографий.\n\n"
-                    "💡 Для продолжения работы:\n"
-                    "• Получите новый ключ у администратора\n"
-                    "• Или используйте /key_info для просмотра информации",
-                    parse_mode=ParseMode.HTML
-                )
-            return
-        
-        # Проверка rate limiting
-        if not await self.db.check_rate_limit(user_id, minutes=1, max_requests=config.MAX_REQUESTS_PER_MINUTE):
+        # Проверка rate limiting до обращения к БД (в памяти; лимит зависит
+        # от типа ключа - берём его из кэша доступа, без запроса)
+        with PHOTO_STAGES['rate_limit'].time():
+            key_type = self.db.cached_key_type(user_id)
+            allowed = self.rate_limiter.allow(user_id, tier=key_type)
+        if not allowed:
+            RATE_LIMITED.labels(key_type or 'default').inc()
             await update.message.reply_text(
                 "⏰ Слишком много запросов! Пожалуйста, подожди немного.",
                 parse_mode=ParseMode.HTML
             )
             return
         
-        # Логирование запроса
-        await self.db.log_request(user_id, "image")
-        
-        # Отправка сообщения о обработке
-        processing_msg = await update.message.reply_text("📸 Анализирую фото...")
+        # Проверка доступа и резервирование анализа до вызова OpenAI
+        # (параллельные фото не смогут превысить лимит ключа) вместе с итогами
+        # дня и записью в журнал аудита - один запрос
+        with PHOTO_STAGES['preflight'].time():
+            preflight = await self.db.photo_preflight(user_id, audit=config.REQUEST_AUDIT_LOG)
+        if preflight is None:
+            await self._reply_no_photo_access(update, await self.db.check_user_access(user_id))
+            return
+        reservation = preflight['reservation']
         
+        quota_committed = False
         try:
-            # Получение фото (берём наибольшее качество)
-            photo = update.message.photo[-1]
-            file = await context.bot.get_file(photo.file_id)
-            
-            # Загрузка изображения
-            image_bytes = BytesIO()
-            await file.download_to_memory(image_bytes)
-            image_bytes.seek(0)
-            
-            # Получение дополнительного текста (caption)
-            caption = update.message.caption
-            
-            # Анализ изображения через OpenAI Vision
-            result = await self.openai_service.analyze_food_image(
-                image_bytes.read(),
-                user_text=caption
-            )
-            
-            # Получение статистики за день
-            daily_stats = await self.db.get_daily_calories(user_id)
-            daily_limit = await self.db.get_user_daily_limit(user_id)
-            
-            # Сохранение в БД
-            await self.db.add_meal(
-                user_id=user_id,
-                product_name=result.get('product_name', 'Продукт с фото'),
-                weight=result.get('weight'),
-                calories=result.get('calories', 0),
-                protein=result.get('protein', 0),
-                fat=result.get('fat', 0),
-                carbs=result.get('carbs', 0),
-                image_processed=True
-            )
+            # Отправка сообщения о обработке
+            with PHOTO_STAGES['reply'].time():
+                processing_msg = await update.message.reply_text("📸 Анализирую фото...")
+        except BaseException:
+            await self.db.release_image_quota(reservation)
+            raise
+        
+        # Промежуточные результаты потокового анализа
+        progress = ProgressEditor(processing_msg, config.STREAM_EDIT_INTERVAL)
+        try:
+            # Анализ фото (из кэша или через OpenAI Vision)
+            try:
+                result = await self._analyze_photo(
+                    context, user_id, update.message.photo, update.message.caption, progress
+                )
+            finally:
+                await progress.close()
             
-            # Логирование использования ключа (для ограниченных ключей)
-            await self.db.log_key_usage(user_id, usage_type='image')
+            # Сохранение приёма пищи и подтверждение резерва одной транзакцией -
+            # анализ засчитывается в лимит ключа
+            with PHOTO_STAGES['postflight'].time():
+                access_info = await self.db.photo_postflight(
+                    reservation,
+                    product_name=result.get('product_name', 'Продукт с фото'),
+                    weight=result.get('weight'),
+                    calories=result.get('calories', 0),
+                    protein=result.get('protein', 0),
+                    fat=result.get('fat', 0),
+                    carbs=result.get('carbs', 0)
+                )
+            quota_committed = True
             
             # Форматирование и отправка ответа
             response = self.openai_service.format_response(
                 result,
                 include_daily_stats=True,
-                daily_total=daily_stats['total_calories'],
-                daily_limit=daily_limit
+                daily_total=preflight['daily_stats']['total_calories'],
+                daily_limit=preflight['daily_limit']
             )
             
             # Добавление информации об оставшихся анализах
-            access_info = await self.db.check_user_access(user_id)
             if access_info.get('key_type') == 'limited' and access_info.get('images_left') is not None:
                 images_left = access_info['images_left']
                 response += f"\n\n📊 Осталось анализов изображений: {images_left}"
                 if images_left <= 5:
                     response += " ⚠️"
             
-            await processing_msg.edit_text(response, parse_mode=ParseMode.HTML)
-            logger.info(f"Обработано фото от пользователя {user_id}: {result.get('product_name', 'unknown')}")
+            with PHOTO_STAGES['edit'].time():
+                await processing_msg.edit_text(response, parse_mode=ParseMode.HTML)
+            # Первый результат - промежуточная правка или (кэш, ответ без потока) финальная
+            first_field = (progress.first_edit_at or time.monotonic()) - started
+            PHOTO_STAGES['first_field'].observe(first_field)
+            logger.info(
+                "Обработано фото от пользователя %s: %s", user_id, result.get('product_name', 'unknown'),
+                extra={'user_id': user_id, 'handler': 'photo',
+                       'latency_ms': round((time.monotonic() - started) * 1000, 1),
+                       'first_field_ms': round(first_field * 1000, 1),
+                       'progress_edits': progress.edits}
+            )
             
         except Exception as e:
-            logger.error(f"Ошибка при обработке фото: {e}")
+            ERRORS.labels('bot', 'photo').inc()
+            logger.error(
+                "Ошибка при обработке фото: %s", e,
+                extra={'user_id': user_id, 'handler': 'photo',
+                       'latency_ms': round((time.monotonic() - started) * 1000, 1)}
+            )
             await processing_msg.edit_text(
                 "❌ Не удалось обработать изображение. "
                 "Пожалуйста, попробуйте:\n"
@@ -485,10 +766,15 @@ class CalorieCounterBot:
                 "Или просто опишите блюдо текстом!",
                 parse_mode=ParseMode.HTML
             )
+        finally:
+            # Анализ не удался - возвращаем зарезервированный слот
+            if not quota_committed:
+                await self.db.release_image_quota(reservation)
     
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик ошибок"""
-        logger.error(f"Update {update} caused error {context.error}")
+        ERRORS.labels('bot', 'update').inc()
+        logger.error("Update %s caused error %s", update, context.error)
         
         if update and update.effective_message:
             await update.effective_message.reply_text(
@@ -499,26 +785,51 @@ class CalorieCounterBot:
     
     async def post_init(self, application: Application):
         """Инициализация после запуска приложения"""
+        await self.db.open()
         await self.db.init_db()
+        if self.maintenance is not None:
+            self.maintenance.start()
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+        if self.metrics_reporter is not None:
+            self.metrics_reporter.start()
         logger.info("Бот инициализирован и готов к работе")
     
-    def run(self):
-        """Запуск бота"""
-        if not config.TELEGRAM_BOT_TOKEN:
-            logger.error("TELEGRAM_BOT_TOKEN не установлен!")
-            return
-        
-        if not config.OPENAI_API_KEY:
-            logger.error("OPENAI_API_KEY не установлен!")
-            return
-        
-        # Создание приложения
-        application = (
+    async def post_shutdown(self, application: Application):
+        """Освобождение ресурсов при остановке приложения"""
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        if self.maintenance is not None:
+            await self.maintenance.stop()
+        await self.openai_service.close()
+        await self.db.close()
+        if self.update_filter is not None and self.update_filter.dropped():
+            logger.info("Отброшено обновлений неподписанных типов: %s", self.update_filter.dropped())
+        if self.metrics_reporter is not None:
+            await self.metrics_reporter.stop()
+        logger.info("Бот остановлен")
+    
+    def build_application(self, update_processor: Optional[BaseUpdateProcessor] = None) -> Application:
+        """
+        Создание Application с зарегистрированными обработчиками
+        
+        По умолчанию обновления разных пользователей обрабатываются
+        параллельно (CONCURRENT_UPDATES), одного пользователя - по порядку.
+        """
+        if update_processor is None:
+            update_processor = PerUserUpdateProcessor(config.CONCURRENT_UPDATES)
+        builder = (
             Application.builder()
             .token(config.TELEGRAM_BOT_TOKEN)
+            .connection_pool_size(config.TELEGRAM_CONNECTION_POOL_SIZE)
+            .concurrent_updates(update_processor)
             .post_init(self.post_init)
-            .build()
+            .post_shutdown(self.post_shutdown)
         )
+        if config.TELEGRAM_BASE_URL:
+            base_url = config.TELEGRAM_BASE_URL.rstrip('/')
+            builder = builder.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+        application = builder.build()
         
         # Регистрация обработчиков команд
         application.add_handler(CommandHandler("start", self.start_command))
@@ -534,13 +845,101 @@ class CalorieCounterBot:
         application.add_handler(MessageHandler(filters.PHOTO, self.handle_photo))
         application.add_handler(MessageHandler(filters.VOICE | filters.AUDIO, self.handle_voice_audio))
         
+        # Подписка только на типы обновлений, нужные обработчикам; остальные
+        # отсекаются в группе -1 до обработчиков и обращений к БД
+        self.update_filter = UpdateTypeFilter(allowed_updates_for(application))
+        application.add_handler(self.update_filter.handler(), group=-1)
+        logger.info("Типы обновлений: %s", self.update_filter.allowed_updates or "все")
+        
         # Регистрация обработчика ошибок
         application.add_error_handler(self.error_handler)
+        return application
+    
+    def create_webhook_server(self, application: Application, port: Optional[int] = None,
+                              secret_token: Optional[str] = None) -> WebhookServer:
+        """Webhook-сервер с параметрами из config"""
+        return WebhookServer(
+            application,
+            listen=config.WEBHOOK_LISTEN,
+            port=config.WEBHOOK_PORT if port is None else port,
+            url_path=config.WEBHOOK_PATH,
+            secret_token=secret_token,
+            max_pending_updates=config.WEBHOOK_MAX_PENDING_UPDATES,
+            allowed_updates=self.update_filter.allowed_updates if self.update_filter else None,
+            ssl_context=make_ssl_context(config.WEBHOOK_CERT, config.WEBHOOK_KEY)
+        )
+    
+    async def run_webhook(self, application: Application):
+        """
+        Работа в режиме webhook до SIGINT/SIGTERM
+        
+        Порядок остановки: сервер перестаёт принимать запросы и дочитывает
+        начатые, затем Application обрабатывает уже принятые обновления,
+        после чего освобождаются ресурсы (post_shutdown).
+        """
+        secret_token = config.WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32)
+        server = self.create_webhook_server(application, secret_token=secret_token)
+        
+        stop_signal = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_signal.set)
+            except NotImplementedError:
+                # Windows: у цикла событий нет add_signal_handler
+                signal.signal(sig, lambda *_: loop.call_soon_threadsafe(stop_signal.set))
+        
+        await application.initialize()
+        try:
+            await self.post_init(application)
+            await application.start()
+            await server.start()
+            try:
+                certificate = open(config.WEBHOOK_CERT, 'rb') if config.WEBHOOK_CERT else None
+                try:
+                    await application.bot.set_webhook(
+                        url=webhook_address(config.WEBHOOK_URL, config.WEBHOOK_PATH),
+                        certificate=certificate,
+                        secret_token=secret_token,
+                        max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+                        allowed_updates=self.update_filter.subscribed_updates
+                    )
+                finally:
+                    if certificate is not None:
+                        certificate.close()
+                logger.info("Webhook установлен, бот работает")
+                await stop_signal.wait()
+                logger.info("Остановка: завершение приёма обновлений...")
+            finally:
+                await server.stop(drain_timeout=config.WEBHOOK_DRAIN_TIMEOUT)
+                if application.running:
+                    await application.stop()
+        finally:
+            await application.shutdown()
+            await self.post_shutdown(application)
+    
+    def run(self):
+        """Запуск бота"""
+        if not config.TELEGRAM_BOT_TOKEN:
+            logger.error("TELEGRAM_BOT_TOKEN не установлен!")
+            return
+        
+        if not config.OPENAI_API_KEY:
+            logger.error("OPENAI_API_KEY не установлен!")
+            return
+        
+        application = self.build_application()
         
         # Запуск бота
-        logger.info("Запуск бота...")
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
-
+        if config.BOT_MODE == "webhook":
+            if not config.WEBHOOK_URL:
+                logger.error("WEBHOOK_URL не установлен для режима webhook!")
+                return
+            logger.info("Запуск бота (webhook)...")
+            asyncio.run(self.run_webhook(application))
+        else:
+            logger.info("Запуск бота (polling)...")
+            application.run_polling(allowed_updates=self.update_filter.subscribed_updates)
 
 def main():
     """Главная функция"""
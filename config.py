@@ -5,21 +5,133 @@ load_dotenv()
 
 # Telegram Bot Configuration
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL")  # None - api.telegram.org (переопределяется для локального Bot API/заглушек)
+TELEGRAM_CONNECTION_POOL_SIZE = 16  # Соединений к Bot API для ответов при параллельной обработке
+CONCURRENT_UPDATES = 8  # Обновлений разных пользователей, обрабатываемых одновременно (одного - по очереди)
+
+# Получение обновлений: "polling" (getUpdates) или "webhook" (встроенный HTTP-сервер)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Публичный https-адрес, на который Telegram шлёт обновления
+WEBHOOK_LISTEN = "0.0.0.0"
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = "/telegram"
+# Секрет в заголовке X-Telegram-Bot-Api-Secret-Token; None - случайный при каждом запуске
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN")
+WEBHOOK_CERT = os.getenv("WEBHOOK_CERT")  # TLS без обратного прокси: сертификат и ключ (PEM)
+WEBHOOK_KEY = os.getenv("WEBHOOK_KEY")
+WEBHOOK_MAX_CONNECTIONS = 40  # Одновременных соединений со стороны Telegram (1-100)
+WEBHOOK_MAX_PENDING_UPDATES = 1000  # Больше в очереди - отвечаем 503, Telegram повторит позже
+WEBHOOK_DRAIN_TIMEOUT = 30  # Секунд на завершение начатых запросов при остановке
 
 # OpenAI Configuration
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = "gpt-4o"  # Используем gpt-4o вместо gpt-5-codex (который пока не доступен)
 OPENAI_VISION_MODEL = "gpt-4o"  # Модель с поддержкой vision
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # None - официальный API (переопределяется для заглушек/прокси)
+OPENAI_MAX_CONCURRENT_REQUESTS = 8  # Максимум одновременных запросов к OpenAI, остальные ждут в очереди
+OPENAI_REQUEST_TIMEOUT = 60  # Таймаут одной попытки запроса к OpenAI, секунд
+# Повторы клиента OpenAI после ошибки соединения, 429 и 5xx. Таймаут действует на
+# каждую попытку: слот ограничителя занят до (OPENAI_MAX_RETRIES + 1) * OPENAI_REQUEST_TIMEOUT
+OPENAI_MAX_RETRIES = 1
+# Потоковый ответ Vision API: сообщение «Анализирую фото...» обновляется
+# по мере готовности полей (продукт и калории, БЖУ, комментарии)
+OPENAI_STREAM_RESPONSES = os.getenv("OPENAI_STREAM_RESPONSES", "1") != "0"
+STREAM_EDIT_INTERVAL = 1.0  # Минимальный интервал между промежуточными правками сообщения, секунд
+# Двухуровневый анализ фото: сначала дешёвый быстрый проход (fast), сильная
+# модель (strong) - только если быстрый вернул quality_warning, низкую
+# уверенность или калории, не сходящиеся с БЖУ. Без маршрутизации - сразу strong.
+OPENAI_ROUTING = os.getenv("OPENAI_ROUTING", "1") != "0"
+# Переопределения параметров уровней поверх openai_service.DEFAULT_VISION_TIERS
+# (fast: gpt-4o-mini, detail low; strong: OPENAI_VISION_MODEL, detail по размеру
+# изображения). None - без изменений. Например:
+#   {'fast': {'model': "gpt-4.1-mini"}, 'strong': {'max_tokens': 1500}}
+OPENAI_VISION_TIERS = None
+OPENAI_ROUTING_MIN_CONFIDENCE = 0.6  # Уверенность быстрого прохода ниже этой - эскалация
+# Допустимое расхождение калорий и 4*Б + 9*Ж + 4*У + 7*алкоголь: доля или
+# ккал (большее из двух - у малых порций доля меньше ошибки округления БЖУ)
+OPENAI_ROUTING_ENERGY_TOLERANCE = 0.25
+OPENAI_ROUTING_ENERGY_MARGIN = 20
+
+# Предобработка изображений перед отправкой в Vision API
+IMAGE_MAX_SIDE = 1024  # Длинная сторона после уменьшения, пикселей
+IMAGE_JPEG_QUALITY = 85  # Качество перекодирования JPEG
+IMAGE_LOW_DETAIL_MAX_SIDE = 512  # Изображения не больше этого размера отправляются с detail=low
+IMAGE_EXECUTOR = "thread"  # "thread" или "process" - пул для обработки изображений
+IMAGE_WORKERS = 2  # Количество потоков/процессов в пуле
+# Минимальная длинная сторона варианта фото из Telegram для анализа, пикселей.
+# Берётся самый маленький подходящий PhotoSize; самый большой - только
+# если модель вернула quality_warning.
+PHOTO_MIN_SIDE = 800
+
+# Кэш результатов анализа (повторно присланные/пересланные фото)
+ANALYSIS_CACHE_MAX_ENTRIES = 2000  # Записей в памяти (LRU)
+ANALYSIS_CACHE_TTL = 7 * 24 * 3600  # Время жизни записи в SQLite, секунд
 
 # Database Configuration
 DATABASE_PATH = "calorie_counter.db"
+DB_READ_POOL_SIZE = 4  # Количество соединений-читателей в пуле (писатель всегда один)
+# Переопределения профиля хранения SQLite (PRAGMA при открытии каждого
+# соединения) поверх database.DEFAULT_STORAGE_PROFILE: WAL, synchronous=NORMAL,
+# auto_vacuum=INCREMENTAL, busy_timeout, mmap_size, cache_size.
+# None - оставить значение SQLite по умолчанию. Например:
+#   {'synchronous': 'FULL', 'mmap_size': None}
+DB_STORAGE_PROFILE = {}
+
+# Запись приёмов пищи и журналов через очередь пачек (один commit на пачку):
+#   "immediate" - каждая запись своей транзакцией (без очереди)
+#   "group"     - обработчик ждёт commit общей пачки (запись надёжна)
+#   "deferred"  - не ждёт: при аварии теряется до DB_WRITE_FLUSH_INTERVAL секунд записей
+DB_WRITE_MODE = "group"
+DB_WRITE_FLUSH_INTERVAL = 0.02  # секунд накопления пачки
+DB_WRITE_BATCH_SIZE = 500  # операций в пачке, при заполнении пишется сразу
+
+DB_ACCESS_CACHE = True  # Кэш состояния ключей в памяти (check_user_access без запросов к SQLite)
+# Срок жизни записи кэша ключей, секунд: за это время до бота доходят отзыв
+# и правки ключей из других процессов (db_maintenance.py revoke). 0 - без срока
+DB_ACCESS_CACHE_TTL = 60
 
-# Rate Limiting
+# Часовой пояс пользователей по умолчанию (границы "сегодня" для /stats и /history).
+# Время в БД хранится в UTC.
+DEFAULT_TIMEZONE = "Europe/Moscow"
+
+# Rate Limiting (в памяти процесса, см. rate_limiter.py)
 MAX_REQUESTS_PER_MINUTE = 20
+RATE_LIMITER = "sliding_window"  # "sliding_window" или "token_bucket"
+RATE_LIMIT_WINDOW_SECONDS = 60
+# Лимит запросов за окно по типу ключа пользователя ('default' - если тип неизвестен)
+RATE_LIMITS_BY_TIER = {
+    'default': MAX_REQUESTS_PER_MINUTE,
+    'limited': MAX_REQUESTS_PER_MINUTE,
+    'unlimited': 2 * MAX_REQUESTS_PER_MINUTE,
+}
+RATE_LIMITER_MAX_USERS = 100_000  # Больше - вытесняются самые давно неактивные
+
+# Журнал запросов requests_log (только аудит, пишется через очередь DB_WRITE_MODE)
+REQUEST_AUDIT_LOG = True
+
+# Обслуживание БД: свёртка старых строк requests_log/key_usage в дневные
+# агрегаты, очистка кэша анализов, инкрементальный vacuum.
+# Запускается фоном в боте и вручную: python db_maintenance.py compact
+DB_MAINTENANCE_INTERVAL = 6 * 3600  # секунд, 0 - не запускать в боте
+REQUESTS_LOG_RETENTION_DAYS = 30  # Сколько дней хранить сырые строки requests_log
+KEY_USAGE_RETENTION_DAYS = 180  # Сколько дней хранить сырые строки key_usage
+DB_MAINTENANCE_BATCH_SIZE = 500  # Строк на одну транзакцию удаления
+DB_MAINTENANCE_PAUSE = 0.05  # Пауза между пачками, секунд (писатель свободен для бота)
+DB_VACUUM_PAGES_PER_STEP = 256  # Страниц за один шаг incremental_vacuum
 
 # Logging Configuration
 LOG_LEVEL = "INFO"
 LOG_FILE = "bot.log"
+LOG_FILE_FORMAT = "json"  # "json" - одна JSON-запись на строку, "text" - прежний формат
+LOG_FILE_MAX_BYTES = 10 * 1024 * 1024  # Ротация файла лога по размеру
+LOG_FILE_BACKUP_COUNT = 5  # Сколько старых файлов лога хранить
+
+# Метрики горячего пути (metrics.py): этапы handle_photo, методы Database,
+# вызовы OpenAI, кэш, rate limit, ошибки
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"  # False - замеры не выполняются
+METRICS_HOST = "127.0.0.1"  # /metrics только для локального сборщика (Prometheus, агент)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))  # 0 - без HTTP-эндпоинта
+METRICS_LOG_INTERVAL = 300  # Сводка метрик в лог раз в N секунд, 0 - не писать
 
 # Daily calorie recommendations (можно расширить для разных пользователей)
 DEFAULT_DAILY_CALORIES = 2000
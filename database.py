@@ -1,20 +1,548 @@
 import aiosqlite
-from datetime import datetime
-from typing import List, Dict, Optional
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+from zoneinfo import ZoneInfo
 import logging
 
+from metrics import REGISTRY, instrument_methods
+
 logger = logging.getLogger(__name__)
 
+# Профиль хранения, применяемый к каждому соединению пула (PRAGMA имя = значение).
+# Порядок важен: auto_vacuum действует только для новой БД и должен быть
+# установлен до переключения journal_mode, остальные настройки - после.
+DEFAULT_STORAGE_PROFILE = {
+    'auto_vacuum': 'INCREMENTAL',  # только для новой БД; существующую переводит db_maintenance.py vacuum
+    'journal_mode': 'WAL',         # читатели не блокируются писателем
+    'synchronous': 'NORMAL',       # в WAL fsync только на checkpoint
+    'busy_timeout': 5000,          # мс ожидания блокировки вместо SQLITE_BUSY
+    'mmap_size': 64 * 1024 * 1024,
+    'cache_size': -16000,          # отрицательное значение - размер в КиБ
+}
+
+# Версионированные миграции схемы: (версия, описание, шаги).
+# Шаг - SQL-строка или корутина, принимающая соединение-писатель.
+# Каждая миграция применяется в отдельной транзакции вместе с записью
+# в schema_version, поэтому прерванный запуск безопасно повторить.
+# Уже выпущенные миграции не изменяются - только добавляются новые.
+MIGRATIONS = [
+    (1, "Индексы для горячих запросов", [
+        "CREATE INDEX IF NOT EXISTS idx_meals_user_time ON meals(user_id, meal_time)",
+        "CREATE INDEX IF NOT EXISTS idx_requests_log_user_time ON requests_log(user_id, request_time)",
+        "CREATE INDEX IF NOT EXISTS idx_key_usage_key_type_user ON key_usage(key_id, usage_type, user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_access_keys_activated_by ON access_keys(activated_by, is_active)",
+    ]),
+    (2, "Кэш результатов анализа фото", [
+        """
+        CREATE TABLE IF NOT EXISTS analysis_cache (
+            cache_key TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_analysis_cache_expires ON analysis_cache(expires_at)",
+    ]),
+    (3, "Счётчик использованных анализов в access_keys", [
+        "ALTER TABLE access_keys ADD COLUMN images_used INTEGER NOT NULL DEFAULT 0",
+        """
+        UPDATE access_keys SET images_used = (
+            SELECT COUNT(*) FROM key_usage
+            WHERE key_usage.key_id = access_keys.id
+              AND key_usage.user_id = access_keys.activated_by
+              AND key_usage.usage_type = 'image'
+        )
+        WHERE activated_by IS NOT NULL
+        """,
+    ]),
+    (4, "Дневные агрегаты журналов requests_log и key_usage", [
+        """
+        CREATE TABLE IF NOT EXISTS requests_daily (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            request_type TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, day, request_type)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS key_usage_daily (
+            key_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            usage_type TEXT NOT NULL,
+            day TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (key_id, user_id, usage_type, day)
+        ) WITHOUT ROWID
+        """,
+    ]),
+    (5, "Дневные итоги пользователей daily_totals", [
+        """
+        CREATE TABLE IF NOT EXISTS daily_totals (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            calories REAL NOT NULL DEFAULT 0,
+            protein REAL NOT NULL DEFAULT 0,
+            fat REAL NOT NULL DEFAULT 0,
+            carbs REAL NOT NULL DEFAULT 0,
+            meal_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID
+        """,
+        # Служебные параметры БД (например, пояс, по которому считаны daily_totals)
+        """
+        CREATE TABLE IF NOT EXISTS db_settings (
+            name TEXT PRIMARY KEY,
+            value TEXT
+        )
+        """,
+    ]),
+]
+
+# Свёртка старых строк журналов в дневные агрегаты (дни - по UTC).
+# Каждая пара (агрегат, удаление) выполняется в одной транзакции
+# по диапазону id, поэтому повторный или прерванный запуск не
+# считает строки дважды.
+LOG_ROLLUPS = {
+    'requests_log': (
+        "request_time",
+        """
+        INSERT INTO requests_daily (user_id, day, request_type, count)
+        SELECT user_id, date(request_time), COALESCE(request_type, ''), COUNT(*)
+        FROM requests_log WHERE id <= ? AND request_time < ?
+        GROUP BY 1, 2, 3
+        ON CONFLICT (user_id, day, request_type) DO UPDATE SET count = count + excluded.count
+        """,
+    ),
+    'key_usage': (
+        "used_at",
+        """
+        INSERT INTO key_usage_daily (key_id, user_id, usage_type, day, count)
+        SELECT key_id, user_id, usage_type, date(used_at), COUNT(*)
+        FROM key_usage WHERE id <= ? AND used_at < ?
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (key_id, user_id, usage_type, day) DO UPDATE SET count = count + excluded.count
+        """,
+    ),
+}
+
+
+# Формат CURRENT_TIMESTAMP в SQLite (всегда UTC)
+SQLITE_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def day_bounds_utc(tz_name: str, date: Optional[str] = None) -> Tuple[str, str, str]:
+    """
+    Границы календарного дня пользователя в UTC
+    
+    Args:
+        tz_name: Часовой пояс пользователя (IANA, например Europe/Moscow)
+        date: День в формате YYYY-MM-DD (по умолчанию - сегодня в этом поясе)
+        
+    Returns:
+        (день, начало, начало следующего дня) - полуоткрытый интервал
+        [начало, конец) в формате CURRENT_TIMESTAMP
+    """
+    tz = ZoneInfo(tz_name)
+    if date is None:
+        day = datetime.now(tz).date()
+    else:
+        day = datetime.strptime(date, "%Y-%m-%d").date()
+    start = datetime(day.year, day.month, day.day, tzinfo=tz)
+    next_day = day + timedelta(days=1)
+    end = datetime(next_day.year, next_day.month, next_day.day, tzinfo=tz)
+    return (
+        day.isoformat(),
+        start.astimezone(timezone.utc).strftime(SQLITE_TIMESTAMP_FORMAT),
+        end.astimezone(timezone.utc).strftime(SQLITE_TIMESTAMP_FORMAT),
+    )
+
+
+def utc_to_local(timestamp: str, tz_name: str) -> str:
+    """Перевод метки времени SQLite (UTC) в местное время пользователя"""
+    moment = datetime.strptime(timestamp, SQLITE_TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+    return moment.astimezone(ZoneInfo(tz_name)).strftime(SQLITE_TIMESTAMP_FORMAT)
+
+
+# Режимы записи через очередь WriteBehindQueue
+WRITE_MODES = ('immediate', 'group', 'deferred')
+
+# Очередь записи: операций в пачке, commit-ы (пачкой и при повторе по одной),
+# операции, не записанные и после повтора, размер очереди
+DB_WRITE_BATCH = REGISTRY.histogram('db_write_batch_operations', "Операций в пачке очереди записи",
+                                    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+DB_WRITE_COMMITS = REGISTRY.counter('db_write_commits_total', "Commit-ы очереди записи")
+DB_WRITE_FAILED = REGISTRY.counter('db_write_failed_total', "Операции очереди записи, завершившиеся ошибкой")
+DB_WRITE_PENDING = REGISTRY.gauge('db_write_pending', "Операции, ожидающие записи в очереди")
+
+# Кэш состояния ключей (check_user_access, photo_preflight)
+DB_ACCESS_CACHE_LOOKUPS = REGISTRY.counter('db_access_cache_lookups_total', "Обращения к кэшу доступа по результату",
+                                           ('result',))
+_ACCESS_CACHE_HITS = DB_ACCESS_CACHE_LOOKUPS.labels('hit')
+_ACCESS_CACHE_MISSES = DB_ACCESS_CACHE_LOOKUPS.labels('miss')
+
+# Резервирование одного анализа изображения (reserve_image_quota, photo_preflight):
+# слот занимается одним UPDATE с условием лимита. {returning} - дополнительные
+# столбцы RETURNING, их параметры идут после user_id.
+RESERVE_IMAGE_SQL = """
+    UPDATE access_keys SET images_used = images_used + 1
+    WHERE activated_by = ? AND is_active = 1
+      AND (key_type = 'unlimited' OR images_used < image_limit)
+    RETURNING id, key_type, image_limit, images_used{returning}
+"""
+
+# Подтверждение резерва (commit_image_quota, photo_postflight)
+KEY_USAGE_INSERT_SQL = """
+    INSERT INTO key_usage (user_id, key_id, usage_type, used_at)
+    VALUES (?, ?, 'image', ?)
+"""
+
+# Журнал запросов для аудита (log_request, photo_preflight)
+REQUEST_LOG_INSERT_SQL = """
+    INSERT INTO requests_log (user_id, request_type, request_time)
+    VALUES (?, ?, ?)
+"""
+
+
+class WriteBehindQueue:
+    """
+    Очередь отложенной записи: вставки из параллельных обработчиков
+    объединяются в одну транзакцию (один commit) на пачку
+    
+    Пачка записывается раз в flush_interval секунд или сразу при
+    накоплении batch_size операций. Режимы:
+      group    - вызывающий ждёт commit своей пачки: запись надёжна
+                 к моменту возврата, но commit общий на всю пачку;
+      deferred - вызывающий не ждёт: при аварийной остановке теряется
+                 не более flush_interval секунд записей.
+    Если пачка упала, она откатывается и операции повторяются по одной,
+    чтобы ошибка одной записи не теряла остальные.
+    """
+    
+    def __init__(self, db: 'Database', mode: str = 'group', flush_interval: float = 0.02,
+                 batch_size: int = 500):
+        if mode not in ('group', 'deferred'):
+            raise ValueError(f"Неизвестный режим очереди записи: {mode}")
+        self.db = db
+        self.mode = mode
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        # Операция: (список (sql, параметры), user_id, future или None)
+        self._pending: List[Tuple[List[Tuple[str, tuple]], Optional[int], Optional[asyncio.Future]]] = []
+        self._pending_users: Dict[int, int] = {}
+        self._has_pending = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = False
+        DB_WRITE_PENDING.set_function(lambda: len(self._pending))
+    
+    def has_pending(self, user_id: Optional[int] = None) -> bool:
+        """Есть ли незаписанные операции (пользователя или вообще)"""
+        if user_id is None:
+            return bool(self._pending_users) or bool(self._pending)
+        return user_id in self._pending_users
+    
+    async def submit(self, statements: List[Tuple[str, tuple]], user_id: Optional[int] = None,
+                     wait: Optional[bool] = None):
+        """
+        Постановка операции (одной или нескольких SQL-команд) в очередь
+        
+        Args:
+            statements: Команды, выполняемые вместе в транзакции пачки
+            user_id: Пользователь - для read-your-writes в его чтениях
+            wait: Ждать commit (по умолчанию - согласно режиму очереди)
+        """
+        if self._stopped:
+            # Иначе операция попала бы в очередь после финального сброса
+            raise RuntimeError("Очередь записи остановлена")
+        if wait is None:
+            wait = self.mode == 'group'
+        future = asyncio.get_running_loop().create_future() if wait else None
+        self._pending.append((statements, user_id, future))
+        if user_id is not None:
+            self._pending_users[user_id] = self._pending_users.get(user_id, 0) + 1
+        self._has_pending.set()
+        if len(self._pending) >= self.batch_size:
+            self._batch_full.set()
+        if self._task is None:
+            # Фоновая запись не запущена (пул закрыт) - пишем сразу
+            await self.flush()
+        if future is not None:
+            await future
+    
+    async def _apply(self, conn: aiosqlite.Connection, statements: List[Tuple[str, tuple]]):
+        for sql, params in statements:
+            await conn.execute(sql, params)
+    
+    async def flush(self):
+        """Запись всех накопленных операций"""
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            self._has_pending.clear()
+            self._batch_full.clear()
+            if not batch:
+                return
+            try:
+                async with self.db._write() as conn:
+                    for statements, _, _ in batch:
+                        await self._apply(conn, statements)
+                    await conn.commit()
+                DB_WRITE_COMMITS.inc()
+                results = [None] * len(batch)
+            except Exception as e:
+                logger.warning("Пачка записи (%s операций) откатилась: %s; повтор по одной", len(batch), e)
+                results = await self._flush_one_by_one(batch)
+            
+            DB_WRITE_BATCH.observe(len(batch))
+            for (statements, user_id, future), error in zip(batch, results):
+                if user_id is not None:
+                    left = self._pending_users[user_id] - 1
+                    if left:
+                        self._pending_users[user_id] = left
+                    else:
+                        del self._pending_users[user_id]
+                if error is not None:
+                    DB_WRITE_FAILED.inc()
+                    if future is None:
+                        logger.error("Ошибка отложенной записи: %s", error)
+                if future is not None and not future.done():
+                    if error is None:
+                        future.set_result(None)
+                    else:
+                        future.set_exception(error)
+    
+    async def _flush_one_by_one(self, batch) -> List[Optional[BaseException]]:
+        results = []
+        for statements, _, _ in batch:
+            try:
+                async with self.db._write() as conn:
+                    await self._apply(conn, statements)
+                    await conn.commit()
+                DB_WRITE_COMMITS.inc()
+                results.append(None)
+            except Exception as e:
+                results.append(e)
+        return results
+    
+    async def _run(self):
+        while True:
+            await self._has_pending.wait()
+            # Копим пачку flush_interval секунд или до заполнения
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            # shield: остановка не прерывает уже начатую пачку
+            await asyncio.shield(self.flush())
+    
+    def start(self):
+        """Запуск фоновой записи пачек"""
+        self._stopped = False
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    async def stop(self):
+        """Остановка фоновой записи с финальной записью очереди"""
+        self._stopped = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
 
 class Database:
-    """Класс для работы с базой данных SQLite"""
+    """Класс для работы с базой данных SQLite
     
-    def __init__(self, db_path: str):
+    Держит пул долгоживущих соединений: одно соединение-писатель
+    (все записи сериализуются через него) и несколько читателей.
+    Пул открывается через open() и закрывается через close();
+    при первом обращении без open() пул открывается автоматически.
+    После close() обращения к базе завершаются ошибкой, а не
+    переоткрывают пул; снова открыть его можно только явным open().
+    """
+    
+    def __init__(self, db_path: str, read_pool_size: int = 4,
+                 storage_profile: Optional[Dict] = None,
+                 default_timezone: str = "UTC", access_cache: bool = True,
+                 access_cache_ttl: Optional[float] = 60, write_mode: str = 'immediate', write_flush_interval: float = 0.02,
+                 write_batch_size: int = 500):
         self.db_path = db_path
+        self.default_timezone = default_timezone
+        ZoneInfo(default_timezone)  # ранняя проверка названия пояса
+        self.read_pool_size = max(1, read_pool_size)
+        self.storage_profile = dict(DEFAULT_STORAGE_PROFILE)
+        if storage_profile is not None:
+            unknown = set(storage_profile) - set(DEFAULT_STORAGE_PROFILE)
+            if unknown:
+                raise ValueError(f"Неизвестные параметры профиля хранения: {', '.join(sorted(unknown))}")
+            self.storage_profile.update(storage_profile)
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._readers: List[aiosqlite.Connection] = []
+        self._idle_readers: Optional[asyncio.Queue] = None
+        self._write_lock = asyncio.Lock()
+        self._open_lock = asyncio.Lock()
+        self._closed = False
+        self._trace_callback = None
+        # Кэш состояния ключей: user_id -> (срок годности, {key_id, key_type,
+        # image_limit, images_used} или None - ключа нет). Обновляется сквозной
+        # записью в activate_key, log_key_usage и revoke_key; изменения из
+        # других процессов (db_maintenance.py, generate_keys.py) видны не позже
+        # access_cache_ttl секунд. Версии защищают от записи в кэш снимка,
+        # прочитанного до параллельного изменения.
+        self.access_cache_enabled = access_cache
+        self.access_cache_ttl = access_cache_ttl
+        self._access_cache: Dict[int, Tuple[float, Optional[Dict]]] = {}
+        self._access_versions: Dict[int, int] = {}
+        # Очередь пакетной записи (meals, key_usage, requests_log, analysis_cache);
+        # 'immediate' - каждая запись своей транзакцией, без очереди
+        if write_mode not in WRITE_MODES:
+            raise ValueError(f"Неизвестный режим записи: {write_mode}")
+        self.write_queue: Optional[WriteBehindQueue] = None
+        if write_mode != 'immediate':
+            self.write_queue = WriteBehindQueue(self, write_mode, write_flush_interval, write_batch_size)
+    
+    # ==================== ПУЛ СОЕДИНЕНИЙ ====================
+    
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+    
+    async def _connect(self) -> aiosqlite.Connection:
+        """Открытие одного соединения пула"""
+        conn = await aiosqlite.connect(self.db_path)
+        conn.row_factory = aiosqlite.Row
+        # local_day(meal_time) - день в поясе default_timezone (для пересчёта daily_totals)
+        tz_name = self.default_timezone
+        await conn.create_function(
+            'local_day', 1, lambda ts: utc_to_local(ts, tz_name)[:10], deterministic=True
+        )
+        for name, value in self.storage_profile.items():
+            if value is None:
+                continue
+            await conn.execute(f"PRAGMA {name} = {value}")
+        if self._trace_callback is not None:
+            await conn.set_trace_callback(self._trace_callback)
+        return conn
+    
+    async def open(self):
+        """Открытие пула соединений (повторный вызов ничего не делает)"""
+        async with self._open_lock:
+            if self.is_open:
+                return
+            self._closed = False
+            self._writer = await self._connect()
+            self._readers = [await self._connect() for _ in range(self.read_pool_size)]
+            self._idle_readers = asyncio.Queue()
+            for conn in self._readers:
+                self._idle_readers.put_nowait(conn)
+            if self.write_queue is not None:
+                self.write_queue.start()
+            logger.info("Пул соединений открыт: 1 писатель, %d читателей, journal_mode=%s",
+                        self.read_pool_size, self.storage_profile.get('journal_mode'))
+    
+    async def close(self):
+        """Закрытие всех соединений пула (очередь записи сбрасывается)"""
+        self._closed = True
+        if self.write_queue is not None and self.is_open:
+            await self.write_queue.stop()
+        async with self._open_lock:
+            if not self.is_open:
+                return
+            # Дожидаемся завершения текущей записи
+            async with self._write_lock:
+                await self._writer.close()
+                self._writer = None
+            for conn in self._readers:
+                await conn.close()
+            self._readers = []
+            self._idle_readers = None
+            logger.info("Пул соединений закрыт")
+    
+    async def set_trace_callback(self, handler):
+        """Установка sqlite3 trace-callback на все соединения пула
+        
+        Вызывается с текстом каждого выполняемого SQL-запроса
+        (используется в бенчмарках и при отладке). None - отключить.
+        """
+        self._trace_callback = handler
+        if not self.is_open:
+            return
+        await self._writer.set_trace_callback(handler)
+        for conn in self._readers:
+            await conn.set_trace_callback(handler)
+    
+    async def _ensure_open(self):
+        """Ленивое первое открытие пула; после close() - ошибка"""
+        if self.is_open:
+            return
+        if self._closed:
+            raise RuntimeError("Пул соединений закрыт")
+        await self.open()
+    
+    @asynccontextmanager
+    async def _read(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Соединение-читатель из пула на время операции"""
+        await self._ensure_open()
+        idle = self._idle_readers
+        conn = await idle.get()
+        try:
+            yield conn
+        finally:
+            idle.put_nowait(conn)
+    
+    @asynccontextmanager
+    async def _write(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Эксклюзивный доступ к соединению-писателю
+        
+        Незакоммиченные изменения откатываются, если операция упала.
+        """
+        await self._ensure_open()
+        async with self._write_lock:
+            # Пул мог закрыться, пока операция ждала блокировку
+            writer = self._writer
+            if writer is None:
+                raise RuntimeError("Пул соединений закрыт")
+            try:
+                yield writer
+            except BaseException:
+                await writer.rollback()
+                raise
+    
+    async def _queued_write(self, statements: List[Tuple[str, tuple]],
+                            user_id: Optional[int] = None, wait: Optional[bool] = None):
+        """Запись через очередь пачек или, если её нет, отдельной транзакцией"""
+        if self.write_queue is None:
+            async with self._write() as db:
+                for sql, params in statements:
+                    await db.execute(sql, params)
+                await db.commit()
+            return
+        await self.write_queue.submit(statements, user_id, wait)
+    
+    async def flush_writes(self, user_id: Optional[int] = None):
+        """
+        Запись отложенных операций перед чтением (read-your-writes)
+        
+        Args:
+            user_id: Сбросить очередь, только если в ней есть записи
+                этого пользователя (None - если в ней есть что угодно)
+        """
+        if self.write_queue is not None and self.write_queue.has_pending(user_id):
+            await self.write_queue.flush()
+    
+    # ==================== СХЕМА ====================
     
     async def init_db(self):
         """Инициализация базы данных и создание таблиц"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             # Таблица пользователей
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS users (
@@ -83,47 +611,134 @@ class Database:
             """)
             
             await db.commit()
-            logger.info("База данных инициализирована")
+            await self._apply_migrations(db)
+            await self._check_daily_totals_timezone(db)
+            logger.info("База данных инициализирована (версия схемы %d)", await self._schema_version(db))
+    
+    async def _schema_version(self, db: aiosqlite.Connection) -> int:
+        """Текущая версия схемы (0 - миграции ещё не применялись)"""
+        async with db.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version") as cursor:
+            row = await cursor.fetchone()
+            return row[0]
+    
+    async def _apply_migrations(self, db: aiosqlite.Connection):
+        """Применение недостающих миграций из MIGRATIONS по порядку"""
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        await db.commit()
+        
+        current = await self._schema_version(db)
+        for version, description, steps in MIGRATIONS:
+            if version <= current:
+                continue
+            await db.execute("BEGIN")
+            try:
+                for step in steps:
+                    if isinstance(step, str):
+                        await db.execute(step)
+                    else:
+                        await step(db)
+                await db.execute("""
+                    INSERT INTO schema_version (version, description) VALUES (?, ?)
+                """, (version, description))
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                logger.error("Ошибка миграции схемы до версии %d (%s)", version, description)
+                raise
+            logger.info("Применена миграция схемы %d: %s", version, description)
     
     async def add_user(self, user_id: int, username: str = None, first_name: str = None):
         """Добавление нового пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 INSERT OR IGNORE INTO users (user_id, username, first_name)
                 VALUES (?, ?, ?)
             """, (user_id, username, first_name))
             await db.commit()
     
+    def _meal_statements(self, user_id: int, product_name: str, calories: float,
+                         weight: Optional[float], protein: Optional[float], fat: Optional[float],
+                         carbs: Optional[float], image_processed: bool,
+                         meal_time: str) -> List[Tuple[str, tuple]]:
+        """Вставка приёма пищи и обновление daily_totals - выполняются одной транзакцией"""
+        day = utc_to_local(meal_time, self.default_timezone)[:10]
+        return [
+            ("""
+                INSERT INTO meals (user_id, product_name, weight, calories, protein, fat, carbs,
+                                   image_processed, meal_time)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (user_id, product_name, weight, calories, protein, fat, carbs, image_processed,
+                  meal_time)),
+            ("""
+                INSERT INTO daily_totals (user_id, day, calories, protein, fat, carbs, meal_count)
+                VALUES (?, ?, ?, ?, ?, ?, 1)
+                ON CONFLICT (user_id, day) DO UPDATE SET
+                    calories = calories + excluded.calories,
+                    protein = protein + excluded.protein,
+                    fat = fat + excluded.fat,
+                    carbs = carbs + excluded.carbs,
+                    meal_count = meal_count + 1
+            """, (user_id, day, calories or 0, protein or 0, fat or 0, carbs or 0)),
+        ]
+    
     async def add_meal(self, user_id: int, product_name: str, calories: float,
                       weight: Optional[float] = None, protein: Optional[float] = None,
                       fat: Optional[float] = None, carbs: Optional[float] = None,
                       image_processed: bool = False):
         """Добавление приёма пищи"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                INSERT INTO meals (user_id, product_name, weight, calories, protein, fat, carbs, image_processed)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (user_id, product_name, weight, calories, protein, fat, carbs, image_processed))
-            await db.commit()
-            logger.info(f"Добавлен приём пищи для пользователя {user_id}: {product_name}")
+        # Время фиксируется сейчас, а не в момент записи пачки
+        meal_time = datetime.now(timezone.utc).strftime(SQLITE_TIMESTAMP_FORMAT)
+        await self._queued_write(self._meal_statements(
+            user_id, product_name, calories, weight, protein, fat, carbs, image_processed, meal_time
+        ), user_id)
+        logger.info("Добавлен приём пищи для пользователя %s: %s", user_id, product_name,
+                    extra={'user_id': user_id})
     
-    async def get_daily_calories(self, user_id: int, date: Optional[str] = None) -> Dict:
-        """Получение суммарных калорий за день"""
-        if date is None:
-            date = datetime.now().strftime("%Y-%m-%d")
+    async def get_daily_calories(self, user_id: int, date: Optional[str] = None,
+                                 tz: Optional[str] = None) -> Dict:
+        """
+        Получение суммарных калорий за день
         
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute("""
-                SELECT 
-                    COALESCE(SUM(calories), 0) as total_calories,
-                    COALESCE(SUM(protein), 0) as total_protein,
-                    COALESCE(SUM(fat), 0) as total_fat,
-                    COALESCE(SUM(carbs), 0) as total_carbs,
-                    COUNT(*) as meal_count
-                FROM meals
-                WHERE user_id = ? AND DATE(meal_time) = ?
-            """, (user_id, date)) as cursor:
+        В поясе default_timezone - поиск одной строки daily_totals по
+        первичному ключу; в другом поясе - суммирование приёмов пищи
+        за границы дня в этом поясе.
+        
+        Args:
+            user_id: ID пользователя
+            date: День YYYY-MM-DD в поясе пользователя (по умолчанию - сегодня)
+            tz: Часовой пояс пользователя (по умолчанию - default_timezone)
+        """
+        tz_name = tz or self.default_timezone
+        day, day_start, day_end = day_bounds_utc(tz_name, date)
+        await self.flush_writes(user_id)
+        
+        async with self._read() as db:
+            if tz_name == self.default_timezone:
+                query = """
+                    SELECT calories AS total_calories, protein AS total_protein,
+                           fat AS total_fat, carbs AS total_carbs, meal_count
+                    FROM daily_totals WHERE user_id = ? AND day = ?
+                """
+                params = (user_id, day)
+            else:
+                query = """
+                    SELECT 
+                        COALESCE(SUM(calories), 0) as total_calories,
+                        COALESCE(SUM(protein), 0) as total_protein,
+                        COALESCE(SUM(fat), 0) as total_fat,
+                        COALESCE(SUM(carbs), 0) as total_carbs,
+                        COUNT(*) as meal_count
+                    FROM meals
+                    WHERE user_id = ? AND meal_time >= ? AND meal_time < ?
+                """
+                params = (user_id, day_start, day_end)
+            async with db.execute(query, params) as cursor:
                 row = await cursor.fetchone()
                 if row:
                     return {
@@ -135,31 +750,80 @@ class Database:
                     }
                 return {'total_calories': 0, 'total_protein': 0, 'total_fat': 0, 'total_carbs': 0, 'meal_count': 0}
     
-    async def get_user_meals_today(self, user_id: int) -> List[Dict]:
-        """Получение всех приёмов пищи пользователя за сегодня"""
-        date = datetime.now().strftime("%Y-%m-%d")
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+    async def get_period_totals(self, user_id: int, days: int = 7,
+                                end_date: Optional[str] = None) -> Dict:
+        """
+        Итоги за несколько дней (неделя, месяц) из daily_totals
+        
+        Args:
+            days: Длина периода в днях, включая end_date
+            end_date: Последний день YYYY-MM-DD (по умолчанию - сегодня
+                в поясе default_timezone)
+            
+        Returns:
+            start, end, total_* за период, active_days, average_calories
+            (на день с приёмами пищи) и days - список итогов по дням
+        """
+        end_day, _, _ = day_bounds_utc(self.default_timezone, end_date)
+        start_day = (datetime.strptime(end_day, "%Y-%m-%d").date()
+                     - timedelta(days=days - 1)).isoformat()
+        await self.flush_writes(user_id)
+        
+        async with self._read() as db:
+            async with db.execute("""
+                SELECT day, calories, protein, fat, carbs, meal_count
+                FROM daily_totals
+                WHERE user_id = ? AND day >= ? AND day <= ?
+                ORDER BY day
+            """, (user_id, start_day, end_day)) as cursor:
+                rows = [dict(row) for row in await cursor.fetchall()]
+        
+        totals = {
+            'start': start_day,
+            'end': end_day,
+            'total_calories': sum(r['calories'] for r in rows),
+            'total_protein': sum(r['protein'] for r in rows),
+            'total_fat': sum(r['fat'] for r in rows),
+            'total_carbs': sum(r['carbs'] for r in rows),
+            'meal_count': sum(r['meal_count'] for r in rows),
+            'active_days': len(rows),
+            'days': rows,
+        }
+        totals['average_calories'] = totals['total_calories'] / len(rows) if rows else 0
+        return totals
+    
+    async def get_user_meals_today(self, user_id: int, tz: Optional[str] = None) -> List[Dict]:
+        """
+        Получение всех приёмов пищи пользователя за сегодня
+        
+        В каждой записи meal_time остаётся в UTC, а local_meal_time -
+        то же время в поясе пользователя.
+        """
+        tz_name = tz or self.default_timezone
+        _, day_start, day_end = day_bounds_utc(tz_name)
+        await self.flush_writes(user_id)
+        async with self._read() as db:
             async with db.execute("""
                 SELECT * FROM meals
-                WHERE user_id = ? AND DATE(meal_time) = ?
+                WHERE user_id = ? AND meal_time >= ? AND meal_time < ?
                 ORDER BY meal_time DESC
-            """, (user_id, date)) as cursor:
+            """, (user_id, day_start, day_end)) as cursor:
                 rows = await cursor.fetchall()
-                return [dict(row) for row in rows]
+        meals = [dict(row) for row in rows]
+        for meal in meals:
+            meal['local_meal_time'] = utc_to_local(meal['meal_time'], tz_name)
+        return meals
     
     async def log_request(self, user_id: int, request_type: str):
-        """Логирование запроса для rate limiting"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                INSERT INTO requests_log (user_id, request_type)
-                VALUES (?, ?)
-            """, (user_id, request_type))
-            await db.commit()
+        """Логирование запроса в журнал requests_log (через очередь - без ожидания commit)"""
+        request_time = datetime.now(timezone.utc).strftime(SQLITE_TIMESTAMP_FORMAT)
+        await self._queued_write([(REQUEST_LOG_INSERT_SQL, (user_id, request_type, request_time))],
+                                 user_id, wait=False)
     
     async def check_rate_limit(self, user_id: int, minutes: int = 1, max_requests: int = 20) -> bool:
         """Проверка ограничения скорости запросов"""
-        async with aiosqlite.connect(self.db_path) as db:
+        await self.flush_writes(user_id)
+        async with self._read() as db:
             async with db.execute("""
                 SELECT COUNT(*) as count FROM requests_log
                 WHERE user_id = ? AND request_time >= datetime('now', '-' || ? || ' minutes')
@@ -170,7 +834,7 @@ class Database:
     
     async def get_user_daily_limit(self, user_id: int) -> int:
         """Получение дневной нормы калорий пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             async with db.execute("""
                 SELECT daily_calorie_limit FROM users WHERE user_id = ?
             """, (user_id,)) as cursor:
@@ -181,17 +845,18 @@ class Database:
     
     async def add_access_key(self, key_code: str, key_type: str, image_limit: Optional[int] = None):
         """Добавление ключа доступа в базу данных"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             try:
                 await db.execute("""
                     INSERT INTO access_keys (key_code, key_type, image_limit)
                     VALUES (?, ?, ?)
                 """, (key_code, key_type, image_limit))
                 await db.commit()
-                logger.info(f"Ключ добавлен: {key_code[:8]}... (тип: {key_type})")
+                logger.info("Ключ добавлен: %s... (тип: %s)", key_code[:8], key_type)
                 return True
             except Exception as e:
-                logger.error(f"Ошибка при добавлении ключа: {e}")
+                await db.rollback()
+                logger.error("Ошибка при добавлении ключа: %s", e)
                 return False
     
     async def activate_key(self, key_code: str, user_id: int) -> Dict:
@@ -201,9 +866,7 @@ class Database:
         Returns:
             Dict с результатом активации
         """
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            
+        async with self._write() as db:
             # Проверка существования ключа
             async with db.execute("""
                 SELECT * FROM access_keys WHERE key_code = ?
@@ -234,6 +897,14 @@ class Database:
             """, (user_id, key_code))
             await db.commit()
             
+            # Отключённый ключ доступа не даёт - как в _load_access_state
+            self._set_access_state(user_id, {
+                'key_id': key_row['id'],
+                'key_type': key_row['key_type'],
+                'image_limit': key_row['image_limit'],
+                'images_used': key_row['images_used'],
+            } if key_row['is_active'] else None)
+            
             return {
                 'success': True,
                 'message': 'Ключ успешно активирован!',
@@ -241,16 +912,9 @@ class Database:
                 'image_limit': key_row['image_limit']
             }
     
-    async def check_user_access(self, user_id: int) -> Dict:
-        """
-        Проверка доступа пользователя
-        
-        Returns:
-            Dict с информацией о доступе
-        """
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            
+    async def _load_access_state(self, user_id: int) -> Optional[Dict]:
+        """Состояние ключа пользователя из БД (None - ключа нет)"""
+        async with self._read() as db:
             # Получаем ключ пользователя
             async with db.execute("""
                 SELECT * FROM access_keys WHERE activated_by = ? AND is_active = 1
@@ -258,69 +922,350 @@ class Database:
                 key_row = await cursor.fetchone()
             
             if not key_row:
-                return {
-                    'has_access': False,
-                    'message': 'Доступ не активирован. Используйте /activate'
-                }
-            
-            key_id = key_row['id']
-            key_type = key_row['key_type']
-            image_limit = key_row['image_limit']
-            
-            # Если безлимитный ключ
-            if key_type == 'unlimited':
-                return {
-                    'has_access': True,
-                    'key_type': 'unlimited',
-                    'images_used': 0,
-                    'images_left': None,
-                    'message': 'Безлимитный доступ'
-                }
-            
-            # Для ограниченного ключа - подсчитываем использование
-            async with db.execute("""
-                SELECT COUNT(*) as count FROM key_usage
-                WHERE user_id = ? AND key_id = ? AND usage_type = 'image'
-            """, (user_id, key_id)) as cursor:
-                usage_row = await cursor.fetchone()
-                images_used = usage_row['count'] if usage_row else 0
-            
-            images_left = image_limit - images_used
-            
-            if images_left <= 0:
-                return {
-                    'has_access': False,
-                    'key_type': 'limited',
-                    'images_used': images_used,
-                    'images_left': 0,
-                    'message': f'Лимит исчерпан ({image_limit}/{image_limit})'
-                }
+                return None
             
+            return {
+                'key_id': key_row['id'],
+                'key_type': key_row['key_type'],
+                'image_limit': key_row['image_limit'],
+                'images_used': key_row['images_used'],
+            }
+    
+    async def _get_access_state(self, user_id: int) -> Optional[Dict]:
+        """Состояние ключа пользователя из кэша, при промахе - из БД"""
+        entry = self._access_cache.get(user_id) if self.access_cache_enabled else None
+        if entry is not None and entry[0] > time.monotonic():
+            _ACCESS_CACHE_HITS.inc()
+            return entry[1]
+        
+        _ACCESS_CACHE_MISSES.inc()
+        version = self._access_versions.get(user_id, 0)
+        state = await self._load_access_state(user_id)
+        # Пока шёл запрос, состояние могло измениться (активация, списание) -
+        # тогда не кэшируем устаревший снимок
+        if self.access_cache_enabled and self._access_versions.get(user_id, 0) == version:
+            self._access_cache[user_id] = (self._access_cache_expiry(), state)
+        return state
+    
+    def cached_key_type(self, user_id: int) -> Optional[str]:
+        """Тип ключа пользователя из кэша доступа, без запроса к БД
+        
+        None - ключа нет или состояния нет в кэше (тогда вызывающий
+        применяет настройки по умолчанию).
+        """
+        entry = self._access_cache.get(user_id)
+        if entry is None or entry[1] is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]['key_type']
+    
+    def _access_cache_expiry(self) -> float:
+        if not self.access_cache_ttl:
+            return float('inf')
+        return time.monotonic() + self.access_cache_ttl
+    
+    def _set_access_state(self, user_id: int, state: Optional[Dict],
+                          expires_at: Optional[float] = None):
+        """Сквозная запись состояния ключа в кэш после изменения в БД"""
+        self._access_versions[user_id] = self._access_versions.get(user_id, 0) + 1
+        if self.access_cache_enabled:
+            if expires_at is None:
+                expires_at = self._access_cache_expiry()
+            self._access_cache[user_id] = (expires_at, state)
+    
+    def _bump_cached_usage(self, user_id: int, key_id: int, delta: int):
+        """Изменение images_used в кэше после записи в БД
+        
+        Изменяется текущая запись кэша, а не снимок, прочитанный до записи:
+        иначе параллельные списания одного пользователя теряются. Срок
+        годности записи не продлевается: списание не подтверждает, что
+        ключ не отозван другим процессом.
+        """
+        expires_at, state = self._access_cache.get(user_id, (0, None))
+        if state is not None and state['key_id'] == key_id and expires_at > time.monotonic():
+            self._set_access_state(user_id, {**state, 'images_used': max(0, state['images_used'] + delta)},
+                                   expires_at)
+        else:
+            self.invalidate_access_cache(user_id)
+    
+    def invalidate_access_cache(self, user_id: Optional[int] = None):
+        """Сброс кэша доступа для пользователя (или для всех, если user_id не указан)"""
+        if user_id is None:
+            for cached_user in list(self._access_cache):
+                self._access_versions[cached_user] = self._access_versions.get(cached_user, 0) + 1
+            self._access_cache.clear()
+            return
+        self._access_versions[user_id] = self._access_versions.get(user_id, 0) + 1
+        self._access_cache.pop(user_id, None)
+    
+    async def check_user_access(self, user_id: int) -> Dict:
+        """
+        Проверка доступа пользователя
+        
+        Returns:
+            Dict с информацией о доступе
+        """
+        return self._access_info(await self._get_access_state(user_id))
+    
+    @staticmethod
+    def _access_info(state: Optional[Dict]) -> Dict:
+        """Ответ check_user_access по состоянию ключа"""
+        if state is None:
+            return {
+                'has_access': False,
+                'message': 'Доступ не активирован. Используйте /activate'
+            }
+        
+        # Если безлимитный ключ
+        if state['key_type'] == 'unlimited':
             return {
                 'has_access': True,
+                'key_type': 'unlimited',
+                'images_used': 0,
+                'images_left': None,
+                'message': 'Безлимитный доступ'
+            }
+        
+        image_limit = state['image_limit']
+        images_used = state['images_used']
+        images_left = image_limit - images_used
+        
+        if images_left <= 0:
+            return {
+                'has_access': False,
                 'key_type': 'limited',
                 'images_used': images_used,
-                'images_left': images_left,
-                'message': f'Доступ активен ({images_used}/{image_limit})'
+                'images_left': 0,
+                'message': f'Лимит исчерпан ({image_limit}/{image_limit})'
             }
+        
+        return {
+            'has_access': True,
+            'key_type': 'limited',
+            'images_used': images_used,
+            'images_left': images_left,
+            'message': f'Доступ активен ({images_used}/{image_limit})'
+        }
     
     async def log_key_usage(self, user_id: int, usage_type: str = 'image'):
         """Логирование использования ключа"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Получаем key_id пользователя
+        state = await self._get_access_state(user_id)
+        if state is None:
+            return
+        
+        used_at = datetime.now(timezone.utc).strftime(SQLITE_TIMESTAMP_FORMAT)
+        statements = [("""
+            INSERT INTO key_usage (user_id, key_id, usage_type, used_at)
+            VALUES (?, ?, ?, ?)
+        """, (user_id, state['key_id'], usage_type, used_at))]
+        # Счётчик обновляется в той же транзакции, что и журнал
+        if usage_type == 'image':
+            statements.append(("""
+                UPDATE access_keys SET images_used = images_used + 1 WHERE id = ?
+            """, (state['key_id'],)))
+        await self._queued_write(statements, user_id)
+        
+        if usage_type == 'image':
+            self._bump_cached_usage(user_id, state['key_id'], 1)
+        logger.info("Использование ключа записано: user=%s, type=%s", user_id, usage_type,
+                    extra={'user_id': user_id})
+    
+    async def reserve_image_quota(self, user_id: int) -> Optional[Dict]:
+        """
+        Атомарное резервирование одного анализа изображения
+        
+        Слот занимается одним UPDATE с условием images_used < image_limit,
+        поэтому параллельные запросы одного пользователя не могут превысить
+        лимит. Резерв нужно завершить через commit_image_quota() (анализ
+        выполнен) или release_image_quota() (анализ не удался).
+        
+        Returns:
+            Резерв (key_id, user_id, key_type, image_limit, images_used)
+            или None, если ключа нет или лимит исчерпан
+        """
+        async with self._write() as db:
+            async with db.execute(RESERVE_IMAGE_SQL.format(returning=""), (user_id,)) as cursor:
+                row = await cursor.fetchone()
+            await db.commit()
+        return self._take_reservation(user_id, row)
+    
+    def _take_reservation(self, user_id: int, row: Optional[aiosqlite.Row]) -> Optional[Dict]:
+        """Резерв из строки UPDATE ... RETURNING с обновлением кэша доступа"""
+        if not row:
+            # Слот не получен - состояние в кэше могло устареть
+            self.invalidate_access_cache(user_id)
+            return None
+        
+        reservation = {
+            'key_id': row['id'],
+            'user_id': user_id,
+            'key_type': row['key_type'],
+            'image_limit': row['image_limit'],
+            'images_used': row['images_used'],
+        }
+        self._set_access_state(user_id, {
+            'key_id': row['id'],
+            'key_type': row['key_type'],
+            'image_limit': row['image_limit'],
+            'images_used': row['images_used'],
+        })
+        return reservation
+    
+    async def photo_preflight(self, user_id: int, audit: bool = False) -> Optional[Dict]:
+        """
+        Подготовка к анализу фото одним запросом
+        
+        Резервирует анализ (как reserve_image_quota) и в том же UPDATE ...
+        RETURNING возвращает дневную норму и итоги за сегодня (строка
+        daily_totals в поясе default_timezone), нужные для ответа.
+        
+        Args:
+            user_id: ID пользователя
+            audit: Записать запрос в requests_log в той же транзакции
+                (только если резерв получен)
+        
+        Returns:
+            {'reservation', 'daily_stats', 'daily_limit'} или None,
+            если ключа нет или лимит исчерпан
+        """
+        day, _, _ = day_bounds_utc(self.default_timezone)
+        await self.flush_writes(user_id)
+        async with self._write() as db:
+            async with db.execute(RESERVE_IMAGE_SQL.format(returning=""",
+                    COALESCE((SELECT daily_calorie_limit FROM users WHERE user_id = ?), 2000)
+                        AS daily_limit,
+                    (SELECT json_object(
+                        'total_calories', calories, 'total_protein', protein,
+                        'total_fat', fat, 'total_carbs', carbs, 'meal_count', meal_count)
+                     FROM daily_totals WHERE user_id = ? AND day = ?) AS daily_stats
+            """), (user_id, user_id, user_id, day)) as cursor:
+                row = await cursor.fetchone()
+            if row and audit:
+                await db.execute(REQUEST_LOG_INSERT_SQL, (
+                    user_id, 'image', datetime.now(timezone.utc).strftime(SQLITE_TIMESTAMP_FORMAT)
+                ))
+            await db.commit()
+        
+        reservation = self._take_reservation(user_id, row)
+        if reservation is None:
+            return None
+        if row['daily_stats'] is None:
+            daily_stats = {'total_calories': 0, 'total_protein': 0, 'total_fat': 0,
+                           'total_carbs': 0, 'meal_count': 0}
+        else:
+            daily_stats = json.loads(row['daily_stats'])
+        return {
+            'reservation': reservation,
+            'daily_stats': daily_stats,
+            'daily_limit': row['daily_limit'],
+        }
+    
+    async def photo_postflight(self, reservation: Dict, product_name: str, calories: float,
+                               weight: Optional[float] = None, protein: Optional[float] = None,
+                               fat: Optional[float] = None, carbs: Optional[float] = None) -> Dict:
+        """
+        Запись результата анализа фото одной транзакцией
+        
+        Приём пищи и подтверждение резерва (key_usage) записываются вместе:
+        либо оба, либо ни одного. Через очередь записи они попадают в общую
+        пачку с записями других обработчиков.
+        
+        Returns:
+            Обновлённое состояние доступа (как check_user_access) - из кэша,
+            без запроса к БД
+        """
+        user_id = reservation['user_id']
+        now = datetime.now(timezone.utc).strftime(SQLITE_TIMESTAMP_FORMAT)
+        statements = self._meal_statements(
+            user_id, product_name, calories, weight, protein, fat, carbs, True, now
+        )
+        statements.append((KEY_USAGE_INSERT_SQL, (user_id, reservation['key_id'], now)))
+        await self._queued_write(statements, user_id)
+        logger.info("Записан анализ фото: user=%s, %s", user_id, product_name,
+                    extra={'user_id': user_id})
+        return self._access_info(await self._get_access_state(user_id))
+    
+    async def commit_image_quota(self, reservation: Dict):
+        """Подтверждение резерва: запись использования в журнал key_usage"""
+        used_at = datetime.now(timezone.utc).strftime(SQLITE_TIMESTAMP_FORMAT)
+        await self._queued_write([(KEY_USAGE_INSERT_SQL, (reservation['user_id'], reservation['key_id'], used_at))],
+                                 reservation['user_id'])
+        logger.info("Использование ключа записано: user=%s, type=image", reservation['user_id'],
+                    extra={'user_id': reservation['user_id']})
+    
+    async def release_image_quota(self, reservation: Dict):
+        """Отмена резерва: слот возвращается пользователю"""
+        user_id = reservation['user_id']
+        async with self._write() as db:
+            await db.execute("""
+                UPDATE access_keys SET images_used = images_used - 1
+                WHERE id = ? AND images_used > 0
+            """, (reservation['key_id'],))
+            await db.commit()
+        
+        self._bump_cached_usage(user_id, reservation['key_id'], -1)
+    
+    async def revoke_key(self, key_code: str) -> bool:
+        """Отзыв ключа: ключ перестаёт давать доступ, кэш владельца сбрасывается"""
+        async with self._write() as db:
             async with db.execute("""
-                SELECT id FROM access_keys WHERE activated_by = ? AND is_active = 1
-            """, (user_id,)) as cursor:
+                SELECT activated_by FROM access_keys WHERE key_code = ?
+            """, (key_code,)) as cursor:
                 row = await cursor.fetchone()
+            if not row:
+                return False
+            await db.execute("""
+                UPDATE access_keys SET is_active = 0 WHERE key_code = ?
+            """, (key_code,))
+            await db.commit()
+        
+        if row['activated_by'] is not None:
+            self.invalidate_access_cache(row['activated_by'])
+        logger.info("Ключ отозван: %s...", key_code[:8])
+        return True
+    
+    async def reconcile_usage_counters(self, fix: bool = False) -> List[Dict]:
+        """
+        Сверка счётчика access_keys.images_used с журналом key_usage
+        (вместе с уже свёрнутыми в key_usage_daily строками)
+        
+        Счётчик включает ещё не подтверждённые резервы (reserve_image_quota),
+        поэтому сверку с исправлением стоит запускать при остановленном боте:
+        так же исправляются резервы, "потерянные" при аварийной остановке.
+        
+        Args:
+            fix: Исправить расхождения, приведя счётчик к журналу
             
-            if row:
-                key_id = row[0]
-                await db.execute("""
-                    INSERT INTO key_usage (user_id, key_id, usage_type)
-                    VALUES (?, ?, ?)
-                """, (user_id, key_id, usage_type))
+        Returns:
+            Список расхождений: key_id, key_code, activated_by, images_used, logged
+        """
+        await self.flush_writes()
+        async with self._write() as db:
+            async with db.execute("""
+                SELECT k.id AS key_id, k.key_code, k.activated_by, k.images_used,
+                       (SELECT COUNT(*) FROM key_usage u
+                        WHERE u.key_id = k.id AND u.user_id = k.activated_by
+                          AND u.usage_type = 'image')
+                       + (SELECT COALESCE(SUM(d.count), 0) FROM key_usage_daily d
+                          WHERE d.key_id = k.id AND d.user_id = k.activated_by
+                            AND d.usage_type = 'image') AS logged
+                FROM access_keys k
+                WHERE k.activated_by IS NOT NULL
+            """) as cursor:
+                rows = await cursor.fetchall()
+            mismatches = [dict(row) for row in rows if row['images_used'] != row['logged']]
+            
+            if fix and mismatches:
+                await db.executemany("""
+                    UPDATE access_keys SET images_used = ? WHERE id = ?
+                """, [(m['logged'], m['key_id']) for m in mismatches])
                 await db.commit()
-                logger.info(f"Использование ключа записано: user={user_id}, type={usage_type}")
+        
+        if fix:
+            for m in mismatches:
+                self.invalidate_access_cache(m['activated_by'])
+            if mismatches:
+                logger.warning("Исправлено расхождений счётчика использования: %s", len(mismatches))
+        return mismatches
     
     async def get_user_key_stats(self, user_id: int) -> Dict:
         """Получение статистики по ключу пользователя"""
@@ -331,3 +1276,305 @@ class Database:
             return access_info
         
         return access_info
+    
+    # ==================== КЭШ АНАЛИЗОВ ====================
+    
+    async def get_cached_analysis(self, cache_key: str) -> Optional[Tuple[Dict, float]]:
+        """Непросроченный результат анализа и время его истечения (unix time)"""
+        async with self._read() as db:
+            async with db.execute("""
+                SELECT result, expires_at FROM analysis_cache
+                WHERE cache_key = ? AND expires_at > ?
+            """, (cache_key, time.time())) as cursor:
+                row = await cursor.fetchone()
+        if not row:
+            return None
+        return json.loads(row['result']), row['expires_at']
+    
+    async def put_cached_analysis(self, cache_keys: List[str], result: Dict, expires_at: float):
+        """Сохранение результата анализа под несколькими ключами
+        
+        Запись идёт через очередь без ожидания commit: до сброса пачки
+        результат отдаёт память AnalysisCache.
+        """
+        payload = json.dumps(result, ensure_ascii=False)
+        await self._queued_write([("""
+            INSERT OR REPLACE INTO analysis_cache (cache_key, result, expires_at)
+            VALUES (?, ?, ?)
+        """, (key, payload, expires_at)) for key in cache_keys], wait=False)
+    
+    async def purge_expired_analysis_cache(self) -> int:
+        """Удаление просроченных записей кэша анализов"""
+        async with self._write() as db:
+            cursor = await db.execute("""
+                DELETE FROM analysis_cache WHERE expires_at <= ?
+            """, (time.time(),))
+            await db.commit()
+            return cursor.rowcount
+    
+    # ==================== ДНЕВНЫЕ ИТОГИ ====================
+    
+    async def _rebuild_daily_totals(self, db: aiosqlite.Connection) -> int:
+        """Пересчёт daily_totals из meals на соединении-писателе (без commit)"""
+        await db.execute("DELETE FROM daily_totals")
+        cursor = await db.execute("""
+            INSERT INTO daily_totals (user_id, day, calories, protein, fat, carbs, meal_count)
+            SELECT user_id, local_day(meal_time), SUM(COALESCE(calories, 0)),
+                   SUM(COALESCE(protein, 0)), SUM(COALESCE(fat, 0)), SUM(COALESCE(carbs, 0)),
+                   COUNT(*)
+            FROM meals
+            GROUP BY 1, 2
+        """)
+        await db.execute("""
+            INSERT OR REPLACE INTO db_settings (name, value) VALUES ('daily_totals_timezone', ?)
+        """, (self.default_timezone,))
+        return cursor.rowcount
+    
+    async def _check_daily_totals_timezone(self, db: aiosqlite.Connection):
+        """Пересчёт daily_totals, если они заполнены в другом поясе или ещё не заполнялись"""
+        async with db.execute("""
+            SELECT value FROM db_settings WHERE name = 'daily_totals_timezone'
+        """) as cursor:
+            row = await cursor.fetchone()
+        if row and row['value'] == self.default_timezone:
+            return
+        rows = await self._rebuild_daily_totals(db)
+        await db.commit()
+        logger.info("daily_totals пересчитаны для пояса %s (было: %s), строк: %d",
+                    self.default_timezone, row['value'] if row else "-", rows)
+    
+    async def rebuild_daily_totals(self) -> int:
+        """
+        Полный пересчёт daily_totals из meals одной транзакцией
+        
+        Returns:
+            Количество строк (пользователь, день)
+        """
+        await self.flush_writes()
+        async with self._write() as db:
+            rows = await self._rebuild_daily_totals(db)
+            await db.commit()
+        logger.info("daily_totals пересчитаны, строк: %d", rows)
+        return rows
+    
+    async def check_daily_totals(self) -> List[Dict]:
+        """
+        Сверка daily_totals с суммами по meals
+        
+        Returns:
+            Расхождения: user_id, day, meal_count в daily_totals и в meals
+            (None - строки нет)
+        """
+        await self.flush_writes()
+        async with self._read() as db:
+            async with db.execute("""
+                WITH actual AS (
+                    SELECT user_id, local_day(meal_time) AS day, COUNT(*) AS meal_count,
+                           SUM(COALESCE(calories, 0)) AS calories
+                    FROM meals GROUP BY 1, 2
+                )
+                SELECT a.user_id, a.day, t.meal_count AS stored, a.meal_count AS actual
+                FROM actual a
+                LEFT JOIN daily_totals t ON t.user_id = a.user_id AND t.day = a.day
+                WHERE t.meal_count IS NOT a.meal_count OR ABS(t.calories - a.calories) > 0.01
+                UNION ALL
+                SELECT t.user_id, t.day, t.meal_count, NULL
+                FROM daily_totals t
+                WHERE NOT EXISTS (SELECT 1 FROM actual a WHERE a.user_id = t.user_id AND a.day = t.day)
+            """) as cursor:
+                return [dict(row) for row in await cursor.fetchall()]
+    
+    # ==================== ОБСЛУЖИВАНИЕ ====================
+    
+    async def rollup_log(self, table: str, retention_days: int, batch_size: int = 500,
+                         pause: float = 0.05) -> int:
+        """
+        Свёртка строк журнала старше retention_days в дневные агрегаты
+        
+        Строки обрабатываются пачками по batch_size: агрегат и удаление
+        пачки - одна короткая транзакция, между пачками писатель
+        освобождается на pause секунд, чтобы не задерживать запросы бота.
+        
+        Args:
+            table: 'requests_log' или 'key_usage'
+            retention_days: Сколько полных дней (UTC) хранить сырые строки
+            
+        Returns:
+            Количество свёрнутых и удалённых строк
+        """
+        time_column, rollup_sql = LOG_ROLLUPS[table]
+        cutoff_day = datetime.now(timezone.utc).date() - timedelta(days=retention_days)
+        cutoff = cutoff_day.strftime(SQLITE_TIMESTAMP_FORMAT)
+        
+        total = 0
+        while True:
+            async with self._write() as db:
+                async with db.execute(f"""
+                    SELECT MAX(id) FROM (
+                        SELECT id FROM {table} WHERE {time_column} < ?
+                        ORDER BY id LIMIT ?
+                    )
+                """, (cutoff, batch_size)) as cursor:
+                    row = await cursor.fetchone()
+                last_id = row[0]
+                if last_id is None:
+                    break
+                await db.execute(rollup_sql, (last_id, cutoff))
+                cursor = await db.execute(f"""
+                    DELETE FROM {table} WHERE id <= ? AND {time_column} < ?
+                """, (last_id, cutoff))
+                await db.commit()
+                total += cursor.rowcount
+            await asyncio.sleep(pause)
+        
+        if total:
+            logger.info("Журнал %s: свёрнуто строк старше %s - %d", table, cutoff_day, total)
+        return total
+    
+    async def _page_stats(self, db: aiosqlite.Connection) -> Dict[str, int]:
+        stats = {}
+        for name in ('page_size', 'page_count', 'freelist_count', 'auto_vacuum'):
+            async with db.execute(f"PRAGMA {name}") as cursor:
+                stats[name] = (await cursor.fetchone())[0]
+        return stats
+    
+    async def incremental_vacuum(self, pages_per_step: int = 256, pause: float = 0.05) -> Dict:
+        """
+        Возврат свободных страниц файлу БД порциями по pages_per_step
+        
+        Работает только при auto_vacuum=INCREMENTAL (новые БД). Для БД,
+        созданной раньше, режим включается однократным vacuum() при
+        остановленном боте.
+        
+        Returns:
+            pages_freed, bytes_reclaimed, free_pages (осталось), auto_vacuum
+        """
+        async with self._write() as db:
+            before = await self._page_stats(db)
+        
+        if before['auto_vacuum'] == 2:  # INCREMENTAL
+            while True:
+                async with self._write() as db:
+                    async with db.execute("PRAGMA freelist_count") as cursor:
+                        free = (await cursor.fetchone())[0]
+                    if not free:
+                        break
+                    # Через execute() модуль sqlite3 освобождает лишь одну
+                    # страницу за вызов, executescript() выполняет шаг целиком
+                    await db.executescript(f"PRAGMA incremental_vacuum({pages_per_step})")
+                await asyncio.sleep(pause)
+        
+        async with self._write() as db:
+            # Перенос страниц из WAL в основной файл и усечение WAL
+            async with db.execute("PRAGMA wal_checkpoint(TRUNCATE)") as cursor:
+                await cursor.fetchall()
+            after = await self._page_stats(db)
+        
+        pages_freed = before['page_count'] - after['page_count']
+        return {
+            'pages_freed': pages_freed,
+            'bytes_reclaimed': pages_freed * after['page_size'],
+            'free_pages': after['freelist_count'],
+            'auto_vacuum': after['auto_vacuum'],
+        }
+    
+    async def vacuum(self) -> Dict:
+        """
+        Полный VACUUM с переключением на auto_vacuum=INCREMENTAL
+        
+        Перестраивает весь файл и блокирует БД на время работы -
+        запускать при остановленном боте.
+        """
+        async with self._write() as db:
+            before = await self._page_stats(db)
+            await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            await db.execute("VACUUM")
+            async with db.execute("PRAGMA wal_checkpoint(TRUNCATE)") as cursor:
+                await cursor.fetchall()
+            after = await self._page_stats(db)
+        pages_freed = before['page_count'] - after['page_count']
+        return {
+            'pages_freed': pages_freed,
+            'bytes_reclaimed': pages_freed * after['page_size'],
+            'free_pages': after['freelist_count'],
+            'auto_vacuum': after['auto_vacuum'],
+        }
+    
+    async def run_maintenance(self, requests_retention_days: int, key_usage_retention_days: int,
+                              batch_size: int = 500, pause: float = 0.05,
+                              vacuum_pages_per_step: int = 256) -> Dict:
+        """
+        Плановое обслуживание: свёртка журналов, очистка кэша анализов,
+        инкрементальный vacuum
+        
+        Returns:
+            Отчёт: requests_log_rows, key_usage_rows, analysis_cache_rows,
+            pages_freed, bytes_reclaimed, free_pages, auto_vacuum
+        """
+        started = time.monotonic()
+        report = {
+            'requests_log_rows': await self.rollup_log(
+                'requests_log', requests_retention_days, batch_size, pause),
+            'key_usage_rows': await self.rollup_log(
+                'key_usage', key_usage_retention_days, batch_size, pause),
+            'analysis_cache_rows': await self.purge_expired_analysis_cache(),
+        }
+        report.update(await self.incremental_vacuum(vacuum_pages_per_step, pause))
+        report['duration'] = time.monotonic() - started
+        logger.info(
+            "Обслуживание БД: requests_log -%d, key_usage -%d, analysis_cache -%d строк, "
+            "освобождено %d байт за %.1f с",
+            report['requests_log_rows'], report['key_usage_rows'], report['analysis_cache_rows'],
+            report['bytes_reclaimed'], report['duration'])
+        return report
+
+
+class MaintenanceScheduler:
+    """
+    Периодический запуск Database.run_maintenance() в фоне
+    
+    Первый запуск - через interval после start(), чтобы не нагружать
+    БД при старте бота. Ошибка обслуживания логируется и не
+    останавливает расписание.
+    """
+    
+    def __init__(self, db: Database, interval: float, **maintenance_options):
+        self.db = db
+        self.interval = interval
+        self.maintenance_options = maintenance_options
+        self._task: Optional[asyncio.Task] = None
+        self.last_report: Optional[Dict] = None
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.last_report = await self.db.run_maintenance(**self.maintenance_options)
+            except Exception as e:
+                logger.error("Ошибка обслуживания БД: %s", e)
+                continue
+            if self.last_report['auto_vacuum'] != 2 and self.last_report['free_pages']:
+                logger.warning("auto_vacuum выключен, свободных страниц: %d - остановите бота "
+                               "и выполните 'python db_maintenance.py vacuum'",
+                               self.last_report['free_pages'])
+    
+    def start(self):
+        """Запуск фонового расписания"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    async def stop(self):
+        """Остановка расписания (текущая пачка успевает закоммититься или откатывается)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Длительность публичных методов Database и ошибки в них (см. metrics.py).
+# open/close/set_trace_callback - не горячий путь.
+DB_CALL_SECONDS = REGISTRY.histogram('db_call_seconds', "Длительность вызова метода Database", ('method',))
+instrument_methods(Database, DB_CALL_SECONDS, 'db', exclude=('open', 'close', 'set_trace_callback'))
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Обслуживание базы данных бота.
+
+Команды:
+  check-usage [--fix]  - сверка счётчика images_used в access_keys
+                         с журналом key_usage (--fix исправляет расхождения)
+  daily-totals [--rebuild]
+                       - сверка дневных итогов daily_totals с meals
+                         (--rebuild пересчитывает таблицу целиком)
+  compact              - свёртка старых строк requests_log и key_usage
+                         в дневные агрегаты, очистка кэша анализов,
+                         инкрементальный vacuum (безопасно при работающем боте)
+  vacuum               - полный VACUUM с включением auto_vacuum=INCREMENTAL
+                         (для БД, созданных до его появления; бот остановить)
+  revoke KEY           - отзыв ключа доступа (работающий бот перестаёт
+                         принимать его не позже DB_ACCESS_CACHE_TTL секунд)
+
+Запуск: python db_maintenance.py <команда> [--db calorie_counter.db]
+"""
+import argparse
+import asyncio
+import sys
+
+import config
+from database import Database
+
+
+async def check_usage(db: Database, fix: bool) -> int:
+    mismatches = await db.reconcile_usage_counters(fix=fix)
+    if not mismatches:
+        print("✅ Счётчики использования совпадают с журналом key_usage")
+        return 0
+
+    print(f"⚠️  Расхождений: {len(mismatches)}")
+    for m in mismatches:
+        print(f" - ключ {m['key_code'][:8]}... (user {m['activated_by']}): "
+              f"счётчик {m['images_used']}, в журнале {m['logged']}")
+    if fix:
+        print("✅ Счётчики приведены к журналу")
+        return 0
+    print("Запустите с --fix, чтобы исправить")
+    return 1
+
+
+async def daily_totals(db: Database, rebuild: bool) -> int:
+    if rebuild:
+        rows = await db.rebuild_daily_totals()
+        print(f"✅ daily_totals пересчитаны: {rows} строк (пользователь, день)")
+        return 0
+
+    mismatches = await db.check_daily_totals()
+    if not mismatches:
+        print("✅ daily_totals совпадают с meals")
+        return 0
+
+    print(f"⚠️  Расхождений: {len(mismatches)}")
+    for m in mismatches[:20]:
+        print(f" - user {m['user_id']}, {m['day']}: приёмов в daily_totals {m['stored']}, "
+              f"в meals {m['actual']}")
+    print("Запустите с --rebuild, чтобы пересчитать")
+    return 1
+
+
+def format_bytes(size: int) -> str:
+    for unit in ('Б', 'КБ', 'МБ'):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == 'Б' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ГБ"
+
+
+async def compact(db: Database, args) -> int:
+    report = await db.run_maintenance(
+        requests_retention_days=args.requests_days,
+        key_usage_retention_days=args.key_usage_days,
+        batch_size=args.batch_size,
+        pause=config.DB_MAINTENANCE_PAUSE,
+        vacuum_pages_per_step=config.DB_VACUUM_PAGES_PER_STEP
+    )
+    print(f"requests_log:   свёрнуто строк {report['requests_log_rows']} "
+          f"(старше {args.requests_days} дн.)")
+    print(f"key_usage:      свёрнуто строк {report['key_usage_rows']} "
+          f"(старше {args.key_usage_days} дн.)")
+    print(f"analysis_cache: удалено просроченных {report['analysis_cache_rows']}")
+    print(f"Освобождено: {format_bytes(report['bytes_reclaimed'])} "
+          f"({report['pages_freed']} стр.) за {report['duration']:.1f} с")
+    if report['auto_vacuum'] != 2 and report['free_pages']:
+        print(f"⚠️  auto_vacuum выключен, свободных страниц: {report['free_pages']}. "
+              "Остановите бота и выполните: python db_maintenance.py vacuum")
+    return 0
+
+
+async def vacuum(db: Database) -> int:
+    report = await db.vacuum()
+    print(f"✅ VACUUM выполнен, освобождено {format_bytes(report['bytes_reclaimed'])} "
+          f"({report['pages_freed']} стр.)")
+    return 0
+
+
+async def revoke(db: Database, key_code: str) -> int:
+    if not await db.revoke_key(key_code):
+        print(f"❌ Ключ не найден: {key_code}")
+        return 1
+    print(f"✅ Ключ отозван: {key_code}")
+    return 0
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Обслуживание базы данных бота")
+    parser.add_argument('--db', default=config.DATABASE_PATH, help="путь к файлу БД")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    usage = commands.add_parser('check-usage', help="сверка счётчиков использования ключей")
+    usage.add_argument('--fix', action='store_true', help="исправить расхождения")
+
+    totals = commands.add_parser('daily-totals', help="сверка и пересчёт дневных итогов")
+    totals.add_argument('--rebuild', action='store_true', help="пересчитать из meals")
+
+    compact_parser = commands.add_parser('compact', help="свёртка журналов и incremental vacuum")
+    compact_parser.add_argument('--requests-days', type=int, default=config.REQUESTS_LOG_RETENTION_DAYS,
+                                help="сколько дней хранить сырые строки requests_log")
+    compact_parser.add_argument('--key-usage-days', type=int, default=config.KEY_USAGE_RETENTION_DAYS,
+                                help="сколько дней хранить сырые строки key_usage")
+    compact_parser.add_argument('--batch-size', type=int, default=config.DB_MAINTENANCE_BATCH_SIZE,
+                                help="строк на одну транзакцию удаления")
+
+    commands.add_parser('vacuum', help="полный VACUUM (при остановленном боте)")
+
+    revoke_parser = commands.add_parser('revoke', help="отзыв ключа доступа")
+    revoke_parser.add_argument('key', help="код ключа")
+
+    args = parser.parse_args()
+
+    db = Database(args.db, read_pool_size=1, storage_profile=config.DB_STORAGE_PROFILE,
+                  default_timezone=config.DEFAULT_TIMEZONE)
+    try:
+        await db.init_db()
+        if args.command == 'check-usage':
+            return await check_usage(db, args.fix)
+        if args.command == 'daily-totals':
+            return await daily_totals(db, args.rebuild)
+        if args.command == 'compact':
+            return await compact(db, args)
+        if args.command == 'vacuum':
+            return await vacuum(db)
+        if args.command == 'revoke':
+            return await revoke(db, args.key)
+    finally:
+        await db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(asyncio.run(main()))
+    except KeyboardInterrupt:
+        print('\n\n⚠️  Прервано пользователем')
+        sys.exit(1)
@@ -83,11 +83,11 @@ async def add_missing_keys(db: Database, existing: dict):
         current = existing[(key_type, limit)]
         need = max(0, target - len(current))
         if need == 0:
-            logger.info(f"Категория {key_type}:{limit} уже укомплектована ({len(current)}/{target})")
+            logger.info("Категория %s:%s уже укомплектована (%s/%s)", key_type, limit, len(current), target)
             continue
 
         prefix = make_prefix(key_type, limit)
-        logger.info(f"Добавляю {need} ключ(ей) для {key_type}:{limit}...")
+        logger.info("Добавляю %s ключ(ей) для %s:%s...", need, key_type, limit)
         for _ in range(need):
             # Генерируем уникальный код
             for _attempt in range(100):
@@ -129,15 +129,18 @@ async def main():
     print('ГЕНЕРАЦИЯ КЛЮЧЕЙ (идемпотентная)')
     print('=' * 70)
 
-    db = Database(config.DATABASE_PATH)
-    # Инициализация БД/таблиц
-    await db.init_db()
+    db = Database(config.DATABASE_PATH, default_timezone=config.DEFAULT_TIMEZONE)
+    try:
+        # Инициализация БД/таблиц
+        await db.init_db()
 
-    # Читаем существующие
-    existing = await fetch_existing(config.DATABASE_PATH)
+        # Читаем существующие
+        existing = await fetch_existing(config.DATABASE_PATH)
 
-    # Добавляем недостающие (уже активированные не трогаем)
-    await add_missing_keys(db, existing)
+        # Добавляем недостающие (уже активированные не трогаем)
+        await add_missing_keys(db, existing)
+    finally:
+        await db.close()
 
     # Перечитываем и сохраняем весь список в файл
     await save_all_keys_to_file(config.DATABASE_PATH, 'access_keys.txt')
@@ -0,0 +1,120 @@
+"""
+Логирование через очередь
+
+Обработчики и БД вызывают logger.* в потоке цикла событий: там запись
+только кладётся в очередь (QueueHandler), а запись в файл с ротацией
+по размеру и вывод в консоль выполняет фоновый поток QueueListener.
+Задержки диска не превращаются в задержку ответа пользователю.
+
+В файл пишутся JSON-строки: время, уровень, логгер, сообщение и поля
+из extra (user_id, handler, latency_ms, ...). Сообщения форматируются
+лениво: logger.info("... %s", value) - аргументы подставляются, только
+если запись проходит по уровню.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+from datetime import datetime, timezone
+from typing import Optional
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# Стандартные атрибуты LogRecord - всё остальное пришло через extra
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога одной JSON-строкой с полями из extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRS and not name.startswith('_'):
+                entry[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler без форматирования по шаблону в вызывающем потоке
+
+    Стандартный prepare() применяет форматтер к записи до постановки в
+    очередь; здесь в потоке цикла событий подставляются только аргументы
+    сообщения (их значения могут измениться позже), а JSON и шаблон
+    строки собирают обработчики в потоке QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level: str = 'INFO', log_file: Optional[str] = None, max_bytes: int = 10 * 1024 * 1024,
+                  backup_count: int = 5, file_format: str = 'json',
+                  console: bool = True) -> logging.handlers.QueueListener:
+    """
+    Настройка корневого логгера: очередь + фоновый поток записи
+
+    log_file пишется с ротацией по размеру (max_bytes, backup_count) в
+    формате file_format ("json" или "text"); консоль - всегда текстом.
+    Поток останавливается (с дописыванием очереди) при выходе из процесса.
+    """
+    global _listener
+    handlers = []
+    if log_file:
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        )
+        file_handler.setFormatter(JsonFormatter() if file_format == 'json' else logging.Formatter(TEXT_FORMAT))
+        handlers.append(file_handler)
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        handlers.append(console_handler)
+
+    stop_logging()
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(LazyQueueHandler(log_queue))
+    root.setLevel(getattr(logging, level))
+
+    listener.start()
+    _listener = listener
+    return listener
+
+
+def stop_logging():
+    """Дописать очередь и остановить фоновый поток (повторный вызов безопасен)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
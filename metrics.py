@@ -0,0 +1,481 @@
+"""
+Метрики горячего пути: счётчики, гистограммы задержек и текущие значения
+
+Метрики регистрируются в общем реестре REGISTRY модулями, которые их
+используют (этапы handle_photo в bot.py, методы Database, вызовы
+OpenAIService, кэш анализов). Отдаются в текстовом формате Prometheus
+(MetricsServer, GET /metrics) и периодической сводкой в лог
+(MetricsReporter).
+
+Gauge - текущее значение (очередь, запросы в работе): задаётся через
+set/inc/dec или функцией set_function(), которая читает состояние
+объекта при каждом сборе метрик.
+
+При REGISTRY.enabled = False inc/observe/time() сразу возвращаются,
+а обёртки timed() вызывают функцию без замера времени.
+"""
+import abc
+import asyncio
+import bisect
+import functools
+import inspect
+import logging
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин, секунды: от быстрых запросов к SQLite до вызовов Vision API
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _NullTimer:
+    """Таймер при выключенных метриках"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('_child', '_start')
+
+    def __init__(self, child: '_HistogramChild'):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._start)
+        return False
+
+
+class _CounterChild:
+    __slots__ = ('_registry', 'value')
+
+    def __init__(self, registry: 'MetricsRegistry'):
+        self._registry = registry
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        if self._registry.enabled:
+            self.value += amount
+
+    def reset(self):
+        self.value = 0
+
+
+class _GaugeChild:
+    __slots__ = ('_registry', 'value', '_function')
+
+    def __init__(self, registry: 'MetricsRegistry'):
+        self._registry = registry
+        self.value = 0
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        if self._registry.enabled:
+            self.value = value
+
+    def inc(self, amount: float = 1):
+        if self._registry.enabled:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def set_function(self, function: Callable[[], float]):
+        """Значение берётся из function() при каждом сборе (последняя заданная функция)"""
+        self._function = function
+
+    def current(self) -> float:
+        return self._function() if self._function is not None else self.value
+
+    def reset(self):
+        self.value = 0
+
+
+class _HistogramChild:
+    __slots__ = ('_registry', '_bounds', 'buckets', 'sum', 'count')
+
+    def __init__(self, registry: 'MetricsRegistry', bounds: Tuple[float, ...]):
+        self._registry = registry
+        self._bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)  # последняя - +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        if self._registry.enabled:
+            self.buckets[bisect.bisect_left(self._bounds, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def reset(self):
+        self.buckets = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def time(self):
+        """Контекст замера длительности блока"""
+        if not self._registry.enabled:
+            return _NULL_TIMER
+        return _Timer(self)
+
+
+class _Metric(abc.ABC):
+    kind = ''
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, documentation: str,
+                 labelnames: Sequence[str]):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    @abc.abstractmethod
+    def _new_child(self):
+        """Значение метрики для одного набора меток"""
+
+    @abc.abstractmethod
+    def render(self) -> List[str]:
+        """Строки текстового формата Prometheus (без HELP/TYPE)"""
+
+    def labels(self, *values):
+        """Метрика для конкретных значений меток (в порядке labelnames)"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def children(self):
+        return self._children.items()
+
+    def reset(self):
+        # Обнуление на месте: вызывающий код может хранить ссылки на labels(...)
+        for child in self._children.values():
+            child.reset()
+
+    def _label_text(self, values: Tuple[str, ...], extra: str = '') -> str:
+        pairs = [f'{name}="{value}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild(self.registry)
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{self._label_text(values)} {child.value}"
+                for values, child in self.children()]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild(self.registry)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set_function(self, function: Callable[[], float]):
+        self.labels().set_function(function)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{self._label_text(values)} {child.current()}"
+                for values, child in self.children()]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.bounds = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.registry, self.bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def render(self) -> List[str]:
+        lines = []
+        for values, child in self.children():
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float('inf'),), child.buckets):
+                cumulative += count
+                le = 'le="{}"'.format('+Inf' if bound == float('inf') else repr(bound))
+                lines.append(f"{self.name}_bucket{self._label_text(values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(values)} {child.sum}")
+            lines.append(f"{self.name}_count{self._label_text(values)} {child.count}")
+        return lines
+
+
+def bucket_quantile(bounds: Sequence[float], buckets: Sequence[int], q: float) -> Optional[float]:
+    """Оценка квантиля по корзинам: верхняя граница корзины, где набирается доля q"""
+    total = sum(buckets)
+    if not total:
+        return None
+    threshold = q * total
+    cumulative = 0
+    for bound, count in zip(tuple(bounds) + (float('inf'),), buckets):
+        cumulative += count
+        if cumulative >= threshold:
+            return bound
+    return float('inf')
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def reset(self):
+        """Сброс накопленных значений (метрики остаются зарегистрированными)"""
+        for metric in self._metrics.values():
+            metric.reset()
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict:
+        """Текущие значения для расчёта приращений в summary()"""
+        state = {}
+        for metric in self._metrics.values():
+            for values, child in metric.children():
+                if isinstance(metric, Histogram):
+                    state[(metric.name, values)] = (list(child.buckets), child.sum, child.count)
+                elif isinstance(metric, Gauge):
+                    state[(metric.name, values)] = child.current()
+                else:
+                    state[(metric.name, values)] = child.value
+        return state
+
+    def summary(self, since: Optional[Dict] = None) -> List[str]:
+        """
+        Сводка для лога: приращения с момента снимка since
+
+        Для гистограмм - число замеров, среднее и оценка p95 (по корзинам;
+        *_seconds - в миллисекундах, остальные - в своих единицах),
+        для счётчиков - прирост, для gauge - текущее значение. Строки без
+        изменений пропускаются.
+        """
+        since = since or {}
+        lines = []
+        for metric in self._metrics.values():
+            for values, child in metric.children():
+                labels = ','.join(values)
+                title = f"{metric.name}{{{labels}}}" if labels else metric.name
+                previous = since.get((metric.name, values))
+                if isinstance(metric, Histogram):
+                    buckets, total, count = previous or ([0] * len(child.buckets), 0.0, 0)
+                    delta_count = child.count - count
+                    if not delta_count:
+                        continue
+                    delta_buckets = [now - before for now, before in zip(child.buckets, buckets)]
+                    p95 = bucket_quantile(metric.bounds, delta_buckets, 0.95)
+                    avg = (child.sum - total) / delta_count
+                    if metric.name.endswith('_seconds'):
+                        lines.append(f"{title}: n={delta_count} avg={avg * 1000:.1f} мс p95<={p95 * 1000:g} мс")
+                    else:
+                        lines.append(f"{title}: n={delta_count} avg={avg:.1f} p95<={p95:g}")
+                elif isinstance(metric, Gauge):
+                    value = child.current()
+                    if value != (previous or 0):
+                        lines.append(f"{title}: {value:g}")
+                else:
+                    delta = child.value - (previous or 0)
+                    if delta:
+                        lines.append(f"{title}: +{delta}")
+        return lines
+
+
+REGISTRY = MetricsRegistry()
+
+
+# Ошибки по компонентам (bot, db, openai) и операциям
+ERRORS = REGISTRY.counter('errors_total', "Ошибки по компонентам и операциям", ('component', 'operation'))
+
+
+def timed(histogram: Histogram, *label_values: str, errors: Optional[Counter] = None,
+          error_labels: Optional[Tuple[str, ...]] = None):
+    """
+    Декоратор корутины: длительность вызова в histogram.labels(*label_values),
+    исключения - в errors.labels(*error_labels) (по умолчанию те же метки)
+    """
+    error_labels = label_values if error_labels is None else tuple(error_labels)
+
+    def decorate(func):
+        child = histogram.labels(*label_values)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not histogram.registry.enabled:
+                return await func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                if errors is not None:
+                    errors.labels(*error_labels).inc()
+                raise
+            finally:
+                child.observe(time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def instrument_methods(cls, histogram: Histogram, component: str, errors: Optional[Counter] = ERRORS,
+                       exclude: Iterable[str] = ()):
+    """
+    Обернуть публичные корутины класса в timed(): метка гистограммы - имя
+    метода, ошибки - errors.labels(component, имя метода)
+
+    Асинхронные контекстные менеджеры и генераторы не оборачиваются.
+    """
+    exclude = set(exclude)
+    for name, func in list(vars(cls).items()):
+        if name.startswith('_') or name in exclude or not inspect.iscoroutinefunction(func):
+            continue
+        setattr(cls, name, timed(histogram, name, errors=errors, error_labels=(component, name))(func))
+    return cls
+
+
+class MetricsServer:
+    """HTTP-эндпоинт /metrics (обычно на 127.0.0.1 - для локального сборщика)"""
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY, host: str = '127.0.0.1', port: int = 9100):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def bound_port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        logger.info("Метрики: http://%s:%d/metrics", self.host, self.bound_port)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 10)
+            while (await asyncio.wait_for(reader.readline(), 10)) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?', 1)[0] == '/metrics':
+                status, body = '200 OK', self.registry.render().encode('utf-8')
+            else:
+                status, body = '404 Not Found', b'not found\n'
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+
+class MetricsReporter:
+    """Периодическая сводка метрик в лог (приращения за интервал)"""
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY, interval: float = 300.0):
+        self.registry = registry
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._snapshot: Dict = {}
+
+    def start(self):
+        if self._task is None:
+            self._snapshot = self.registry.snapshot()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка с итоговой сводкой за неполный интервал"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self.report()
+
+    def report(self):
+        lines = self.registry.summary(self._snapshot)
+        self._snapshot = self.registry.snapshot()
+        if lines:
+            logger.info("Метрики за интервал:\n%s", '\n'.join(lines))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.report()
@@ -1,22 +1,368 @@
 import openai
+import asyncio
 import base64
 import logging
-from typing import Dict, Optional
+import re
+import time
+from contextlib import asynccontextmanager
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import json
 
+from PIL import Image, ImageOps
+
+from metrics import ERRORS, REGISTRY, timed
+
 logger = logging.getLogger(__name__)
 
+# Длительность этапов работы с OpenAI: queue_wait - ожидание слота
+# ограничителя параллельности, completion - сам HTTP-запрос (для потокового
+# ответа - до последнего фрагмента), first_field - от начала потокового
+# запроса до первого готового поля JSON
+OPENAI_CALL_SECONDS = REGISTRY.histogram('openai_call_seconds', "Длительность вызовов OpenAIService по этапам",
+                                         ('call',))
+# Двухуровневый анализ изображений: запросы, длительность (с ожиданием слота)
+# и токены по уровню модели, эскалации fast -> strong по причине
+OPENAI_TIER_REQUESTS = REGISTRY.counter('openai_tier_requests_total', "Запросы анализа изображения по уровню модели",
+                                        ('tier',))
+OPENAI_TIER_SECONDS = REGISTRY.histogram('openai_tier_seconds', "Длительность анализа изображения по уровню модели",
+                                         ('tier',))
+OPENAI_TIER_TOKENS = REGISTRY.counter('openai_tier_tokens_total', "Токены анализа изображения по уровню модели",
+                                      ('tier', 'kind'))
+OPENAI_ESCALATIONS = REGISTRY.counter('openai_escalations_total', "Эскалации быстрого прохода на сильную модель",
+                                      ('reason',))
+# Загрузка ограничителя параллельности: значения читаются из сервиса при сборе
+OPENAI_QUEUE_DEPTH = REGISTRY.gauge('openai_queue_depth', "Запросы к OpenAI, ожидающие слота")
+OPENAI_IN_FLIGHT = REGISTRY.gauge('openai_in_flight', "Запросы к OpenAI в работе")
+
+# Параметры запроса Vision API по уровням: fast - дешёвый первый проход,
+# strong - эскалация и все запросы без маршрутизации. model None - vision_model
+# сервиса, detail None - по размеру изображения (см. preprocess_image)
+DEFAULT_VISION_TIERS = {
+    'fast': {'model': "gpt-4o-mini", 'detail': "low", 'max_tokens': 600, 'temperature': 0.2},
+    'strong': {'model': None, 'detail': None, 'max_tokens': 1000, 'temperature': 0.7},
+}
+
+# Калорий на грамм белка, жира и углеводов (и алкоголя - его нет в БЖУ);
+# плотнее чистого жира еда не бывает
+ENERGY_PER_GRAM = {'protein': 4, 'fat': 9, 'carbs': 4}
+ALCOHOL_CALORIES_PER_GRAM = 7
+MAX_CALORIES_PER_GRAM = 9.5
+
+
+def preprocess_image(image_bytes: bytes, max_side: int = 1024, jpeg_quality: int = 85,
+                     low_detail_max_side: int = 512) -> Dict:
+    """
+    Подготовка изображения к отправке в Vision API
+    
+    Уменьшает изображение до max_side по длинной стороне, поворачивает
+    по EXIF-ориентации, перекодирует в JPEG без метаданных и выбирает
+    детализацию: "low" для изображений не больше low_detail_max_side.
+    Функция синхронная и модульного уровня, чтобы её можно было
+    выполнять в пуле потоков или процессов.
+    
+    Returns:
+        Dict с ключами data, detail, width, height, original_bytes
+    """
+    with Image.open(BytesIO(image_bytes)) as image:
+        # Для JPEG декодируем сразу в уменьшенном масштабе (в разы быстрее)
+        image.draft('RGB', (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        
+        output = BytesIO()
+        # Метаданные (EXIF, ICC) не передаются в save() и в результат не попадают
+        image.save(output, format='JPEG', quality=jpeg_quality, optimize=True)
+        width, height = image.size
+    
+    data = output.getvalue()
+    return {
+        'data': data,
+        'detail': 'low' if max(width, height) <= low_detail_max_side else 'high',
+        'width': width,
+        'height': height,
+        'original_bytes': len(image_bytes),
+    }
+
+
+def escalation_reason(result: Dict, min_confidence: float, energy_tolerance: float,
+                      energy_margin: float = 20) -> Optional[str]:
+    """
+    Почему результат быстрого прохода нужно перепроверить сильной моделью
+    
+    Returns:
+        quality_warning - модель сама сомневается в фото или продукте;
+        low_confidence - уверенность не указана или ниже min_confidence;
+        implausible - нечисловые или отрицательные значения, калории
+        расходятся с 4*Б + 9*Ж + 4*У + 7*алкоголь больше чем на долю
+        energy_tolerance и больше чем на energy_margin ккал (малые порции
+        и округление БЖУ), калорийность выше MAX_CALORIES_PER_GRAM или
+        БЖУ тяжелее порции;
+        None - результат можно принять
+    """
+    if result.get('quality_warning'):
+        return 'quality_warning'
+    confidence = result.get('confidence')
+    if not isinstance(confidence, (int, float)) or confidence < min_confidence:
+        return 'low_confidence'
+    try:
+        calories = float(result['calories'])
+        macros = {field: float(result[field]) for field in ENERGY_PER_GRAM}
+        alcohol = float(result.get('alcohol') or 0)
+        weight = float(result.get('weight') or 0)
+    except (KeyError, TypeError, ValueError):
+        return 'implausible'
+    if min(calories, weight, alcohol, *macros.values()) < 0:
+        return 'implausible'
+    energy = sum(macros[field] * per_gram for field, per_gram in ENERGY_PER_GRAM.items())
+    energy += alcohol * ALCOHOL_CALORIES_PER_GRAM
+    if abs(energy - calories) > max(energy_tolerance * max(energy, calories), energy_margin):
+        return 'implausible'
+    if weight and (calories / weight > MAX_CALORIES_PER_GRAM or sum(macros.values()) + alcohol > weight):
+        return 'implausible'
+    return None
+
+
+class PartialJSONObject:
+    """
+    Разбор JSON-объекта по мере поступления текста потокового ответа
+    
+    feed() дописывает фрагмент и возвращает имена полей верхнего уровня,
+    значения которых стали известны целиком. Число считается завершённым,
+    только когда за ним пришёл разделитель ("12" может оказаться "125"
+    или "12.5").
+    """
+    
+    _SEPARATORS = re.compile(r'[\s,]*')
+    _WHITESPACE = re.compile(r'\s*')
+    
+    def __init__(self):
+        self.text = ''
+        self.fields: Dict = {}
+        self._decoder = json.JSONDecoder()
+        self._pos: Optional[int] = None  # позиция после последнего разобранного поля
+    
+    def feed(self, chunk: str) -> List[str]:
+        self.text += chunk
+        text = self.text
+        if self._pos is None:
+            start = text.find('{')
+            if start < 0:
+                return []
+            self._pos = start + 1
+        
+        completed = []
+        while True:
+            pos = self._SEPARATORS.match(text, self._pos).end()
+            if pos >= len(text) or text[pos] != '"':
+                break
+            try:
+                key, pos = self._decoder.raw_decode(text, pos)
+            except ValueError:
+                break
+            pos = self._WHITESPACE.match(text, pos).end()
+            if pos >= len(text) or text[pos] != ':':
+                break
+            pos = self._WHITESPACE.match(text, pos + 1).end()
+            try:
+                value, end = self._decoder.raw_decode(text, pos)
+            except ValueError:
+                break
+            if not isinstance(value, (str, list, dict)) and (end >= len(text) or text[end] not in ' \t\r\n,}'):
+                break
+            self.fields[key] = value
+            completed.append(key)
+            self._pos = end
+        return completed
+
 
 class OpenAIService:
-    """Класс для работы с OpenAI API"""
+    """Класс для работы с OpenAI API
     
-    def __init__(self, api_key: str, model: str = "gpt-4o", vision_model: str = "gpt-4o"):
+    Запросы выполняются асинхронным клиентом и не блокируют цикл событий.
+    Одновременно к API уходит не более max_concurrent_requests запросов,
+    остальные ждут своей очереди (см. queue_depth и get_stats()).
+    
+    Перед отправкой изображения проходят preprocess_image() в отдельном
+    пуле потоков (image_executor="thread") или процессов ("process").
+    
+    При stream_responses анализ изображения запрашивается потоком, и
+    готовые поля передаются вызывающему до окончания ответа.
+    
+    При routing изображение сначала анализирует уровень fast из
+    vision_tiers, а уровень strong - только если escalation_reason()
+    нашла причину усомниться в результате.
+    """
+    
+    def __init__(self, api_key: str, model: str = "gpt-4o", vision_model: str = "gpt-4o",
+                 max_concurrent_requests: int = 8, request_timeout: float = 60.0, max_retries: int = 1,
+                 base_url: Optional[str] = None, image_max_side: int = 1024,
+                 image_jpeg_quality: int = 85, image_low_detail_max_side: int = 512,
+                 image_executor: str = "thread", image_workers: int = 2,
+                 stream_responses: bool = False, routing: bool = False,
+                 vision_tiers: Optional[Dict[str, Dict]] = None,
+                 routing_min_confidence: float = 0.6, routing_energy_tolerance: float = 0.25,
+                 routing_energy_margin: float = 20):
         self.api_key = api_key
         self.model = model
         self.vision_model = vision_model
-        openai.api_key = api_key
-        self.client = openai.OpenAI(api_key=api_key)
+        self.max_concurrent_requests = max(1, max_concurrent_requests)
+        self.request_timeout = request_timeout
+        # Таймаут - на попытку; повторы клиента задаются явно (по умолчанию в SDK их два)
+        self.max_retries = max(0, max_retries)
+        self.client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=request_timeout,
+                                         max_retries=self.max_retries)
+        self._gate = asyncio.Semaphore(self.max_concurrent_requests)
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.requests_total = 0
+        self.timeouts_total = 0
+        OPENAI_QUEUE_DEPTH.set_function(lambda: self.queue_depth)
+        OPENAI_IN_FLIGHT.set_function(lambda: self.in_flight)
+        self.stream_responses = stream_responses
+        # Уровни - DEFAULT_VISION_TIERS с переопределёнными параметрами из vision_tiers
+        vision_tiers = vision_tiers or {}
+        unknown = set(vision_tiers) - set(DEFAULT_VISION_TIERS)
+        if unknown:
+            raise ValueError(f"Неизвестные уровни Vision: {', '.join(sorted(unknown))}")
+        self.vision_tiers = {tier: {**params, **vision_tiers.get(tier, {})}
+                             for tier, params in DEFAULT_VISION_TIERS.items()}
+        self.routing = routing
+        self.routing_min_confidence = routing_min_confidence
+        self.routing_energy_tolerance = routing_energy_tolerance
+        self.routing_energy_margin = routing_energy_margin
+        self.tier_stats = {tier: {'requests': 0, 'seconds': 0.0, 'prompt_tokens': 0, 'completion_tokens': 0}
+                           for tier in self.vision_tiers}
+        self.escalations: Dict[str, int] = {}
+        
+        self.image_max_side = image_max_side
+        self.image_jpeg_quality = image_jpeg_quality
+        self.image_low_detail_max_side = image_low_detail_max_side
+        if image_executor == "process":
+            self._image_executor: Executor = ProcessPoolExecutor(max_workers=image_workers)
+        elif image_executor == "thread":
+            self._image_executor = ThreadPoolExecutor(max_workers=image_workers,
+                                                      thread_name_prefix="image-preprocess")
+        else:
+            raise ValueError(f"Неизвестный тип пула для изображений: {image_executor}")
+        self.images_processed = 0
+        self.image_bytes_in = 0
+        self.image_bytes_out = 0
+    
+    async def close(self):
+        """Закрытие HTTP-соединений клиента и пула обработки изображений"""
+        await self.client.close()
+        self._image_executor.shutdown(wait=False, cancel_futures=True)
+    
+    @timed(OPENAI_CALL_SECONDS, 'prepare_image')
+    async def prepare_image(self, image_bytes: bytes) -> Dict:
+        """
+        Предобработка изображения в пуле, не блокируя цикл событий
+        
+        Если изображение не удалось декодировать, возвращаются исходные
+        байты с детализацией "high".
+        """
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            prepared = await loop.run_in_executor(
+                self._image_executor,
+                partial(preprocess_image, image_bytes,
+                        max_side=self.image_max_side,
+                        jpeg_quality=self.image_jpeg_quality,
+                        low_detail_max_side=self.image_low_detail_max_side)
+            )
+        except Exception as e:
+            logger.warning("Не удалось предобработать изображение, отправляем как есть: %s", e)
+            prepared = {'data': image_bytes, 'detail': 'high', 'width': None, 'height': None,
+                        'original_bytes': len(image_bytes)}
+        prepared['elapsed_ms'] = (time.perf_counter() - start) * 1000
+        
+        self.images_processed += 1
+        self.image_bytes_in += prepared['original_bytes']
+        self.image_bytes_out += len(prepared['data'])
+        return prepared
     
+    def get_stats(self) -> Dict:
+        """Текущая загрузка: запросы в работе и в очереди"""
+        return {
+            'in_flight': self.in_flight,
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'max_concurrent_requests': self.max_concurrent_requests,
+            'requests_total': self.requests_total,
+            'timeouts_total': self.timeouts_total,
+            'images_processed': self.images_processed,
+            'image_bytes_in': self.image_bytes_in,
+            'image_bytes_out': self.image_bytes_out,
+            'tiers': self.tier_stats,
+            'escalations': self.escalations,
+        }
+    
+    @asynccontextmanager
+    async def _request_slot(self):
+        """Слот ограничителя параллельности на время запроса к API"""
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        try:
+            with OPENAI_CALL_SECONDS.labels('queue_wait').time():
+                await self._gate.acquire()
+        finally:
+            self.queue_depth -= 1
+        
+        self.in_flight += 1
+        self.requests_total += 1
+        try:
+            with OPENAI_CALL_SECONDS.labels('completion').time():
+                yield
+        except openai.APITimeoutError:
+            self.timeouts_total += 1
+            ERRORS.labels('openai', 'timeout').inc()
+            logger.warning("Таймаут запроса к OpenAI (%s с)", self.request_timeout)
+            raise
+        finally:
+            self.in_flight -= 1
+            self._gate.release()
+    
+    async def _create_completion(self, **kwargs):
+        """Вызов chat.completions.create через ограничитель параллельности"""
+        async with self._request_slot():
+            return await self.client.chat.completions.create(timeout=self.request_timeout, **kwargs)
+    
+    async def _stream_completion(self, on_fields: Callable[[Dict], None], **kwargs) -> Tuple[str, Any]:
+        """
+        Потоковый вызов chat.completions.create (stream=True)
+        
+        Слот ограничителя занят до последнего фрагмента. on_fields
+        вызывается со всеми готовыми полями JSON каждый раз, когда
+        появляются новые. Возвращает полный текст ответа и usage
+        (приходит последним фрагментом, None - если API его не прислал).
+        """
+        parser = PartialJSONObject()
+        usage = None
+        async with self._request_slot():
+            start = time.perf_counter()
+            stream = await self.client.chat.completions.create(
+                timeout=self.request_timeout, stream=True, stream_options={"include_usage": True}, **kwargs
+            )
+            first_field = True
+            async for chunk in stream:
+                usage = getattr(chunk, 'usage', None) or usage
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                if parser.feed(chunk.choices[0].delta.content):
+                    if first_field:
+                        OPENAI_CALL_SECONDS.labels('first_field').observe(time.perf_counter() - start)
+                        first_field = False
+                    on_fields(dict(parser.fields))
+        return parser.text, usage
+    
+    @timed(OPENAI_CALL_SECONDS, 'analyze_text_food', errors=ERRORS, error_labels=('openai', 'analyze_text_food'))
     async def analyze_text_food(self, text: str) -> Dict:
         """
         Анализ текстового описания продукта/блюда
@@ -46,7 +392,7 @@ class OpenAIService:
 
 Если вес не указан, используй стандартную порцию. Будь точным в расчетах."""
 
-            response = self.client.chat.completions.create(
+            response = await self._create_completion(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -57,27 +403,40 @@ class OpenAIService:
             )
             
             result = json.loads(response.choices[0].message.content)
-            logger.info(f"Анализ текста выполнен: {result.get('product_name', 'unknown')}")
+            logger.info("Анализ текста выполнен: %s", result.get('product_name', 'unknown'))
             return result
             
         except Exception as e:
-            logger.error(f"Ошибка при анализе текста: {e}")
+            logger.error("Ошибка при анализе текста: %s", e)
             raise
     
-    async def analyze_food_image(self, image_bytes: bytes, user_text: Optional[str] = None) -> Dict:
+    @timed(OPENAI_CALL_SECONDS, 'analyze_food_image', errors=ERRORS, error_labels=('openai', 'analyze_food_image'))
+    async def analyze_food_image(self, image_bytes: bytes, user_text: Optional[str] = None,
+                                 on_fields: Optional[Callable[[Dict], None]] = None,
+                                 tier: Optional[str] = None, escalate_quality: bool = True) -> Dict:
         """
         Анализ изображения продукта/блюда с использованием Vision API
         
         Args:
             image_bytes: Байты изображения
             user_text: Дополнительный текст от пользователя (опционально)
+            on_fields: Вызывается с готовыми полями по мере потокового
+                ответа сильной модели (если stream_responses включён);
+                ответ быстрой может быть отменён эскалацией и не транслируется
+            tier: Уровень модели из vision_tiers; None - fast с эскалацией
+                при routing, иначе strong
+            escalate_quality: False - результат быстрой модели с
+                quality_warning возвращается без эскалации (вызывающий сам
+                повторит анализ по большему варианту фото сильной моделью)
             
         Returns:
             Dict с информацией о калориях и БЖУ
         """
         try:
-            # Конвертируем изображение в base64
-            base64_image = base64.b64encode(image_bytes).decode('utf-8')
+            # Уменьшаем, перекодируем и конвертируем изображение в base64
+            prepared = await self.prepare_image(image_bytes)
+            with OPENAI_CALL_SECONDS.labels('encode_base64').time():
+                base64_image = base64.b64encode(prepared['data']).decode('utf-8')
             
             system_prompt = """Ты - профессиональный диетолог и нутрициолог с экспертизой в визуальной оценке продуктов.
 Твоя задача - анализировать изображения продуктов и блюд, оценивая их состав, вес и пищевую ценность.
@@ -90,11 +449,13 @@ class OpenAIService:
     "protein": белки в граммах (число),
     "fat": жиры в граммах (число),
     "carbs": углеводы в граммах (число),
+    "alcohol": алкоголь (этанол) в граммах, 0 если его нет (число),
     "comparison": "сравнение с другими продуктами (например: эквивалентно 2 яблокам)",
     "recommendations": "рекомендации по употреблению (время дня, с чем сочетается)",
     "benefits": "польза продукта",
     "warnings": "предупреждения о высокой калорийности, сахаре и т.д.",
-    "quality_warning": "предупреждение если фото плохого качества или продукт не распознан"
+    "quality_warning": "предупреждение если фото плохого качества или продукт не распознан",
+    "confidence": уверенность в распознавании продукта и оценке порции от 0 до 1 (число)
 }
 
 Внимательно оцени размер порции и состав блюда. Если изображение нечёткое или темное, укажи это в quality_warning."""
@@ -103,37 +464,154 @@ class OpenAIService:
             if user_text:
                 user_message += f"\n\nДополнительная информация от пользователя: {user_text}"
             
-            response = self.client.chat.completions.create(
-                model=self.vision_model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": user_message},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}",
-                                    "detail": "high"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                temperature=0.7,
-                max_tokens=1000,
-                response_format={"type": "json_object"}
+            request = dict(
+                system_prompt=system_prompt,
+                user_message=user_message,
+                image_url=f"data:image/jpeg;base64,{base64_image}",
+                detail=prepared['detail']
             )
+            if tier is None:
+                tier = 'fast' if self.routing else 'strong'
+            try:
+                result = await self._analyze_image_tier(tier, on_fields=on_fields if tier != 'fast' else None,
+                                                        **request)
+                reason = escalation_reason(result, self.routing_min_confidence, self.routing_energy_tolerance,
+                                           self.routing_energy_margin) if tier == 'fast' else None
+                if reason == 'quality_warning' and not escalate_quality:
+                    reason = None
+            except ValueError:
+                # Быстрая модель вернула не JSON-объект - отвечает сильная
+                if tier != 'fast':
+                    raise
+                reason = 'invalid_response'
             
-            result = json.loads(response.choices[0].message.content)
-            logger.info(f"Анализ изображения выполнен: {result.get('product_name', 'unknown')}")
+            if reason is not None:
+                self.escalations[reason] = self.escalations.get(reason, 0) + 1
+                OPENAI_ESCALATIONS.labels(reason).inc()
+                logger.info("Анализ изображения передан сильной модели: %s", reason)
+                tier = 'strong'
+                result = await self._analyze_image_tier(tier, on_fields=on_fields, **request)
+            
+            logger.info("Анализ изображения выполнен (%s): %s", tier, result.get('product_name', 'unknown'))
             return result
             
         except Exception as e:
-            logger.error(f"Ошибка при анализе изображения: {e}")
+            logger.error("Ошибка при анализе изображения: %s", e)
             raise
     
+    async def _analyze_image_tier(self, tier: str, system_prompt: str, user_message: str, image_url: str,
+                                  detail: str, on_fields: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """
+        Один запрос анализа изображения к модели уровня tier
+        
+        Учитывает запросы, время (с ожиданием слота) и токены уровня.
+        ValueError - если ответ не разбирается в JSON-объект.
+        """
+        params = self.vision_tiers[tier]
+        request = dict(
+            model=params.get('model') or self.vision_model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": user_message},
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": image_url,
+                                "detail": params.get('detail') or detail
+                            }
+                        }
+                    ]
+                }
+            ],
+            temperature=params.get('temperature', 0.7),
+            max_tokens=params.get('max_tokens', 1000),
+            response_format={"type": "json_object"}
+        )
+        
+        stats = self.tier_stats[tier]
+        stats['requests'] += 1
+        OPENAI_TIER_REQUESTS.labels(tier).inc()
+        start = time.perf_counter()
+        try:
+            if on_fields is not None and self.stream_responses:
+                content, usage = await self._stream_completion(on_fields, **request)
+            else:
+                response = await self._create_completion(**request)
+                content, usage = response.choices[0].message.content, getattr(response, 'usage', None)
+        finally:
+            elapsed = time.perf_counter() - start
+            stats['seconds'] += elapsed
+            OPENAI_TIER_SECONDS.labels(tier).observe(elapsed)
+        
+        if usage is not None:
+            for kind in ('prompt', 'completion'):
+                tokens = getattr(usage, f"{kind}_tokens", None) or 0
+                stats[f"{kind}_tokens"] += tokens
+                OPENAI_TIER_TOKENS.labels(tier, kind).inc(tokens)
+        
+        result = json.loads(content)
+        if not isinstance(result, dict):
+            raise ValueError("Ответ модели не является JSON-объектом")
+        return result
+    
+    def _format_analysis(self, data: Dict, partial: bool = False) -> str:
+        """
+        Продукт, калории, БЖУ, сравнение и комментарий
+        
+        При partial строка БЖУ выводится, только когда известны все три
+        значения (поля потокового ответа приходят по одному).
+        """
+        product_name = data.get('product_name', 'Продукт')
+        weight = data.get('weight', 0)
+        calories = data.get('calories', 0)
+        protein = data.get('protein', 0)
+        fat = data.get('fat', 0)
+        carbs = data.get('carbs', 0)
+        
+        # Основная информация
+        response = f"🍽 <b>Продукт:</b> {product_name}"
+        if weight:
+            response += f" ({weight} г)"
+        response += f"\n\n📊 <b>Калории:</b> {calories} ккал\n"
+        if not partial or all(field in data for field in ('protein', 'fat', 'carbs')):
+            response += f"<b>Белки:</b> {protein} г | <b>Жиры:</b> {fat} г | <b>Углеводы:</b> {carbs} г\n"
+        
+        # Сравнение
+        if data.get('comparison'):
+            response += f"\n💡 <b>Сравнение:</b> {data['comparison']}\n"
+        
+        # Комментарий
+        comment_parts = []
+        if data.get('benefits'):
+            comment_parts.append(data['benefits'])
+        if data.get('recommendations'):
+            comment_parts.append(data['recommendations'])
+        if data.get('warnings'):
+            comment_parts.append(f"⚠️ {data['warnings']}")
+        
+        if comment_parts:
+            response += f"\n💬 <b>Комментарий:</b> {' '.join(comment_parts)}"
+        
+        return response
+    
+    def format_partial(self, data: Dict) -> Optional[str]:
+        """
+        Промежуточный ответ по уже полученным полям потокового анализа
+        
+        Returns:
+            Текст сообщения или None, пока неизвестны продукт и калории
+        """
+        if 'product_name' not in data or 'calories' not in data:
+            return None
+        try:
+            return self._format_analysis(data, partial=True) + "\n\n⏳ <i>Анализ продолжается...</i>"
+        except Exception as e:
+            logger.debug("Не удалось сформировать промежуточный ответ: %s", e)
+            return None
+    
     def format_response(self, data: Dict, include_daily_stats: bool = False, 
                        daily_total: float = 0, daily_limit: int = 2000) -> str:
         """
@@ -149,35 +627,7 @@ class OpenAIService:
             Отформатированное текстовое сообщение
         """
         try:
-            product_name = data.get('product_name', 'Продукт')
-            weight = data.get('weight', 0)
-            calories = data.get('calories', 0)
-            protein = data.get('protein', 0)
-            fat = data.get('fat', 0)
-            carbs = data.get('carbs', 0)
-            
-            # Основная информация
-            response = f"🍽 <b>Продукт:</b> {product_name}"
-            if weight:
-                response += f" ({weight} г)"
-            response += f"\n\n📊 <b>Калории:</b> {calories} ккал\n"
-            response += f"<b>Белки:</b> {protein} г | <b>Жиры:</b> {fat} г | <b>Углеводы:</b> {carbs} г\n"
-            
-            # Сравнение
-            if data.get('comparison'):
-                response += f"\n💡 <b>Сравнение:</b> {data['comparison']}\n"
-            
-            # Комментарий
-            comment_parts = []
-            if data.get('benefits'):
-                comment_parts.append(data['benefits'])
-            if data.get('recommendations'):
-                comment_parts.append(data['recommendations'])
-            if data.get('warnings'):
-                comment_parts.append(f"⚠️ {data['warnings']}")
-            
-            if comment_parts:
-                response += f"\n💬 <b>Комментарий:</b> {' '.join(comment_parts)}"
+            response = self._format_analysis(data)
             
             # Предупреждение о качестве изображения
             if data.get('quality_warning'):
@@ -185,7 +635,7 @@ class OpenAIService:
             
             # Статистика за день
             if include_daily_stats:
-                daily_total += calories
+                daily_total += data.get('calories', 0)
                 percentage = (daily_total / daily_limit) * 100
                 response += f"\n\n📈 <b>За сегодня:</b> {daily_total:.0f} / {daily_limit} ккал ({percentage:.1f}%)"
                 
@@ -197,5 +647,5 @@ class OpenAIService:
             return response
             
         except Exception as e:
-            logger.error(f"Ошибка при форматировании ответа: {e}")
+            logger.error("Ошибка при форматировании ответа: %s", e)
             return "❌ Произошла ошибка при обработке данных"
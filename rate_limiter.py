@@ -0,0 +1,141 @@
+import abc
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter(abc.ABC):
+    """
+    Базовый класс ограничителя частоты запросов в памяти
+    
+    Состояние хранится по ключу (user_id) и занимает O(1) памяти на ключ.
+    Лимит зависит от уровня (tier) - типа ключа доступа пользователя:
+    limits = {'limited': 20, 'unlimited': 40, 'default': 20} - запросов
+    за window_seconds. Ключи, не обращавшиеся дольше idle_seconds,
+    вытесняются; общее число ключей ограничено max_keys.
+    """
+    
+    def __init__(self, limits: Dict[str, int], window_seconds: float = 60.0,
+                 max_keys: int = 100_000, idle_seconds: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        if 'default' not in limits:
+            raise ValueError("В limits должен быть уровень 'default'")
+        self.limits = dict(limits)
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self.idle_seconds = idle_seconds if idle_seconds is not None else 2 * window_seconds
+        self.clock = clock
+        self._state: "OrderedDict[int, list]" = OrderedDict()
+        self.stats = {'allowed': 0, 'rejected': 0, 'evicted': 0}
+    
+    def limit_for(self, tier: Optional[str]) -> int:
+        return self.limits.get(tier or 'default', self.limits['default'])
+    
+    def allow(self, key: int, tier: Optional[str] = None) -> bool:
+        """Учесть запрос и вернуть True, если он укладывается в лимит"""
+        now = self.clock()
+        state = self._state.get(key)
+        if state is None:
+            state = self._new_state(now, tier)
+            self._state[key] = state
+        else:
+            self._state.move_to_end(key)
+        
+        allowed = self._consume(state, now, self.limit_for(tier))
+        state[-1] = now  # время последнего обращения
+        self.stats['allowed' if allowed else 'rejected'] += 1
+        self._evict(now)
+        return allowed
+    
+    def reset(self, key: int):
+        """Сброс состояния ключа"""
+        self._state.pop(key, None)
+    
+    def __len__(self) -> int:
+        return len(self._state)
+    
+    def _evict(self, now: float):
+        """Вытеснение давно неактивных ключей (самые старые - в начале)"""
+        while self._state:
+            key, state = next(iter(self._state.items()))
+            if len(self._state) <= self.max_keys and now - state[-1] < self.idle_seconds:
+                break
+            del self._state[key]
+            self.stats['evicted'] += 1
+    
+    @abc.abstractmethod
+    def _new_state(self, now: float, tier: Optional[str]) -> list:
+        """Начальное состояние ключа; последний элемент - время последнего обращения"""
+    
+    @abc.abstractmethod
+    def _consume(self, state: list, now: float, limit: int) -> bool:
+        """Учесть запрос в состоянии ключа и вернуть True, если он укладывается в limit"""
+
+
+class TokenBucketRateLimiter(RateLimiter):
+    """
+    Token bucket: ёмкость limit, пополнение limit токенов за окно
+    
+    Допускает всплеск до limit запросов подряд, затем - равномерно.
+    Состояние: [токены, время пополнения, последнее обращение].
+    """
+    
+    def _new_state(self, now: float, tier: Optional[str]) -> list:
+        return [float(self.limit_for(tier)), now, now]
+    
+    def _consume(self, state: list, now: float, limit: int) -> bool:
+        tokens, refilled_at = state[0], state[1]
+        tokens = min(float(limit), tokens + (now - refilled_at) * limit / self.window_seconds)
+        state[1] = now
+        if tokens >= 1.0:
+            state[0] = tokens - 1.0
+            return True
+        state[0] = tokens
+        return False
+
+
+class SlidingWindowRateLimiter(RateLimiter):
+    """
+    Скользящее окно по двум счётчикам (текущее и предыдущее окно)
+    
+    Число запросов за последние window_seconds оценивается как
+    current + previous * (доля предыдущего окна, попадающая в скользящее).
+    Состояние: [номер окна, текущий счётчик, предыдущий счётчик, последнее обращение].
+    """
+    
+    def _new_state(self, now: float, tier: Optional[str]) -> list:
+        return [math.floor(now / self.window_seconds), 0, 0, now]
+    
+    def _consume(self, state: list, now: float, limit: int) -> bool:
+        window = math.floor(now / self.window_seconds)
+        if window != state[0]:
+            # Сдвиг окна: текущее становится предыдущим (или обнуляется, если прошло больше окна)
+            state[2] = state[1] if window == state[0] + 1 else 0
+            state[1] = 0
+            state[0] = window
+        elapsed_fraction = now / self.window_seconds - window
+        estimated = state[1] + state[2] * (1.0 - elapsed_fraction)
+        if estimated < limit:
+            state[1] += 1
+            return True
+        return False
+
+
+RATE_LIMITERS = {
+    'token_bucket': TokenBucketRateLimiter,
+    'sliding_window': SlidingWindowRateLimiter,
+}
+
+
+def create_rate_limiter(kind: str, limits: Dict[str, int], window_seconds: float = 60.0,
+                        max_keys: int = 100_000) -> RateLimiter:
+    """Создание ограничителя по имени из конфигурации"""
+    try:
+        limiter_class = RATE_LIMITERS[kind]
+    except KeyError:
+        raise ValueError(f"Неизвестный тип ограничителя: {kind} (доступны: {', '.join(RATE_LIMITERS)})")
+    return limiter_class(limits, window_seconds=window_seconds, max_keys=max_keys)
@@ -0,0 +1,129 @@
+"""
+Отбор обновлений Telegram по зарегистрированным обработчикам
+
+allowed_updates_for() выводит список типов обновлений, на которые бот
+подписывается (getUpdates/setWebhook allowed_updates), из обработчиков
+Application. UpdateTypeFilter в группе -1 отбрасывает обновления других
+типов (например, уже стоявшие в очереди Telegram до смены подписки)
+раньше любого обработчика и обращения к БД и считает отброшенные.
+"""
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from telegram import Update
+from telegram.ext import (
+    Application,
+    ApplicationHandlerStop,
+    CallbackQueryHandler,
+    ChatJoinRequestHandler,
+    ChatMemberHandler,
+    ChosenInlineResultHandler,
+    CommandHandler,
+    ContextTypes,
+    InlineQueryHandler,
+    MessageHandler,
+    PollAnswerHandler,
+    PollHandler,
+    PreCheckoutQueryHandler,
+    ShippingQueryHandler,
+    TypeHandler,
+)
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+UPDATES_DROPPED = REGISTRY.counter('updates_dropped_total', "Отброшенные обновления неподписанных типов",
+                                   ('type',))
+
+# Тип обработчика -> типы обновлений, которые ему нужны. CommandHandler и
+# MessageHandler по умолчанию принимают и edited_message, но бот отвечает
+# только на новые сообщения: правка сообщения не должна повторять анализ.
+HANDLER_UPDATE_TYPES = {
+    CommandHandler: (Update.MESSAGE,),
+    MessageHandler: (Update.MESSAGE,),
+    CallbackQueryHandler: (Update.CALLBACK_QUERY,),
+    InlineQueryHandler: (Update.INLINE_QUERY,),
+    ChosenInlineResultHandler: (Update.CHOSEN_INLINE_RESULT,),
+    ShippingQueryHandler: (Update.SHIPPING_QUERY,),
+    PreCheckoutQueryHandler: (Update.PRE_CHECKOUT_QUERY,),
+    PollHandler: (Update.POLL,),
+    PollAnswerHandler: (Update.POLL_ANSWER,),
+    ChatJoinRequestHandler: (Update.CHAT_JOIN_REQUEST,),
+}
+
+
+def handler_update_types(handler) -> Optional[tuple]:
+    """Типы обновлений обработчика; None - неизвестный обработчик"""
+    if isinstance(handler, ChatMemberHandler):
+        return {
+            ChatMemberHandler.MY_CHAT_MEMBER: (Update.MY_CHAT_MEMBER,),
+            ChatMemberHandler.CHAT_MEMBER: (Update.CHAT_MEMBER,),
+        }.get(handler.chat_member_types, (Update.MY_CHAT_MEMBER, Update.CHAT_MEMBER))
+    for handler_class, update_types in HANDLER_UPDATE_TYPES.items():
+        if isinstance(handler, handler_class):
+            return update_types
+    return None
+
+
+def allowed_updates_for(application: Application) -> Optional[List[str]]:
+    """
+    Типы обновлений для allowed_updates по обработчикам приложения
+
+    Возвращает None (все типы), если среди обработчиков есть такой, чьи
+    типы обновлений неизвестны - лучше получать лишнее, чем терять нужное.
+    """
+    allowed = set()
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            update_types = handler_update_types(handler)
+            if update_types is None:
+                logger.warning("Неизвестный тип обработчика %s - подписка на все обновления",
+                               type(handler).__name__)
+                return None
+            allowed.update(update_types)
+    return [str(update_type) for update_type in Update.ALL_TYPES if update_type in allowed]
+
+
+def update_type(update: Update) -> Optional[str]:
+    """Тип обновления: имя заполненного поля (message, edited_message, ...)"""
+    for name in Update.ALL_TYPES:
+        if getattr(update, name, None) is not None:
+            return str(name)
+    return None
+
+
+class UpdateTypeFilter:
+    """
+    Ранний отсев обновлений неподписанных типов
+
+    Регистрируется обработчиком группы -1 (handler()): для обновления
+    неразрешённого типа поднимает ApplicationHandlerStop, и обработчики
+    группы 0 не вызываются. Отброшенные считаются в updates_dropped_total{type}.
+    """
+
+    def __init__(self, allowed_updates: Optional[Iterable[str]]):
+        self.allowed_updates = list(allowed_updates) if allowed_updates is not None else None
+        self._allowed = frozenset(self.allowed_updates) if self.allowed_updates is not None else None
+
+    @property
+    def subscribed_updates(self) -> List[str]:
+        """Значение allowed_updates для getUpdates/setWebhook (None у Telegram - прежняя подписка)"""
+        return self.allowed_updates if self.allowed_updates is not None else [str(t) for t in Update.ALL_TYPES]
+
+    @staticmethod
+    def dropped() -> Dict[str, int]:
+        """Отброшенные обновления по типам (из метрики updates_dropped_total)"""
+        return {values[0]: child.value for values, child in UPDATES_DROPPED.children() if child.value}
+
+    def handler(self) -> TypeHandler:
+        return TypeHandler(Update, self.check)
+
+    async def check(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if self._allowed is None:
+            return
+        kind = update_type(update)
+        if kind in self._allowed:
+            return
+        UPDATES_DROPPED.labels(str(kind)).inc()
+        raise ApplicationHandlerStop
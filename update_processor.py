@@ -0,0 +1,99 @@
+"""
+Параллельная обработка обновлений с сохранением порядка для каждого пользователя
+
+Обновления разных пользователей обрабатываются одновременно (не больше
+max_concurrent_updates), обновления одного пользователя - строго по
+очереди: /activate и следующее за ним сообщение с ключом
+(context.user_data['awaiting_key']) не переставляются местами.
+"""
+import logging
+from collections import deque
+from typing import Any, Awaitable, Deque, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+def update_order_key(update: object) -> Optional[Hashable]:
+    """Ключ упорядочивания: пользователь, иначе чат; None - порядок не важен"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return ('chat', update.effective_chat.id)
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Процессор обновлений с очередью на пользователя
+
+    Первое обновление пользователя занимает слот семафора и становится
+    "ведущим": после своей обработки оно выполняет накопившиеся за ним
+    обновления того же пользователя в порядке поступления. Остальные
+    обновления этого пользователя только ставятся в его очередь и сразу
+    освобождают слот, поэтому пользователь с долгим анализом фото не
+    занимает слоты, нужные другим пользователям.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._lanes: Dict[Hashable, Deque[Awaitable[Any]]] = {}
+        self.stats = {
+            'processed': 0,
+            'queued': 0,          # ждали завершения предыдущего обновления пользователя
+            'max_lane_depth': 0,
+            'errors': 0,
+        }
+
+    @property
+    def active_users(self) -> int:
+        """Пользователей, обновления которых сейчас обрабатываются"""
+        return len(self._lanes)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]):
+        key = update_order_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        lane = self._lanes.get(key)
+        if lane is not None:
+            # Пользователь уже обрабатывается - ведущий выполнит это обновление следом
+            lane.append(coroutine)
+            self.stats['queued'] += 1
+            self.stats['max_lane_depth'] = max(self.stats['max_lane_depth'], len(lane))
+            return
+
+        lane = self._lanes[key] = deque()
+        try:
+            await self._run(coroutine)
+            while lane:
+                await self._run(lane.popleft())
+        finally:
+            del self._lanes[key]
+            # При отмене оставшиеся корутины не выполнятся - закрываем их
+            for pending in lane:
+                pending.close()
+
+    async def _run(self, coroutine: Awaitable[Any]):
+        try:
+            await coroutine
+        except Exception:
+            # Application.process_update сам передаёт ошибки обработчиков в
+            # error_handler; сюда доходят только сбои самого диспетчера
+            self.stats['errors'] += 1
+            logger.exception("Ошибка при обработке обновления")
+        finally:
+            self.stats['processed'] += 1
+
+    async def initialize(self):
+        """Ресурсов не требуется"""
+
+    async def shutdown(self):
+        """Application.stop() дожидается задач обработки, очереди к этому моменту пусты"""
+        if self._lanes:
+            logger.warning("Остались необработанные обновления %d пользователей", len(self._lanes))
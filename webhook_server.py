@@ -0,0 +1,267 @@
+"""
+Приём обновлений Telegram через webhook
+
+Встроенный асинхронный HTTP/1.1-сервер (без tornado/aiohttp): принимает
+POST с JSON обновления, проверяет секретный токен из заголовка
+X-Telegram-Bot-Api-Secret-Token и кладёт обновление в очередь
+Application.update_queue. Обработка идёт в Application с той же
+конкурентностью, что и при polling. Ответ Telegram отправляется сразу
+после постановки в очередь.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import ssl
+from typing import Dict, Iterable, Optional, Set
+
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = 'x-telegram-bot-api-secret-token'
+
+REASONS = {
+    200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+    405: 'Method Not Allowed', 408: 'Request Timeout', 411: 'Length Required',
+    413: 'Payload Too Large', 431: 'Request Header Fields Too Large',
+    503: 'Service Unavailable',
+}
+
+
+class WebhookServer:
+    """
+    HTTP-сервер webhook для Application
+
+    При переполнении очереди (max_pending_updates) сервер отвечает 503 -
+    Telegram повторит доставку позже, вместо неограниченного роста
+    очереди в памяти. stop() прекращает приём соединений и дожидается
+    запросов, которые уже читаются (не дольше drain_timeout).
+    
+    Обновления типов не из allowed_updates подтверждаются (200) без
+    разбора в Update и без постановки в очередь.
+    
+    Заголовки и тело запроса должны прийти за request_timeout секунд,
+    заголовков - не больше max_headers строк и max_header_size байт
+    (иначе 408/431 и соединение закрывается).
+    """
+
+    def __init__(self, application: Application, listen: str = '0.0.0.0', port: int = 8443,
+                 url_path: str = '/telegram', secret_token: Optional[str] = None,
+                 max_pending_updates: int = 1000, max_body_size: int = 1024 * 1024,
+                 idle_timeout: float = 60.0, request_timeout: float = 10.0,
+                 max_headers: int = 100, max_header_size: int = 16 * 1024,
+                 ssl_context: Optional[ssl.SSLContext] = None,
+                 allowed_updates: Optional[Iterable[str]] = None):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.url_path = '/' + url_path.strip('/')
+        self.secret_token = secret_token
+        self.max_pending_updates = max_pending_updates
+        self.max_body_size = max_body_size
+        self.idle_timeout = idle_timeout
+        self.request_timeout = request_timeout
+        self.max_headers = max_headers
+        self.max_header_size = max_header_size
+        self.ssl_context = ssl_context
+        self.allowed_updates = frozenset(allowed_updates) if allowed_updates is not None else None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set[asyncio.Task] = set()
+        self._in_flight = 0
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._stopping = False
+        self.stats = {
+            'requests': 0,
+            'updates': 0,
+            'rejected_secret': 0,  # неверный секретный токен
+            'rejected_busy': 0,    # очередь переполнена (503)
+            'dropped': 0,          # тип обновления не из allowed_updates
+            'bad_requests': 0,
+        }
+
+    @property
+    def bound_port(self) -> int:
+        """Фактический порт (если при создании указан 0)"""
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self):
+        """Запуск сервера"""
+        self._stopping = False
+        self._server = await asyncio.start_server(
+            self._serve, self.listen, self.port, ssl=self.ssl_context,
+            limit=self.max_header_size  # длина одной строки запроса/заголовка
+        )
+        logger.info("Webhook-сервер слушает %s:%d%s", self.listen, self.bound_port, self.url_path)
+
+    async def stop(self, drain_timeout: float = 30.0):
+        """Остановка: новые соединения не принимаются, начатые запросы дочитываются"""
+        if self._server is None:
+            return
+        self._stopping = True
+        self._server.close()
+        try:
+            await asyncio.wait_for(self._drained.wait(), drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Webhook: %d запросов не завершились за %.0f с", self._in_flight, drain_timeout)
+        # Простаивающие keep-alive соединения закрываются
+        for task in list(self._connections):
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await self._server.wait_closed()
+        self._server = None
+        logger.info("Webhook-сервер остановлен, принято обновлений: %d", self.stats['updates'])
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while not self._stopping:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                self._begin_request()
+                try:
+                    keep_alive = await self._handle_request(request_line, reader, writer)
+                finally:
+                    self._end_request()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        except ValueError:
+            # Строка запроса длиннее max_header_size
+            self.stats['bad_requests'] += 1
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    def _begin_request(self):
+        self._in_flight += 1
+        self._drained.clear()
+
+    def _end_request(self):
+        self._in_flight -= 1
+        if not self._in_flight:
+            self._drained.set()
+
+    async def _handle_request(self, request_line: bytes, reader: asyncio.StreamReader,
+                              writer: asyncio.StreamWriter) -> bool:
+        """Чтение одного запроса и ответ на него; False - закрыть соединение"""
+        try:
+            method, target, version = request_line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+        except ValueError:
+            await self._respond(writer, 400, keep_alive=False)
+            return False
+        try:
+            headers = await asyncio.wait_for(self._read_headers(reader), self.request_timeout)
+        except asyncio.TimeoutError:
+            self.stats['bad_requests'] += 1
+            await self._respond(writer, 408, keep_alive=False)
+            return False
+        except ValueError:
+            headers = None
+        if headers is None:
+            self.stats['bad_requests'] += 1
+            await self._respond(writer, 431, keep_alive=False)
+            return False
+        keep_alive = (version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                      and not self._stopping)
+
+        if 'content-length' not in headers:
+            await self._respond(writer, 411, keep_alive=False)
+            return False
+        length = headers['content-length']
+        if not (length.isascii() and length.isdigit()):
+            self.stats['bad_requests'] += 1
+            await self._respond(writer, 400, keep_alive=False)
+            return False
+        length = int(length)
+        if length > self.max_body_size:
+            await self._respond(writer, 413, keep_alive=False)
+            return False
+        try:
+            body = await asyncio.wait_for(reader.readexactly(length), self.request_timeout)
+        except asyncio.TimeoutError:
+            self.stats['bad_requests'] += 1
+            await self._respond(writer, 408, keep_alive=False)
+            return False
+
+        self.stats['requests'] += 1
+        status = self._accept(method, target.split('?', 1)[0], headers, body)
+        await self._respond(writer, status, keep_alive)
+        return keep_alive
+
+    async def _read_headers(self, reader: asyncio.StreamReader) -> Optional[Dict[str, str]]:
+        """Заголовки запроса; None - больше max_headers строк или max_header_size байт"""
+        headers: Dict[str, str] = {}
+        count = size = 0
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                return headers
+            count += 1
+            size += len(line)
+            if count > self.max_headers or size > self.max_header_size:
+                return None
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    def _accept(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> int:
+        """Проверка запроса и постановка обновления в очередь; возвращает HTTP-статус"""
+        if path.rstrip('/') != self.url_path:
+            return 404
+        if method != 'POST':
+            return 405
+        if self.secret_token is not None:
+            received = headers.get(SECRET_TOKEN_HEADER, '')
+            if not hmac.compare_digest(received.encode(), self.secret_token.encode()):
+                self.stats['rejected_secret'] += 1
+                return 403
+        if self.application.update_queue.qsize() >= self.max_pending_updates:
+            self.stats['rejected_busy'] += 1
+            return 503
+        try:
+            data = json.loads(body)
+            if self.allowed_updates is not None and self.allowed_updates.isdisjoint(data):
+                self.stats['dropped'] += 1
+                return 200
+            update = Update.de_json(data, self.application.bot)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            self.stats['bad_requests'] += 1
+            logger.warning("Webhook: некорректное обновление: %s", e)
+            return 400
+        if update is None:
+            self.stats['bad_requests'] += 1
+            return 400
+        self.application.update_queue.put_nowait(update)
+        self.stats['updates'] += 1
+        return 200
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, keep_alive: bool):
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, 'OK')}\r\n"
+            f"Content-Length: 0\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1')
+        )
+        await writer.drain()
+
+
+def make_ssl_context(cert_path: Optional[str], key_path: Optional[str]) -> Optional[ssl.SSLContext]:
+    """TLS-контекст для приёма webhook напрямую (без обратного прокси)"""
+    if not cert_path:
+        return None
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert_path, key_path)
+    return context
+
+
+def webhook_address(base_url: str, url_path: str) -> str:
+    """Публичный адрес webhook: базовый URL + путь"""
+    return base_url.rstrip('/') + '/' + url_path.strip('/')
+